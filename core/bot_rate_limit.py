@@ -0,0 +1,159 @@
+# core/bot_rate_limit.py
+"""
+core/bot_rate_limit.py
+
+Ограничение исходящих запросов к Bot API (middleware сессии aiogram).
+- Общий лимит BOT_GLOBAL_RATE сообщений в секунду и лимиты на чат
+  (BOT_CHAT_RATE для личных чатов, BOT_GROUP_RATE в минуту для групп).
+- Ответы пользователям получают токены раньше массовой отправки файлов.
+- При 429 (TelegramRetryAfter) на retry_after секунд приостанавливаются
+  и чат, и общий лимит: Telegram ограничивает бота целиком, и отправка в
+  другие чаты продлила бы блокировку. Затем запрос повторяется.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendAnimation, SendAudio, SendDocument, SendMediaGroup, SendPhoto, SendVideo
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+BOT_GLOBAL_RATE = float(os.getenv("BOT_GLOBAL_RATE", "30"))  # Сообщений в секунду на бота
+BOT_CHAT_RATE = float(os.getenv("BOT_CHAT_RATE", "1"))  # Сообщений в секунду в личный чат
+BOT_GROUP_RATE = float(os.getenv("BOT_GROUP_RATE", "20"))  # Сообщений в минуту в группу
+BOT_RETRY_AFTER_ATTEMPTS = int(os.getenv("BOT_RETRY_AFTER_ATTEMPTS", "3"))
+CHAT_BUCKETS_LIMIT = 10000  # Сколько неактивных чатов хранить до очистки
+
+PRIORITY_USER = 0  # Ответы пользователям
+PRIORITY_BULK = 1  # Отправка файлов
+BULK_METHODS = (SendMediaGroup, SendDocument, SendPhoto, SendVideo, SendAnimation, SendAudio)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity в запасе."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, cost: float = 1) -> float:
+        """Сколько секунд ждать, пока в ведре наберётся cost токенов (0 — можно сейчас)."""
+        now = time.monotonic()
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < cost:
+            wait = max(wait, (cost - self.tokens) / self.rate)
+        return wait
+
+    def take(self, cost: float = 1):
+        """Списывает cost токенов; запрос дороже запаса уводит ведро в минус, и следующие ждут дольше."""
+        self.tokens -= cost
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу токенов (после 429 от Telegram)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    @property
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity and self.paused_until <= time.monotonic()
+
+
+class BotRateLimiter(BaseRequestMiddleware):
+    """Планировщик исходящих сообщений по ведрам токенов с приоритетами."""
+
+    def __init__(
+        self,
+        global_rate: float = BOT_GLOBAL_RATE,
+        chat_rate: float = BOT_CHAT_RATE,
+        group_rate: float = BOT_GROUP_RATE,
+    ):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.throttled = 0  # Запросов, которым пришлось ждать
+        self.retried = 0  # Повторов после 429
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: dict = {}
+        self._waiters: list = []  # Куча (приоритет, порядковый номер, стоимость, future)
+        self._counter = itertools.count()
+        self._drain_task: asyncio.Task | None = None
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= CHAT_BUCKETS_LIMIT:
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle}
+            is_group = isinstance(chat_id, str) or chat_id < 0  # Группы, каналы (@username)
+            rate = self.group_rate / 60 if is_group else self.chat_rate
+            bucket = TokenBucket(rate, max(1.0, rate))
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire_chat(self, chat_id, cost: float):
+        bucket = self._chat_bucket(chat_id)
+        while (wait := bucket.delay(cost)) > 0:
+            self.throttled += 1
+            await asyncio.sleep(wait)
+        bucket.take(cost)
+
+    async def _acquire_global(self, priority: int, cost: float):
+        if not self._waiters and self._global.delay(cost) == 0:
+            self._global.take(cost)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), cost, future))
+        self.throttled += 1
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain())
+        await future
+
+    async def _drain(self):
+        """Выдаёт общие токены ожидающим запросам в порядке приоритета."""
+        while self._waiters:
+            priority, _, cost, future = self._waiters[0]
+            if future.done():  # Запрос отменён
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._global.delay(cost)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(self._waiters)
+            self._global.take(cost)
+            future.set_result(None)
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)  # Служебные запросы не ограничиваются
+
+        priority = PRIORITY_BULK if isinstance(method, BULK_METHODS) else PRIORITY_USER
+        cost = len(method.media) if isinstance(method, SendMediaGroup) else 1
+
+        for attempt in range(BOT_RETRY_AFTER_ATTEMPTS + 1):
+            await self._acquire_chat(chat_id, cost)
+            await self._acquire_global(priority, cost)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == BOT_RETRY_AFTER_ATTEMPTS:
+                    raise
+                self.retried += 1
+                logger.warning(f"Telegram просит подождать {e.retry_after} с ({type(method).__name__}, чат {chat_id}).")
+                self._chat_bucket(chat_id).pause(e.retry_after)
+                self._global.pause(e.retry_after)
@@ -30,6 +30,9 @@ if not os.path.exists(CREDENTIALS_FILE):
     logger.error("Файл учетных данных Google API отсутствует!")
     raise ValueError("Файл учетных данных Google API обязателен для работы приложения.")
 
+# Учётные данные для Google Drive (по умолчанию — те же, что для таблиц)
+CREDENTIALS_FILE_DRIVE = os.getenv("CREDENTIALS_FILE_DRIVE", CREDENTIALS_FILE)
+
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 if not SPREADSHEET_ID:
     logger.error("Переменная окружения SPREADSHEET_ID не задана!")
@@ -0,0 +1,88 @@
+# core/drive_manifest.py
+"""
+core/drive_manifest.py
+
+Журнал выгрузки файлов в Google Drive (SQLite).
+- Папка Drive каждого клиента создаётся один раз и запоминается.
+- Для каждого выгруженного файла хранятся размер, время изменения, SHA-256
+  и ID в Drive, поэтому после сбоя выгрузка продолжается с недостающих файлов.
+"""
+
+import threading
+import time
+from core.utils.db_utils import DEFAULT_DB_PATH, open_database
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class DriveSyncManifest:
+    """Сведения о папках и файлах, уже выгруженных в Google Drive."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self._lock = threading.Lock()
+        self._connection = open_database(db_path)
+        with self._lock:
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS drive_folders (
+                    client_id TEXT PRIMARY KEY,
+                    folder_id TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS drive_files (
+                    client_id TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    drive_id TEXT NOT NULL,
+                    uploaded_at REAL NOT NULL,
+                    PRIMARY KEY (client_id, path)
+                );
+                """
+            )
+
+    def folder_id(self, client_id: str) -> str | None:
+        """ID папки клиента в Drive или None, если она ещё не создавалась."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT folder_id FROM drive_folders WHERE client_id = ?", (str(client_id),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_folder(self, client_id: str, folder_id: str):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO drive_folders (client_id, folder_id, created_at) VALUES (?, ?, ?)",
+                (str(client_id), folder_id, time.time()),
+            )
+
+    def get_file(self, client_id: str, path: str) -> dict | None:
+        """Запись о выгруженном файле: size, mtime, sha256, drive_id — или None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime, sha256, drive_id FROM drive_files WHERE client_id = ? AND path = ?",
+                (str(client_id), path),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("size", "mtime", "sha256", "drive_id"), row))
+
+    def record_file(self, client_id: str, path: str, size: int, mtime: float, sha256: str, drive_id: str):
+        """Отмечает файл как выгруженный (или обновляет время изменения неизменённого файла)."""
+        with self._lock:
+            self._connection.execute(
+                """
+                INSERT INTO drive_files (client_id, path, size, mtime, sha256, drive_id, uploaded_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(client_id, path) DO UPDATE SET
+                    size = excluded.size, mtime = excluded.mtime, sha256 = excluded.sha256,
+                    drive_id = excluded.drive_id, uploaded_at = excluded.uploaded_at
+                """,
+                (str(client_id), path, size, mtime, sha256, drive_id, time.time()),
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
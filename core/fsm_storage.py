@@ -0,0 +1,177 @@
+# core/fsm_storage.py
+"""
+core/fsm_storage.py
+
+Постоянное хранилище состояний FSM.
+- SQLiteStorage: состояние и данные диалога в SQLite (WAL) с TTL на ключ.
+  Несколько процессов на одном хосте используют один файл базы, блокировки
+  выполняет сам SQLite.
+- RedisStorage из aiogram — по FSM_STORAGE=redis (нужен пакет redis).
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from core.utils.db_utils import DEFAULT_DB_PATH, open_database, transaction
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(7 * 24 * 60 * 60)))  # Секунды; 0 — без срока
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+PURGE_EVERY_WRITES = 1000  # Удаление просроченных записей раз в N записей
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в SQLite; запросы выполняются в отдельном потоке."""
+
+    def __init__(
+        self,
+        db_path: str = DEFAULT_DB_PATH,
+        state_ttl: int = FSM_STATE_TTL,
+        key_builder: KeyBuilder | None = None,
+    ):
+        self.state_ttl = state_ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._connection = open_database(db_path)
+        with self._lock:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS fsm_records (
+                    key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT NOT NULL DEFAULT '{}',
+                    expires_at REAL
+                )
+                """
+            )
+        self._purge_expired()
+
+    def _expires_at(self) -> float | None:
+        return time.time() + self.state_ttl if self.state_ttl else None
+
+    def _purge_expired(self):
+        with self._lock:
+            deleted = self._connection.execute(
+                "DELETE FROM fsm_records WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            ).rowcount
+        if deleted:
+            logger.info(f"Удалено просроченных состояний FSM: {deleted}.")
+
+    def _after_write(self):
+        self._writes += 1
+        if self._writes % PURGE_EVERY_WRITES == 0:
+            self._purge_expired()
+
+    def _read(self, key: str) -> tuple[Optional[str], Dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT state, data FROM fsm_records WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None, {}
+        return row[0], json.loads(row[1])
+
+    def _write_state(self, key: str, state: Optional[str]):
+        with self._lock:
+            self._connection.execute(
+                """
+                INSERT INTO fsm_records (key, state, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    state = excluded.state,
+                    data = CASE WHEN fsm_records.expires_at <= ? THEN '{}' ELSE fsm_records.data END,
+                    expires_at = excluded.expires_at
+                """,
+                (key, state, self._expires_at(), time.time()),
+            )
+        self._after_write()
+
+    def _write_data(self, key: str, data: Dict[str, Any]):
+        with self._lock:
+            self._connection.execute(
+                """
+                INSERT INTO fsm_records (key, data, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    state = CASE WHEN fsm_records.expires_at <= ? THEN NULL ELSE fsm_records.state END,
+                    data = excluded.data,
+                    expires_at = excluded.expires_at
+                """,
+                (key, json.dumps(data, ensure_ascii=False), self._expires_at(), time.time()),
+            )
+        self._after_write()
+
+    def _merge_data(self, key: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Читает и обновляет данные в одной транзакции, чтобы процессы не затирали друг друга."""
+        now = time.time()
+        with self._lock, transaction(self._connection) as db:
+            row = db.execute(
+                "SELECT state, data FROM fsm_records WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now),
+            ).fetchone()
+            state, current = (row[0], json.loads(row[1])) if row else (None, {})
+            current.update(data)
+            db.execute(
+                """
+                INSERT INTO fsm_records (key, state, data, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    state = excluded.state, data = excluded.data, expires_at = excluded.expires_at
+                """,
+                (key, state, json.dumps(current, ensure_ascii=False), self._expires_at()),
+            )
+        self._after_write()
+        return current
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        await asyncio.to_thread(self._write_state, self.key_builder.build(key), state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await asyncio.to_thread(self._read, self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._write_data, self.key_builder.build(key), data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await asyncio.to_thread(self._read, self.key_builder.build(key))
+        return data
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        current = await asyncio.to_thread(self._merge_data, self.key_builder.build(key), data)
+        return current.copy()
+
+    async def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Создаёт хранилище FSM, выбранное переменной окружения FSM_STORAGE."""
+    if FSM_STORAGE == "sqlite":
+        logger.info("Хранилище FSM: SQLite.")
+        return SQLiteStorage()
+
+    if FSM_STORAGE == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            raise ValueError("Для FSM_STORAGE=redis необходимо установить пакет redis.")
+        logger.info("Хранилище FSM: Redis.")
+        ttl = FSM_STATE_TTL or None
+        return RedisStorage.from_url(REDIS_URL, state_ttl=ttl, data_ttl=ttl)
+
+    if FSM_STORAGE == "memory":
+        from aiogram.fsm.storage.memory import MemoryStorage
+        logger.warning("Хранилище FSM: память процесса, состояния теряются при перезапуске.")
+        return MemoryStorage()
+
+    raise ValueError(f"Неизвестное хранилище FSM: {FSM_STORAGE}")
@@ -1,26 +1,198 @@
 # core.google_drive.py
+"""
+core/google_drive.py
+
+Выгрузка файлов заявок в Google Drive.
+- Документ discovery Drive API загружается один раз на процесс.
+- Клиенты и их файлы загружаются параллельно: не более DRIVE_UPLOAD_CONCURRENCY
+  файлов всего и DRIVE_CLIENT_CONCURRENCY файлов одного клиента одновременно.
+- Небольшие файлы отправляются одним multipart-запросом, крупные — по частям
+  через resumable upload, без чтения файла в память целиком.
+- Журнал выгрузки (DriveSyncManifest) исключает повторное создание папок и
+  повторную выгрузку файлов; изменившийся файл обновляется на месте
+  (files.update), а не выгружается копией. Выгрузка выполняется фоновой задачей бота.
+- При FILE_PIPELINE=drive файлы пользователей передаются из Bot API прямо
+  в resumable upload Drive, минуя локальный диск; в заявке они хранятся как
+  'drive:<ID файла>'. Передача, которую заявка не дождалась, отменяется, а
+  успевший появиться файл удаляется из Drive.
+"""
+
 import os
-import json
+import time
 import asyncio
+import hashlib
+from typing import AsyncIterator, Callable
+import aiofiles
+from aiogram import Bot, types
 from aiogoogle import Aiogoogle
-from aiogoogle.auth.creds import ServiceAccountCreds
+from aiogoogle.excs import HTTPError
+from aiogoogle.models import Request
 from core.config import CREDENTIALS_FILE_DRIVE, GOOGLE_API_SCOPE
-from core.google_sheets import get_google_sheet
+from core.drive_manifest import DriveSyncManifest
+from core.http_pool import get_google_client
+from core.google_sheets import get_sheet_index, get_sheet_writer
+from core.sheet_quota import PRIORITY_SYNC, sheets_priority
+from core.sheet_schema import RETAIL_SCHEMA
+from core.utils.file_utils import get_file_destination, read_order_file_names, track_download
+from core.utils.google_utils import handle_google_api_error, is_retryable_error
 from core.utils.logging_utils import setup_logger
 
 logger = setup_logger(__name__)
 
-async def get_authenticated_client():
-    """Аутентификация в Google API через aiogoogle."""
-    with open(CREDENTIALS_FILE_DRIVE, "r", encoding="utf-8") as f:
-        credentials_data = json.load(f)
-    
-    creds = ServiceAccountCreds(scopes=GOOGLE_API_SCOPE, **credentials_data)
-    return Aiogoogle(service_account_creds=creds)
+DRIVE_PARENT_FOLDER_ID = os.getenv("DRIVE_PARENT_FOLDER_ID", "1nCoOjylySTUeu9_wuBHkL6wkJ4ziDtKy")
+DRIVE_UPLOAD_CONCURRENCY = int(os.getenv("DRIVE_UPLOAD_CONCURRENCY", "8"))  # Файлов одновременно, всего
+DRIVE_CLIENT_CONCURRENCY = int(os.getenv("DRIVE_CLIENT_CONCURRENCY", "3"))  # Файлов одновременно, на клиента
+RESUMABLE_CHUNK_ALIGN = 256 * 1024  # Части resumable upload должны быть кратны 256 КБ
+DRIVE_CHUNK_SIZE = max(
+    RESUMABLE_CHUNK_ALIGN,
+    int(os.getenv("DRIVE_CHUNK_SIZE", str(8 * 1024 * 1024))) // RESUMABLE_CHUNK_ALIGN * RESUMABLE_CHUNK_ALIGN,
+)
+PROGRESS_LOG_INTERVAL = 10  # Секунды между сообщениями о ходе выгрузки
+DRIVE_SYNC_INTERVAL = int(os.getenv("DRIVE_SYNC_INTERVAL", "600"))  # Секунды между выгрузками; 0 — не запускать
+
+DRIVE_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+DRIVE_FILE_PREFIX = "drive:"  # Файл заявки, хранящийся только в Google Drive
+TELEGRAM_DOWNLOAD_TIMEOUT = 300  # Секунды на чтение файла из Bot API
+
+_stream_semaphore = asyncio.Semaphore(DRIVE_UPLOAD_CONCURRENCY)
+
+_drive_service = None
+_drive_service_lock = asyncio.Lock()
+_drive_manifest: DriveSyncManifest | None = None
+_drive_sync_lock = asyncio.Lock()
+_drive_sync_task: asyncio.Task | None = None
+_stream_cleanups: set[asyncio.Task] = set()  # Удаление файлов отменённых передач
+
+
+async def get_authenticated_client() -> Aiogoogle:
+    """Клиент Google API для Drive: общий пул соединений и кэш токена (core.http_pool)."""
+    return get_google_client(CREDENTIALS_FILE_DRIVE, GOOGLE_API_SCOPE)
+
+async def get_drive_service(client: Aiogoogle):
+    """Возвращает описание Drive API v3, загружая документ discovery один раз."""
+    global _drive_service
+    if _drive_service is None:
+        async with _drive_service_lock:
+            if _drive_service is None:
+                _drive_service = await client.discover("drive", "v3")
+    return _drive_service
+
+def get_drive_manifest() -> DriveSyncManifest:
+    """Возвращает журнал выгрузки, открывая базу при первом обращении."""
+    global _drive_manifest
+    if _drive_manifest is None:
+        _drive_manifest = DriveSyncManifest()
+    return _drive_manifest
+
+def file_sha256(file_path: str) -> str:
+    """Считает SHA-256 файла, читая его частями."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(DRIVE_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_pending_files(manifest: DriveSyncManifest, client_id: str, file_paths: list[str]) -> list[tuple]:
+    """
+    Отбирает файлы, которых ещё нет в Drive или которые изменились после выгрузки.
+
+    Хэш считается только для новых файлов и файлов с изменившимся временем изменения.
+
+    Returns:
+        list[tuple]: (путь, размер, время изменения, SHA-256, ID файла в Drive) файлов для выгрузки;
+            ID есть у изменившихся файлов, выгруженных раньше, и None у новых.
+    """
+    pending = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        uploaded = manifest.get_file(client_id, file_path)
+        if uploaded and uploaded["size"] == stat.st_size and uploaded["mtime"] == stat.st_mtime:
+            continue
+
+        sha256 = file_sha256(file_path)
+        if uploaded and uploaded["size"] == stat.st_size and uploaded["sha256"] == sha256:
+            # Содержимое не изменилось: запоминаем новое время изменения
+            manifest.record_file(client_id, file_path, stat.st_size, stat.st_mtime, sha256, uploaded["drive_id"])
+            continue
+        pending.append((file_path, stat.st_size, stat.st_mtime, sha256, uploaded["drive_id"] if uploaded else None))
+    return pending
+
+
+class UploadProgress:
+    """Счётчик выгруженных файлов и байт с периодическим выводом в лог."""
+
+    def __init__(self, total_files: int, total_bytes: int):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files = 0
+        self.bytes = 0
+        self._logged_at = time.monotonic()
+
+    def add_bytes(self, count: int):
+        self.bytes += count
+        self._maybe_log()
+
+    def add_file(self):
+        self.files += 1
+        self._maybe_log(force=self.files == self.total_files)
+
+    def _maybe_log(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._logged_at < PROGRESS_LOG_INTERVAL:
+            return
+        self._logged_at = now
+        logger.info(
+            f"Выгрузка в Google Drive: файлов {self.files}/{self.total_files}, "
+            f"{self.bytes / 2**20:.1f}/{self.total_bytes / 2**20:.1f} МБ."
+        )
+
+
+def _quote_query(value: str) -> str:
+    """Строка для запроса files.list: кавычки и обратная косая черта экранируются."""
+    return "'{}'".format(value.replace("\\", "\\\\").replace("'", "\\'"))
 
+@handle_google_api_error(api="drive")
+async def _find_drive_file(client: Aiogoogle, query: str) -> str | None:
+    drive_service = await get_drive_service(client)
+    response = await client.as_service_account(
+        drive_service.files.list(q=f"{query} and trashed = false", fields="files(id)", pageSize=1)
+    )
+    files = response.get("files", [])
+    return files[0]["id"] if files else None
+
+async def find_drive_folder(client: Aiogoogle, folder_name: str, parent_id: str) -> str | None:
+    """Ищет папку с таким именем в родительской папке."""
+    return await _find_drive_file(
+        client,
+        f"name = {_quote_query(folder_name)} and {_quote_query(parent_id)} in parents"
+        " and mimeType = 'application/vnd.google-apps.folder'",
+    )
+
+async def find_uploaded_file(client: Aiogoogle, folder_id: str, sha256: str) -> str | None:
+    """Ищет в папке файл, выгруженный с таким SHA-256 (appProperties.sha256)."""
+    return await _find_drive_file(
+        client,
+        f"{_quote_query(folder_id)} in parents and appProperties has {{ key='sha256' and value={_quote_query(sha256)} }}",
+    )
+
+async def find_streamed_file(client: Aiogoogle, folder_id: str, file_unique_id: str) -> str | None:
+    """Ищет в папке файл, переданный из Telegram (appProperties.telegram_file)."""
+    return await _find_drive_file(
+        client,
+        f"{_quote_query(folder_id)} in parents"
+        f" and appProperties has {{ key='telegram_file' and value={_quote_query(file_unique_id)} }}",
+    )
+
+@handle_google_api_error(api="drive")
+async def delete_drive_file(client: Aiogoogle, file_id: str):
+    """Удаляет файл из Google Drive."""
+    drive_service = await get_drive_service(client)
+    await client.as_service_account(drive_service.files.delete(fileId=file_id))
+
+@handle_google_api_error(api="drive", idempotent=False)
 async def create_drive_folder(client: Aiogoogle, folder_name: str, parent_id: str) -> str:
-    """Создаёт папку в Google Drive."""
-    drive_service = await client.discover("drive", "v3")
+    """Создаёт папку в Google Drive. После таймаута не повторяется: папка могла быть создана."""
+    drive_service = await get_drive_service(client)
     response = await client.as_service_account(
         drive_service.files.create(
             json={"name": folder_name, "mimeType": "application/vnd.google-apps.folder", "parents": [parent_id]},
@@ -29,52 +201,391 @@ async def create_drive_folder(client: Aiogoogle, folder_name: str, parent_id: st
     )
     return response["id"]
 
-async def upload_file(client: Aiogoogle, file_path: str, folder_id: str) -> str:
-    """Загружает файл в Google Drive."""
-    drive_service = await client.discover("drive", "v3")
-    metadata = {"name": os.path.basename(file_path), "parents": [folder_id]}
-    
-    with open(file_path, "rb") as f:
-        file_content = f.read()
-    
+async def iter_file_chunks(file_path: str, chunk_size: int = DRIVE_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Читает файл частями заданного размера."""
+    async with aiofiles.open(file_path, "rb") as f:
+        while chunk := await f.read(chunk_size):
+            yield chunk
+
+@handle_google_api_error(api="drive")
+async def _start_upload_session(client: Aiogoogle, metadata: dict, size: int | None, file_id: str | None = None) -> str:
+    headers = {"X-Upload-Content-Length": str(size)} if size is not None else {}
+    # С file_id сессия заменяет содержимое существующего файла
+    response = await client.as_service_account(
+        Request(
+            method="PATCH" if file_id else "POST",
+            url=f"{DRIVE_UPLOAD_URL}{'/' + file_id if file_id else ''}?uploadType=resumable&fields=id",
+            json=metadata,
+            headers=headers,
+        ),
+        full_res=True,
+    )
+    return response.headers["Location"]
+
+async def _put_chunk(client: Aiogoogle, session_url: str, offset: int, chunk: bytes, total: int | None):
+    """
+    Отправляет часть файла. Повторы и автомат защиты — общие (handle_google_api_error).
+
+    Прошлая попытка могла быть принята частично, поэтому повтор не отправляет
+    часть заново, а узнаёт у Drive, сколько байт уже сохранено: upload_resumable
+    продолжит с этого места.
+    """
+    total_text = str(total) if total is not None else "*"
+    content_range = f"bytes {offset}-{offset + len(chunk) - 1}/{total_text}" if chunk else f"bytes */{total_text}"
+    sent = False
+
+    @handle_google_api_error(api="drive")
+    async def send():
+        nonlocal sent
+        if sent:
+            request = Request(method="PUT", url=session_url, headers={"Content-Range": f"bytes */{total_text}"})
+        else:
+            sent = True
+            request = Request(method="PUT", url=session_url, data=chunk, headers={"Content-Range": content_range})
+        return await client.as_service_account(request, full_res=True)
+
+    return await send()
+
+async def upload_resumable(
+    client: Aiogoogle,
+    metadata: dict,
+    chunks: AsyncIterator[bytes],
+    size: int | None = None,
+    on_progress: Callable[[int], None] | None = None,
+    file_id: str | None = None,
+) -> str:
+    """
+    Загружает данные в Google Drive по протоколу resumable upload.
+
+    В памяти хранится не больше одной части (DRIVE_CHUNK_SIZE) данных.
+
+    Args:
+        client (Aiogoogle): Клиент Google API.
+        metadata (dict): Метаданные файла Drive (name, parents, ...).
+        chunks (AsyncIterator[bytes]): Источник данных произвольными частями.
+        size (int | None): Размер файла, если известен заранее.
+        on_progress (Callable[[int], None] | None): Вызывается с числом принятых байт.
+        file_id (str | None): Заменить содержимое этого файла вместо создания нового.
+
+    Returns:
+        str: ID созданного или обновлённого файла.
+    """
+    session_url = await _start_upload_session(client, metadata, size, file_id)
+    iterator = chunks.__aiter__()
+    buffer = bytearray()
+    offset = 0
+    exhausted = False
+
+    while True:
+        while not exhausted and len(buffer) < DRIVE_CHUNK_SIZE:
+            try:
+                buffer += await iterator.__anext__()
+            except StopAsyncIteration:
+                exhausted = True
+
+        if exhausted:
+            chunk, total = bytes(buffer), offset + len(buffer)
+        else:
+            chunk, total = bytes(buffer[:DRIVE_CHUNK_SIZE]), size
+
+        response = await _put_chunk(client, session_url, offset, chunk, total)
+        if response.status_code in (200, 201):
+            if on_progress:
+                on_progress(len(buffer))
+            return response.json["id"]
+
+        # 308: Drive сообщает в заголовке Range, сколько байт уже сохранено
+        received = response.headers.get("Range")
+        committed = int(received.rsplit("-", 1)[1]) + 1 if received else 0
+        accepted = max(0, committed - offset)
+        del buffer[:accepted]
+        offset += accepted
+        if on_progress and accepted:
+            on_progress(accepted)
+
+async def upload_file(
+    client: Aiogoogle,
+    file_path: str,
+    folder_id: str,
+    file_name: str = None,
+    on_progress: Callable[[int], None] | None = None,
+    sha256: str | None = None,
+    file_id: str | None = None,
+) -> str:
+    """
+    Загружает файл в Google Drive (под исходным именем, если оно известно).
+
+    SHA-256 файла сохраняется в appProperties: если ответ на запрос создания
+    не дошёл, файл ищется по нему, и повтор не создаёт копию.
+
+    Если файл уже выгружался (file_id), его содержимое заменяется на месте:
+    ссылка на файл не меняется, копия не создаётся. Файл, удалённый из Drive
+    вручную, выгружается заново.
+    """
+    metadata = {"name": file_name or os.path.basename(file_path)}
+    if sha256:
+        metadata["appProperties"] = {"sha256": sha256}
+    size = os.path.getsize(file_path)
+
+    if file_id is not None:
+        try:
+            if size > DRIVE_CHUNK_SIZE:
+                return await upload_resumable(client, metadata, iter_file_chunks(file_path), size, on_progress, file_id)
+            file_id = await _update_multipart(client, file_id, metadata, file_path)
+            if on_progress:
+                on_progress(size)
+            return file_id
+        except HTTPError as e:
+            if getattr(e.res, "status_code", None) != 404:
+                raise
+            logger.warning(f"Файл {file_id} не найден в Drive, {file_path} выгружается заново.")
+
+    metadata["parents"] = [folder_id]
+
+    if size > DRIVE_CHUNK_SIZE:
+        return await upload_resumable(client, metadata, iter_file_chunks(file_path), size, on_progress)
+
+    try:
+        file_id = await _upload_multipart(client, metadata, file_path)
+    except Exception as e:
+        if not sha256 or not is_retryable_error(e):
+            raise
+        file_id = await find_uploaded_file(client, folder_id, sha256)
+        if file_id is None:
+            logger.warning(f"Файл {file_path} не найден в Drive после сбоя ({e}), выгружаем повторно.")
+            file_id = await _upload_multipart(client, metadata, file_path)
+    if on_progress:
+        on_progress(size)
+    return file_id
+
+@handle_google_api_error(api="drive", idempotent=False)
+async def _upload_multipart(client: Aiogoogle, metadata: dict, file_path: str) -> str:
+    # Небольшой файл — один multipart-запрос, содержимое читается с диска потоком
+    drive_service = await get_drive_service(client)
     response = await client.as_service_account(
         drive_service.files.create(
             json=metadata,
-            media_body=file_content,
+            upload_file=file_path,
+            fields="id"
+        )
+    )
+    return response["id"]
+
+@handle_google_api_error(api="drive")
+async def _update_multipart(client: Aiogoogle, file_id: str, metadata: dict, file_path: str) -> str:
+    # Замена содержимого идемпотентна: повтор после таймаута запишет то же самое
+    drive_service = await get_drive_service(client)
+    response = await client.as_service_account(
+        drive_service.files.update(
+            fileId=file_id,
+            json=metadata,
+            upload_file=file_path,
             fields="id"
         )
     )
     return response["id"]
 
-async def upload_all_new_clients():
-    """Загружает файлы всех клиентов со статусом 'Новый' в Google Drive."""
-    sheet = await get_google_sheet("Розничные клиенты")
-    data = await sheet.get_all_values()
-    headers, *rows = data
-    status_index = headers.index("Статус")
-    id_index = headers.index("ID")
-    
-    async with await get_authenticated_client() as client:
-        parent_folder_id = "1nCoOjylySTUeu9_wuBHkL6wkJ4ziDtKy"
-        
-        for row in rows:
-            if row[status_index] == "Новый":
-                client_id = row[id_index]
-                client_folder = os.path.join("uploads", str(client_id))
-                
-                if os.path.exists(client_folder):
-                    folder_id = await create_drive_folder(client, str(client_id), parent_folder_id)
-                    
-                    for file_name in os.listdir(client_folder):
-                        file_path = os.path.join(client_folder, file_name)
-                        if os.path.isfile(file_path):
-                            await upload_file(client, file_path, folder_id)
-                    
-                    row_num = rows.index(row) + 2
-                    await sheet.update(f"{chr(65 + status_index)}{row_num}", [["Загружено в Google Drive"]])
-                    logger.info(f"Файлы клиента {client_id} загружены.")
-                else:
-                    logger.warning(f"Папка клиента {client_id} не найдена.")
-
-if __name__ == "__main__":
-    asyncio.run(upload_all_new_clients())
+def get_drive_file_url(entry: str) -> str:
+    """Ссылка для просмотра файла заявки 'drive:<ID>' в Google Drive."""
+    return f"https://drive.google.com/file/d/{entry[len(DRIVE_FILE_PREFIX):]}/view"
+
+async def stream_telegram_file(bot: Bot, user_id: int, file_id: str, file_unique_id: str, file_name: str, size: int | None) -> str:
+    """
+    Передаёт файл из Bot API в папку клиента в Google Drive, не сохраняя его на диск.
+
+    Повторно отправленный файл (тот же file_unique_id) не загружается второй раз.
+
+    Returns:
+        str: Файл заявки в виде 'drive:<ID файла>'.
+    """
+    manifest = get_drive_manifest()
+    source = f"telegram:{file_unique_id}"
+    uploaded = manifest.get_file(user_id, source)
+    if uploaded is not None:
+        return f"{DRIVE_FILE_PREFIX}{uploaded['drive_id']}"
+
+    async with _stream_semaphore:
+        file_info = await bot.get_file(file_id)
+        stream = bot.session.stream_content(
+            url=bot.session.api.file_url(bot.token, file_info.file_path),
+            timeout=TELEGRAM_DOWNLOAD_TIMEOUT,
+            chunk_size=RESUMABLE_CHUNK_ALIGN,
+        )
+        digest = hashlib.sha256()
+
+        async def hashed(chunks):
+            async for chunk in chunks:
+                digest.update(chunk)
+                yield chunk
+
+        client = await get_authenticated_client()
+        folder_id = await get_client_folder(client, manifest, user_id)
+        metadata = {"name": file_name, "parents": [folder_id], "appProperties": {"telegram_file": file_unique_id}}
+        try:
+            drive_id = await upload_resumable(client, metadata, hashed(stream), size or file_info.file_size)
+        except asyncio.CancelledError:
+            # Заявка оформлена без файла; последняя часть могла успеть дойти до Drive
+            cleanup = asyncio.create_task(_delete_abandoned_stream(client, manifest, user_id, folder_id, file_unique_id))
+            _stream_cleanups.add(cleanup)
+            cleanup.add_done_callback(_stream_cleanups.discard)
+            raise
+
+    manifest.record_file(user_id, source, size or file_info.file_size or 0, 0, digest.hexdigest(), drive_id)
+    logger.info(f"Файл {file_name} пользователя {user_id} передан в Google Drive: {drive_id}.")
+    return f"{DRIVE_FILE_PREFIX}{drive_id}"
+
+async def _delete_abandoned_stream(client: Aiogoogle, manifest: DriveSyncManifest, user_id: int, folder_id: str, file_unique_id: str):
+    """Удаляет файл отменённой передачи, если он всё же создан и не используется другой заявкой."""
+    try:
+        drive_id = await find_streamed_file(client, folder_id, file_unique_id)
+        uploaded = manifest.get_file(user_id, f"telegram:{file_unique_id}")
+        if drive_id is None or (uploaded is not None and uploaded["drive_id"] == drive_id):
+            return
+        await delete_drive_file(client, drive_id)
+        logger.info(f"Удалён файл {drive_id} отменённой передачи пользователя {user_id}.")
+    except Exception as e:
+        logger.error(f"Не удалось удалить файл отменённой передачи пользователя {user_id}: {e}")
+
+def start_drive_stream(message: types.Message, bot: Bot) -> tuple[str, str, asyncio.Task]:
+    """
+    Запускает передачу файла из сообщения в Google Drive и регистрирует её за пользователем.
+
+    Returns:
+        tuple[str, str, asyncio.Task]: Ключ файла в данных FSM, исходное имя файла и задача;
+            результат задачи — 'drive:<ID файла>'.
+    """
+    file, _, file_name = get_file_destination(message)
+    user_id = message.from_user.id
+    key = f"telegram:{file.file_unique_id}"
+    task = asyncio.create_task(
+        stream_telegram_file(bot, user_id, file.file_id, file.file_unique_id, file_name, file.file_size)
+    )
+    track_download(user_id, key, task, cancel_on_timeout=True)
+    return key, file_name, task
+
+async def get_client_folder(client: Aiogoogle, manifest: DriveSyncManifest, client_id: str) -> str:
+    """Возвращает папку клиента в Drive, создавая её только при первой выгрузке."""
+    folder_id = manifest.folder_id(client_id)
+    if folder_id is None:
+        # Папка могла остаться от запроса создания, ответ на который не дошёл
+        folder_id = await find_drive_folder(client, str(client_id), DRIVE_PARENT_FOLDER_ID)
+        if folder_id is None:
+            folder_id = await create_drive_folder(client, str(client_id), DRIVE_PARENT_FOLDER_ID)
+        manifest.set_folder(client_id, folder_id)
+    return folder_id
+
+async def upload_client_files(
+    client: Aiogoogle,
+    manifest: DriveSyncManifest,
+    client_id: str,
+    pending_files: list[tuple],
+    file_names: dict,
+    limit: asyncio.Semaphore,
+    progress: UploadProgress,
+):
+    """Параллельно загружает новые и обновляет изменившиеся файлы клиента и отмечает их в журнале."""
+    if not pending_files:
+        return
+    folder_id = await get_client_folder(client, manifest, client_id)
+    client_limit = asyncio.Semaphore(DRIVE_CLIENT_CONCURRENCY)
+
+    async def upload_one(file_path: str, size: int, mtime: float, sha256: str, drive_id: str | None):
+        async with client_limit, limit:
+            drive_id = await upload_file(
+                client, file_path, folder_id, file_names.get(file_path), progress.add_bytes, sha256, drive_id
+            )
+            manifest.record_file(client_id, file_path, size, mtime, sha256, drive_id)
+            progress.add_file()
+
+    await asyncio.gather(*(upload_one(*pending) for pending in pending_files))
+
+async def upload_all_new_clients() -> int:
+    """
+    Загружает файлы всех клиентов со статусом 'Новый' в Google Drive.
+
+    Уже выгруженные файлы пропускаются, поэтому прерванная выгрузка
+    продолжается с того места, где остановилась.
+
+    Returns:
+        int: Количество клиентов, чьи файлы загружены.
+    """
+    async with _drive_sync_lock:
+        rows = await get_sheet_index(RETAIL_SCHEMA.name).items()  # Из локальной копии листа
+        writer = get_sheet_writer(RETAIL_SCHEMA.name)
+        manifest = get_drive_manifest()
+
+        orders = []
+        for row_num, row in rows:
+            if RETAIL_SCHEMA.value(row, "Статус") != "Новый":
+                continue
+            client_id = RETAIL_SCHEMA.value(row, "ID")
+            # Файлы заявки берутся из строки листа, имена — из манифеста заявки;
+            # файлы 'drive:<ID>' уже находятся в Drive
+            entries = [entry.strip() for entry in RETAIL_SCHEMA.value(row, "Файлы").split(",") if entry.strip()]
+            file_paths = [entry for entry in entries if os.path.isfile(entry)]
+            in_drive = [entry for entry in entries if entry.startswith(DRIVE_FILE_PREFIX)]
+            if not file_paths and not in_drive:
+                logger.warning(f"Файлы клиента {client_id} не найдены.")
+                continue
+            pending_files = await asyncio.to_thread(get_pending_files, manifest, client_id, file_paths)
+            file_names = read_order_file_names(client_id, RETAIL_SCHEMA.value(row, "Дата"))
+            orders.append((row_num, client_id, pending_files, file_names))
+
+        if not orders:
+            return 0
+
+        progress = UploadProgress(
+            total_files=sum(len(pending_files) for _, _, pending_files, _ in orders),
+            total_bytes=sum(size for _, _, pending_files, _ in orders for _, size, *_ in pending_files),
+        )
+        limit = asyncio.Semaphore(DRIVE_UPLOAD_CONCURRENCY)
+
+        client = await get_authenticated_client()
+        results = await asyncio.gather(
+            *(
+                upload_client_files(client, manifest, client_id, pending_files, file_names, limit, progress)
+                for _, client_id, pending_files, file_names in orders
+            ),
+            return_exceptions=True,
+        )
+
+        status_updates = []
+        for (row_num, client_id, _, _), result in zip(orders, results):
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка загрузки файлов клиента {client_id}: {result}")
+                continue
+            status_updates.append(writer.update(RETAIL_SCHEMA.cell("Статус", row_num), "Загружено в Google Drive"))
+            logger.info(f"Файлы клиента {client_id} загружены.")
+
+        # Статусы записываются пачками через писателя листа
+        await asyncio.gather(*status_updates)
+        return len(status_updates)
+
+async def _drive_sync_loop():
+    while True:
+        try:
+            with sheets_priority(PRIORITY_SYNC):
+                await upload_all_new_clients()
+        except Exception as e:
+            logger.error(f"Ошибка выгрузки файлов в Google Drive: {e}", exc_info=True)
+        await asyncio.sleep(DRIVE_SYNC_INTERVAL)
+
+def start_drive_sync():
+    """Запускает периодическую выгрузку файлов в Google Drive (если DRIVE_SYNC_INTERVAL > 0)."""
+    global _drive_sync_task
+    if _drive_sync_task is None and DRIVE_SYNC_INTERVAL > 0:
+        _drive_sync_task = asyncio.create_task(_drive_sync_loop())
+
+async def stop_drive_sync():
+    """Останавливает выгрузку и закрывает журнал выгрузки."""
+    global _drive_sync_task, _drive_manifest
+    if _drive_sync_task is not None:
+        _drive_sync_task.cancel()
+        try:
+            await _drive_sync_task
+        except asyncio.CancelledError:
+            pass
+        _drive_sync_task = None
+    if _drive_manifest is not None:
+        _drive_manifest.close()
+        _drive_manifest = None
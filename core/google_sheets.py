@@ -3,96 +3,317 @@
 core/google_sheets.py
 
 Модуль для взаимодействия с Google Sheets.
-- Подключение к Google Sheets.
+- Подключение к Google Sheets через асинхронный клиент Sheets API v4 (core.sheets_client).
 - Получение или создание листа.
-- Инициализация структуры заголовков листа.
+- Инициализация структуры заголовков листа (с проверкой не чаще раза в TTL).
+- Кэш открытых листов и фоновое обновление токенов доступа Google.
+- Пакетная запись через единственного писателя на лист.
+- Поиск заявок по ID клиента через индекс строк и локальную копию листов.
+- Квота Sheets API распределяется по приоритетам, одинаковые чтения объединяются.
 """
 
 import asyncio
-from gspread_asyncio import AsyncioGspreadClientManager, AsyncioGspreadSpreadsheet, AsyncioGspreadWorksheet
+import os
+import time
+from datetime import timedelta
+from aiogoogle.excs import HTTPError
 from core.config import CREDENTIALS_FILE, GOOGLE_API_SCOPE, SPREADSHEET_ID
 from core.utils.logging_utils import setup_logger
-from core.utils.google_utils import handle_google_api_error
-from oauth2client.service_account import ServiceAccountCredentials
+from core.utils.google_utils import handle_google_api_error, is_retryable_error
+from core.sheet_schema import SHEET_SCHEMAS, WHOLESALE_SHEET, RETAIL_SHEET, SheetSchema, column_letter, get_schema
+from core.sheet_writer import SheetWriter
+from core.sheet_index import SheetIndex
+from core.sheet_mirror import SheetMirror
+from core.sheet_quota import PRIORITY_SYNC, QuotaScheduler, sheets_priority
+from core.sheets_client import SheetsClient, Spreadsheet, Worksheet
+from core.http_pool import get_google_client, refresh_google_tokens
 
 logger = setup_logger(__name__)
 
-def get_creds():
-    """Возвращает учетные данные для Google API."""
-    credentials = ServiceAccountCredentials.from_json_keyfile_name(
-        CREDENTIALS_FILE, GOOGLE_API_SCOPE
-    )
-    return credentials
-# Инициализация менеджера клиента Google Sheets
-agcm = AsyncioGspreadClientManager(get_creds)
+# Листы с заявками клиентов, открываемые при старте бота
+CLIENT_SHEETS = (WHOLESALE_SHEET, RETAIL_SHEET)
+TOKEN_REFRESH_INTERVAL = 10 * 60  # Проверка токена, секунды
+TOKEN_REFRESH_MARGIN = timedelta(minutes=15)  # Обновляем токен заранее, до истечения
+HEADERS_CHECK_TTL = float(os.getenv("HEADERS_CHECK_TTL", "3600"))  # Повторная проверка заголовков, секунды
+SHEET_SYNC_INTERVAL = float(os.getenv("SHEET_SYNC_INTERVAL", "60"))  # Сверка локальной копии с листом, секунды
+
+# Ошибки, после которых сохранённые объекты листов считаются недействительными
+STALE_HANDLE_STATUSES = (403, 404)
+
+# Общий планировщик квоты Sheets API
+quota_scheduler = QuotaScheduler()
+
+
+def _is_idempotent_call(kind: str, send, key=None, idempotent: bool = True) -> bool:
+    return idempotent
+
+
+@handle_google_api_error(idempotent=_is_idempotent_call)
+async def _sheets_call(kind: str, send, key=None, idempotent: bool = True):
+    """
+    Выполняет запрос клиента Sheets: квота и объединение чтений (quota_scheduler),
+    повторы и автомат защиты (handle_google_api_error), сброс кэша при ошибках доступа.
+
+    Добавление строк и создание листа после таймаута или 5xx не повторяются:
+    строку заявки повторно запишет журнал заявок (core.order_outbox), сверив
+    индекс листа, а лист get_google_sheet найдёт при следующем обращении.
+    """
+    try:
+        return await quota_scheduler.run(kind, send, key=key)
+    except HTTPError as e:
+        status = getattr(e.res, "status_code", None)
+        if status in STALE_HANDLE_STATUSES:
+            logger.warning(f"Google API вернул {status}, кэш листов сброшен.")
+            invalidate_sheet_cache()
+        raise
+
+
+_sheets_client: SheetsClient | None = None
+
+
+def get_sheets_client() -> SheetsClient:
+    """Возвращает клиента Sheets API на общем пуле соединений и кэше токена."""
+    global _sheets_client
+    if _sheets_client is None:
+        _sheets_client = SheetsClient(get_google_client(CREDENTIALS_FILE, GOOGLE_API_SCOPE), call=_sheets_call)
+    return _sheets_client
+
+# Кэш открытой таблицы и листов по имени
+_spreadsheet: Spreadsheet | None = None
+_spreadsheet_lock = asyncio.Lock()
+_worksheets: dict[str, Worksheet] = {}
+_worksheet_locks: dict[str, asyncio.Lock] = {}
+_verified_headers: dict[tuple, float] = {}
+_sheet_writers: dict[str, SheetWriter] = {}
+_sheet_indexes: dict[str, SheetIndex] = {}
+_sheet_mirror: SheetMirror | None = None
+_sheet_sync_task: asyncio.Task | None = None
+_token_refresh_task: asyncio.Task | None = None
+
+def invalidate_sheet_cache(sheet_name: str = None):
+    """Сбрасывает кэш листа (или всей таблицы, если имя не указано)."""
+    global _spreadsheet
+    if sheet_name is None:
+        _spreadsheet = None
+        _worksheets.clear()
+        _verified_headers.clear()
+    else:
+        _worksheets.pop(sheet_name, None)
+        for memo_key in [key for key in _verified_headers if key[0] == sheet_name]:
+            del _verified_headers[memo_key]
+
+async def _get_spreadsheet() -> Spreadsheet:
+    """Возвращает открытую таблицу; открывает её только один раз."""
+    global _spreadsheet
+    if _spreadsheet is None:
+        async with _spreadsheet_lock:
+            if _spreadsheet is None:
+                _spreadsheet = await get_sheets_client().open_by_key(SPREADSHEET_ID)
+    return _spreadsheet
 
 @handle_google_api_error
-async def get_google_sheet(sheet_name="Лист1") -> AsyncioGspreadWorksheet:
+async def get_google_sheet(sheet_name="Лист1") -> Worksheet:
     """Возвращает лист Google Sheets или создаёт его, если он отсутствует."""
+    worksheet = _worksheets.get(sheet_name)
+    if worksheet is not None:
+        return worksheet
+
     try:
         if not CREDENTIALS_FILE or not SPREADSHEET_ID:
             raise ValueError("Отсутствует CREDENTIALS_FILE или SPREADSHEET_ID.")
 
-        client = await agcm.authorize()
-        spreadsheet: AsyncioGspreadSpreadsheet = await client.open_by_key(SPREADSHEET_ID)
+        # Лист открывает только одна корутина, остальные ждут её результата
+        lock = _worksheet_locks.setdefault(sheet_name, asyncio.Lock())
+        async with lock:
+            worksheet = _worksheets.get(sheet_name)
+            if worksheet is not None:
+                return worksheet
 
-        try:
-            worksheet: AsyncioGspreadWorksheet = await spreadsheet.worksheet(sheet_name)
-        except Exception:
-            worksheet = await spreadsheet.add_worksheet(title=sheet_name, rows=100, cols=20)
-            logger.info(f"Создан новый лист: {sheet_name}.")
-        
-        return worksheet
+            spreadsheet = await _get_spreadsheet()
+            try:
+                worksheet = await spreadsheet.worksheet(sheet_name)
+            except Exception as e:
+                if is_retryable_error(e):
+                    raise  # Лист может существовать: Google временно не ответил
+                worksheet = await spreadsheet.add_worksheet(title=sheet_name, rows=100, cols=20)
+                logger.info(f"Создан новый лист: {sheet_name}.")
+
+            _worksheets[sheet_name] = worksheet
+            return worksheet
     except Exception as e:
         logger.error(f"Ошибка доступа к Google Sheet: {e}", exc_info=True)
         raise RuntimeError("Не удалось получить доступ к Google Sheet.")
 
+async def warm_up_sheets(sheet_names=CLIENT_SHEETS):
+    """Открывает листы заранее, чтобы первая заявка не ждала авторизации."""
+    for sheet_name in sheet_names:
+        await get_google_sheet(sheet_name)
+    logger.info(f"Листы открыты заранее: {', '.join(sheet_names)}.")
+
+async def refresh_token():
+    """Обновляет токены доступа Google, если они скоро истекут."""
+    refreshed = await refresh_google_tokens(TOKEN_REFRESH_MARGIN)
+    if refreshed:
+        logger.info(f"Токены доступа Google обновлены: {refreshed}.")
+
+async def _token_refresh_loop():
+    while True:
+        await asyncio.sleep(TOKEN_REFRESH_INTERVAL)
+        try:
+            await refresh_token()
+        except Exception as e:
+            logger.error(f"Ошибка обновления токена Google Sheets: {e}", exc_info=True)
+
+def start_token_refresh():
+    """Запускает фоновое обновление токена доступа."""
+    global _token_refresh_task
+    if _token_refresh_task is None:
+        _token_refresh_task = asyncio.create_task(_token_refresh_loop())
+
+async def stop_token_refresh():
+    """Останавливает фоновое обновление токена доступа."""
+    global _token_refresh_task
+    if _token_refresh_task is not None:
+        _token_refresh_task.cancel()
+        try:
+            await _token_refresh_task
+        except asyncio.CancelledError:
+            pass
+        _token_refresh_task = None
+
 @handle_google_api_error
-async def initialize_google_sheet(sheet: AsyncioGspreadWorksheet, headers: list):
-    """Проверяет заголовки, обновляет только если необходимо."""
+async def initialize_google_sheet(sheet: Worksheet, headers: list):
+    """Проверяет заголовки, обновляет только если необходимо (не чаще раза в HEADERS_CHECK_TTL)."""
+    headers = [header.strip() for header in headers]
+    memo_key = (sheet.title, tuple(headers))
+    checked_at = _verified_headers.get(memo_key)
+    if checked_at is not None and time.monotonic() - checked_at < HEADERS_CHECK_TTL:
+        return
+
     try:
         existing_headers = await sheet.row_values(1)
         existing_headers = [header.strip() for header in existing_headers]
-        headers = [header.strip() for header in headers]
 
         if existing_headers == headers:
             logger.info(f"Заголовки листа '{sheet.title}' совпадают, обновление не требуется.")
-            return
-
-        if not existing_headers:
+        elif not existing_headers:
             await sheet.append_row(headers)  # Если таблица пустая, записываем заголовки
             logger.info(f"Добавлены заголовки в '{sheet.title}': {headers}")
         else:
-            await sheet.update(f"A1:{chr(64 + len(headers))}1", [headers])  # Обновляем первую строку
+            await sheet.update(f"A1:{column_letter(len(headers))}1", [headers])  # Обновляем первую строку
             logger.info(f"Заголовки обновлены: {headers}")
 
+        _verified_headers[memo_key] = time.monotonic()
     except Exception as e:
         logger.error(f"Ошибка обновления заголовков в '{sheet.title}': {e}", exc_info=True)
         raise RuntimeError(f"Не удалось обновить заголовки в Google Sheet '{sheet.title}'.")
 
+async def get_schema_sheet(schema: SheetSchema) -> Worksheet:
+    """Возвращает лист, заголовки которого проверены по схеме."""
+    worksheet = await get_google_sheet(schema.name)
+    await initialize_google_sheet(worksheet, list(schema.headers))
+    return worksheet
+
+def get_sheet_writer(sheet_name: str) -> SheetWriter:
+    """Возвращает единственного писателя листа; все записи листа идут через него."""
+    writer = _sheet_writers.get(sheet_name)
+    if writer is None:
+        schema = SHEET_SCHEMAS.get(sheet_name)
+        if schema is not None:
+            open_worksheet = lambda: get_schema_sheet(schema)
+        else:
+            open_worksheet = lambda: get_google_sheet(sheet_name)
+        writer = _sheet_writers[sheet_name] = SheetWriter(sheet_name, open_worksheet)
+    return writer
+
+def get_sheet_mirror() -> SheetMirror:
+    """Возвращает локальную копию листов, открывая базу при первом обращении."""
+    global _sheet_mirror
+    if _sheet_mirror is None:
+        _sheet_mirror = SheetMirror()
+    return _sheet_mirror
+
+def get_sheet_index(sheet_name: str) -> SheetIndex:
+    """Возвращает индекс строк листа по ID клиента, обновляемый писателем листа."""
+    index = _sheet_indexes.get(sheet_name)
+    if index is None:
+        schema = get_schema(sheet_name)
+        index = SheetIndex(schema, lambda: get_schema_sheet(schema), mirror=get_sheet_mirror())
+        _sheet_indexes[sheet_name] = index
+        get_sheet_writer(sheet_name).add_listener(index.apply_writes)
+    return index
+
+async def get_client_row(sheet_name: str, client_id: str) -> list | None:
+    """Возвращает первую заявку клиента из локальной копии листа."""
+    found = await get_sheet_index(sheet_name).find(client_id)
+    return found[1] if found else None
+
+async def sync_client_sheets(sheet_names=CLIENT_SHEETS) -> int:
+    """
+    Сверяет локальную копию с листами и применяет изменения, сделанные вручную.
+
+    Сначала одним запросом читается время изменения таблицы; листы читаются
+    целиком, только если таблица изменилась после их прошлой сверки.
+    """
+    try:
+        marker = await (await _get_spreadsheet()).modified_time()
+    except Exception as e:
+        logger.warning(f"Не удалось получить время изменения таблицы, листы будут прочитаны целиком: {e}")
+        marker = None
+
+    changes = 0
+    for sheet_name in sheet_names:
+        index = get_sheet_index(sheet_name)
+        await index.ensure_loaded()
+        changes += await index.sync(marker)
+    return changes
+
+async def _sheet_sync_loop():
+    while True:
+        try:
+            with sheets_priority(PRIORITY_SYNC):
+                await sync_client_sheets()
+        except Exception as e:
+            logger.error(f"Ошибка сверки локальной копии листов: {e}", exc_info=True)
+        await asyncio.sleep(SHEET_SYNC_INTERVAL)
+
+def start_sheet_sync():
+    """Запускает фоновую сверку локальной копии листов."""
+    global _sheet_sync_task
+    if _sheet_sync_task is None:
+        _sheet_sync_task = asyncio.create_task(_sheet_sync_loop())
+
+async def stop_sheet_sync():
+    """Останавливает фоновую сверку и закрывает локальную копию."""
+    global _sheet_sync_task, _sheet_mirror
+    if _sheet_sync_task is not None:
+        _sheet_sync_task.cancel()
+        try:
+            await _sheet_sync_task
+        except asyncio.CancelledError:
+            pass
+        _sheet_sync_task = None
+    if _sheet_mirror is not None:
+        _sheet_mirror.close()
+        _sheet_mirror = None
+
+async def stop_sheet_writers():
+    """Записывает накопленные операции всех листов. Вызывается при остановке бота."""
+    for writer in _sheet_writers.values():
+        await writer.stop()
+
 @handle_google_api_error
 async def update_client_status(sheet_name: str, client_id: str, status: str):
     """Обновляет статус клиента в таблице Google Sheets."""
-    worksheet = await get_google_sheet(sheet_name)
-    all_data = await worksheet.get_all_values()
-
-    if not all_data:
-        logger.error(f"Лист '{sheet_name}' пуст, статус обновить невозможно.")
-        return False
+    schema = get_schema(sheet_name)
+    found = await get_sheet_index(sheet_name).find(client_id)
 
-    headers = all_data[0]
-    try:
-        status_col_index = headers.index("Статус") + 1  # Столбцы в Google Sheets нумеруются с 1
-    except ValueError:
-        logger.error(f"Столбец 'Статус' не найден в '{sheet_name}'.")
+    if found is None:
+        logger.warning(f"⚠ Клиент {client_id} не найден в таблице {sheet_name}.")
         return False
 
-    for i, row in enumerate(all_data[1:], start=2):  # Начинаем со второй строки
-        if len(row) > 1 and str(row[1]).strip() == str(client_id).strip():  # Проверяем ID клиента
-            cell = f"{chr(64 + status_col_index)}{i}"  # Определяем ячейку для обновления
-            await worksheet.update(cell, [[status]])  # Обновляем статус
-            logger.info(f"✅ Статус клиента {client_id} обновлён на '{status}' в {sheet_name}.")
-            return True
-
-    logger.warning(f"⚠ Клиент {client_id} не найден в таблице {sheet_name}.")
-    return False
+    row_number, _ = found
+    cell = schema.cell("Статус", row_number)  # Определяем ячейку для обновления
+    await get_sheet_writer(sheet_name).update(cell, status)  # Обновляем статус
+    logger.info(f"✅ Статус клиента {client_id} обновлён на '{status}' в {sheet_name}.")
+    return True
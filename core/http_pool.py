@@ -0,0 +1,215 @@
+# core/http_pool.py
+"""
+core/http_pool.py
+
+Общий слой HTTP-соединений и учётных данных Google.
+- Один TCPConnector aiohttp на процесс: keep-alive, ограничения соединений
+  (всего и на хост), кэш DNS. Через него ходят Bot API, Sheets и Drive,
+  поэтому TLS-рукопожатия с одним хостом не повторяются.
+- Один клиент aiogoogle на файл ключа сервисного аккаунта и набор scopes: JSON
+  ключа читается один раз, токен доступа кэшируется и обновляется заранее, до истечения.
+- Счётчики запросов, новых и переиспользованных соединений, ожиданий свободного
+  соединения и обращений к кэшу DNS (get_pool_stats).
+"""
+
+import asyncio
+import json
+import os
+import ssl
+from datetime import datetime, timedelta
+import aiohttp
+import certifi
+import aiogoogle
+from aiogoogle import Aiogoogle
+from aiogoogle.auth.creds import ServiceAccountCreds
+from aiogoogle.auth.managers import ServiceAccountManager
+from aiogoogle.sessions.aiohttp_session import AiohttpSession as GoogleAiohttpSession
+from aiogram.client.session.aiohttp import AiohttpSession as BotAiohttpSession
+from aiogram.client.session.aiohttp import SERVER_SOFTWARE, USER_AGENT, __version__ as aiogram_version
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))  # Соединений всего
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "30"))  # Соединений с одним хостом
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))  # Секунды простоя до закрытия соединения
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))  # Секунды
+GOOGLE_TOKEN_REFRESH_MARGIN = timedelta(minutes=5)  # Токен обновляется заранее, до истечения
+# CachedTokenManager опирается на внутренние поля ServiceAccountManager; они проверены
+# с этой версией aiogoogle (закреплена в requirements.txt)
+AIOGOOGLE_TESTED_VERSION = "5.19.0"
+
+_connector: aiohttp.TCPConnector | None = None
+_google_session: "SharedGoogleSession | None" = None
+_google_clients: dict[tuple[str, tuple[str, ...]], Aiogoogle] = {}  # (файл ключа, scopes) → клиент
+_stats = {
+    "requests": 0,
+    "request_errors": 0,
+    "connections_created": 0,
+    "connections_reused": 0,
+    "connections_queued": 0,
+    "dns_cache_hits": 0,
+    "dns_cache_misses": 0,
+}
+
+
+def _counter(name: str):
+    async def count(session, context, params):
+        _stats[name] += 1
+    return count
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_counter("requests"))
+    trace_config.on_request_exception.append(_counter("request_errors"))
+    trace_config.on_connection_create_end.append(_counter("connections_created"))
+    trace_config.on_connection_reuseconn.append(_counter("connections_reused"))
+    trace_config.on_connection_queued_start.append(_counter("connections_queued"))
+    trace_config.on_dns_cache_hit.append(_counter("dns_cache_hits"))
+    trace_config.on_dns_cache_miss.append(_counter("dns_cache_misses"))
+    return trace_config
+
+
+def get_connector() -> aiohttp.TCPConnector:
+    """Возвращает общий пул соединений, создавая его при первом обращении (внутри цикла событий)."""
+    global _connector
+    if _connector is None or _connector.closed:
+        _connector = aiohttp.TCPConnector(
+            ssl=ssl.create_default_context(cafile=certifi.where()),
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            enable_cleanup_closed=True,
+        )
+    return _connector
+
+
+def create_client_session(**kwargs) -> aiohttp.ClientSession:
+    """Сессия aiohttp поверх общего пула; закрытие сессии пул не закрывает."""
+    return aiohttp.ClientSession(connector=get_connector(), connector_owner=False, trace_configs=[_trace_config()], **kwargs)
+
+
+class BotSession(BotAiohttpSession):
+    """Сессия aiogram, отправляющая запросы Bot API через общий пул соединений."""
+
+    async def create_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = create_client_session(headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"})
+        return self._session
+
+
+class SharedGoogleSession(GoogleAiohttpSession):
+    """Сессия aiogoogle, общая для всех клиентов Google; закрывается только через close_http_pool()."""
+
+    def __init__(self):
+        self._session = create_client_session()  # Вместо собственной сессии aiogoogle с отдельным пулом
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass  # aiogoogle закрывает сессию после каждого получения токена и выхода из async with
+
+
+def get_google_session() -> SharedGoogleSession:
+    """Фабрика сессий для aiogoogle: всегда возвращает общую сессию."""
+    global _google_session
+    if _google_session is None or _google_session._session.closed:
+        _google_session = SharedGoogleSession()
+    return _google_session
+
+
+class CachedTokenManager(ServiceAccountManager):
+    """
+    Токен сервисного аккаунта, обновляемый за GOOGLE_TOKEN_REFRESH_MARGIN до истечения.
+
+    Одновременные запросы с истекающим токеном получают новый токен одним обменом.
+
+    Внутренние поля aiogoogle (_access_token, _expires_at, _get_oauth2_authorization_grant)
+    используются только в _token_expires_at и _grant: при обновлении aiogoogle
+    (AIOGOOGLE_TESTED_VERSION) проверять нужно их.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._refresh_lock = asyncio.Lock()
+        self.refreshes = 0
+
+    def _token_expires_at(self) -> datetime | None:
+        """Время истечения текущего токена или None, если токена нет."""
+        if not self._access_token or not self._expires_at:
+            return None
+        # aiogoogle хранит время истечения строкой ISO в UTC
+        return datetime.fromisoformat(self._expires_at)
+
+    async def _grant(self):
+        """Получает новый токен обменом подписанного JWT."""
+        await self._get_oauth2_authorization_grant()
+
+    def expires_soon(self, margin: timedelta = GOOGLE_TOKEN_REFRESH_MARGIN) -> bool:
+        expires_at = self._token_expires_at()
+        return expires_at is None or expires_at - datetime.utcnow() <= margin
+
+    async def refresh(self, margin: timedelta = GOOGLE_TOKEN_REFRESH_MARGIN) -> bool:
+        if not self.expires_soon(margin):
+            return False
+        async with self._refresh_lock:
+            if not self.expires_soon(margin):
+                return False  # Токен уже обновил другой запрос
+            await self._grant()
+            self.refreshes += 1
+        return True
+
+
+def get_google_client(key_file: str, scopes: list[str]) -> Aiogoogle:
+    """
+    Возвращает клиента aiogoogle для ключа сервисного аккаунта.
+
+    Клиент создаётся один раз на файл ключа и набор scopes (токен выдаётся на scopes);
+    все клиенты используют общую сессию.
+    """
+    cache_key = (key_file, tuple(scopes))
+    client = _google_clients.get(cache_key)
+    if client is None:
+        if aiogoogle.__version__ != AIOGOOGLE_TESTED_VERSION:
+            logger.warning(
+                f"aiogoogle {aiogoogle.__version__} не проверен с кэшем токенов "
+                f"(проверен {AIOGOOGLE_TESTED_VERSION}), см. CachedTokenManager."
+            )
+        with open(key_file, "r", encoding="utf-8") as f:
+            credentials_data = json.load(f)
+        creds = ServiceAccountCreds(scopes=scopes, **credentials_data)
+        client = Aiogoogle(session_factory=get_google_session, service_account_creds=creds)
+        client.service_account_manager = CachedTokenManager(get_google_session, creds=creds)
+        _google_clients[cache_key] = client
+    return client
+
+
+async def refresh_google_tokens(margin: timedelta = GOOGLE_TOKEN_REFRESH_MARGIN) -> int:
+    """Обновляет токены, которые истекут в пределах margin. Возвращает число обновлённых."""
+    refreshed = 0
+    for client in _google_clients.values():
+        if await client.service_account_manager.refresh(margin):
+            refreshed += 1
+    return refreshed
+
+
+def get_pool_stats() -> dict:
+    """Счётчики общего пула соединений и токенов Google."""
+    return {
+        **_stats,
+        "limit": HTTP_POOL_LIMIT,
+        "limit_per_host": HTTP_POOL_LIMIT_PER_HOST,
+        "token_refreshes": sum(client.service_account_manager.refreshes for client in _google_clients.values()),
+    }
+
+
+async def close_http_pool():
+    """Закрывает общую сессию Google и пул соединений. Вызывается при остановке бота последним."""
+    global _google_session, _connector
+    if _google_session is not None:
+        await _google_session.close()
+        _google_session = None
+    if _connector is not None:
+        await _connector.close()
+        _connector = None
+    logger.info(f"Пул HTTP-соединений закрыт: {get_pool_stats()}")
@@ -0,0 +1,421 @@
+# core/order_outbox.py
+"""
+core/order_outbox.py
+
+Журнал исходящих операций заявок (outbox) в SQLite.
+- Обработчик заявки одной транзакцией сохраняет строку для таблицы и
+  уведомление менеджеру и сразу отвечает клиенту.
+- Фоновый диспетчер переносит строки в Google Sheets, а уведомления —
+  в Telegram, с повторами и нарастающей задержкой; после перезапуска бота
+  незавершённые операции продолжаются.
+- Ключ идемпотентности заявки — «ID клиента:дата». Перед повторной записью
+  строки диспетчер проверяет по индексу листа, не дошла ли она в прошлый раз.
+- Строки одного листа записываются в порядке поступления; уведомление
+  отправляется только после записи строки своей заявки.
+- Строка, не записанная за OUTBOX_MAX_ATTEMPTS попыток, снимается с очереди,
+  а менеджер получает предупреждение с данными заявки.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from aiogram import Bot
+from aiogram.types import InlineKeyboardMarkup
+from core.google_sheets import get_sheet_index, get_sheet_writer
+from core.utils.db_utils import DEFAULT_DB_PATH, open_database, transaction
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))  # Секунды между проверками журнала
+OUTBOX_RETRY_BASE_DELAY = float(os.getenv("OUTBOX_RETRY_BASE_DELAY", "5"))  # Секунды, удваиваются с каждой попыткой
+OUTBOX_RETRY_MAX_DELAY = float(os.getenv("OUTBOX_RETRY_MAX_DELAY", "600"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))  # Попыток до перевода операции в «мёртвые»
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))  # Операций за один проход
+OUTBOX_RETENTION = 7 * 24 * 3600  # Сколько хранить выполненные операции, секунды
+MANAGER_ID = os.getenv("MANAGER_ID")
+
+SHEET_ROW = "sheet_row"
+MANAGER_MESSAGE = "manager_message"
+
+
+class OrderOutbox:
+    """
+    Очередь операций заявок, ожидающих отправки в Google Sheets и Telegram.
+
+    Операция, не выполненная за OUTBOX_MAX_ATTEMPTS попыток, помечается
+    «мёртвой» (dead_at): она больше не повторяется и не задерживает
+    следующие строки листа. Вернуть такие операции в работу — retry_dead().
+    Запросы к базе выполняются в пуле потоков (asyncio.to_thread).
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self._lock = threading.Lock()
+        self._connection = open_database(db_path)
+        with self._lock:
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS order_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    order_key TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    sheet TEXT,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    done_at REAL,
+                    dead_at REAL,
+                    UNIQUE (order_key, kind)
+                );
+                CREATE INDEX IF NOT EXISTS order_outbox_pending ON order_outbox (done_at, next_attempt_at);
+                """
+            )
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(order_outbox)")}
+            if "dead_at" not in columns:  # Журнал создан до появления «мёртвых» операций
+                self._connection.execute("ALTER TABLE order_outbox ADD COLUMN dead_at REAL")
+
+    async def add_order(self, order_key: str, row_payload: dict, message_payload: dict | None = None) -> bool:
+        """
+        Сохраняет операции заявки одной транзакцией.
+
+        Args:
+            order_key (str): Ключ идемпотентности заявки.
+            row_payload (dict): Строка таблицы: sheet, row, client_id, date.
+            message_payload (dict | None): Уведомление менеджеру: chat_id, text, reply_markup, parse_mode.
+
+        Returns:
+            bool: False, если заявка с таким ключом уже сохранена.
+        """
+        return await asyncio.to_thread(self._add_order, order_key, row_payload, message_payload)
+
+    def _add_order(self, order_key: str, row_payload: dict, message_payload: dict | None) -> bool:
+        now = time.time()
+        entries = [(SHEET_ROW, row_payload)]
+        if message_payload is not None:
+            entries.append((MANAGER_MESSAGE, message_payload))
+        with self._lock, transaction(self._connection):
+            cursor = self._connection.executemany(
+                """
+                INSERT OR IGNORE INTO order_outbox (order_key, kind, sheet, payload, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (order_key, kind, payload.get("sheet") if kind == SHEET_ROW else None,
+                     json.dumps(payload, ensure_ascii=False), now, now)
+                    for kind, payload in entries
+                ],
+            )
+            return cursor.rowcount > 0
+
+    async def due(self, limit: int = OUTBOX_BATCH_SIZE) -> list[dict]:
+        """
+        Невыполненные операции, время попытки которых наступило, в порядке поступления.
+
+        Строка листа не выдаётся, пока более ранняя строка того же листа ждёт повтора,
+        а уведомление — пока строка его заявки не записана.
+        """
+        return await asyncio.to_thread(self._due, limit)
+
+    def _due(self, limit: int) -> list[dict]:
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT id, order_key, kind, payload, attempts FROM order_outbox AS entry
+                WHERE done_at IS NULL AND dead_at IS NULL AND next_attempt_at <= :now
+                  AND NOT (kind = :sheet_row AND EXISTS (
+                      SELECT 1 FROM order_outbox AS earlier
+                      WHERE earlier.kind = :sheet_row AND earlier.sheet = entry.sheet AND earlier.id < entry.id
+                        AND earlier.done_at IS NULL AND earlier.dead_at IS NULL AND earlier.next_attempt_at > :now
+                  ))
+                  AND NOT (kind = :manager_message AND EXISTS (
+                      SELECT 1 FROM order_outbox AS order_row
+                      WHERE order_row.order_key = entry.order_key AND order_row.kind = :sheet_row
+                        AND order_row.done_at IS NULL
+                  ))
+                ORDER BY id LIMIT :limit
+                """,
+                {"now": time.time(), "sheet_row": SHEET_ROW, "manager_message": MANAGER_MESSAGE, "limit": limit},
+            ).fetchall()
+        return [
+            {"id": row[0], "order_key": row[1], "kind": row[2], "payload": json.loads(row[3]), "attempts": row[4]}
+            for row in rows
+        ]
+
+    async def is_done(self, order_key: str, kind: str) -> bool:
+        return await asyncio.to_thread(self._is_done, order_key, kind)
+
+    def _is_done(self, order_key: str, kind: str) -> bool:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT done_at FROM order_outbox WHERE order_key = ? AND kind = ?", (order_key, kind)
+            ).fetchone()
+        return row is None or row[0] is not None
+
+    async def mark_attempt(self, entry_ids: list[int]):
+        """Отмечает начало попытки до отправки: после сбоя процесса видно, что операция могла дойти."""
+        await asyncio.to_thread(self._mark_attempt, entry_ids)
+
+    def _mark_attempt(self, entry_ids: list[int]):
+        with self._lock:
+            self._connection.executemany(
+                "UPDATE order_outbox SET attempts = attempts + 1 WHERE id = ?", [(entry_id,) for entry_id in entry_ids]
+            )
+
+    async def mark_done(self, entry_id: int):
+        await asyncio.to_thread(self._mark_done, entry_id)
+
+    def _mark_done(self, entry_id: int):
+        with self._lock:
+            self._connection.execute(
+                "UPDATE order_outbox SET done_at = ?, last_error = NULL WHERE id = ?", (time.time(), entry_id)
+            )
+
+    async def mark_failed(self, entry_id: int, attempts: int, error: str) -> bool:
+        """
+        Откладывает операцию: задержка удваивается с каждой попыткой, но не больше OUTBOX_RETRY_MAX_DELAY.
+
+        Returns:
+            bool: True, если попытки исчерпаны и операция (вместе с остальными
+                операциями заявки) помечена «мёртвой».
+        """
+        return await asyncio.to_thread(self._mark_failed, entry_id, attempts, error)
+
+    def _mark_failed(self, entry_id: int, attempts: int, error: str) -> bool:
+        now = time.time()
+        error = error[:1000]
+        with self._lock, transaction(self._connection):
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                # Уведомление о заявке без строки в таблице не отправляется: менеджер получит предупреждение
+                self._connection.execute(
+                    """
+                    UPDATE order_outbox SET dead_at = ?, last_error = ?
+                    WHERE done_at IS NULL AND order_key = (SELECT order_key FROM order_outbox WHERE id = ?)
+                    """,
+                    (now, error, entry_id),
+                )
+                return True
+            delay = min(OUTBOX_RETRY_MAX_DELAY, OUTBOX_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0))
+            self._connection.execute(
+                "UPDATE order_outbox SET next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (now + delay, error, entry_id),
+            )
+            return False
+
+    async def retry_dead(self) -> int:
+        """Возвращает «мёртвые» операции в работу (после исправления причины сбоя)."""
+        return await asyncio.to_thread(self._retry_dead)
+
+    def _retry_dead(self) -> int:
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE order_outbox SET dead_at = NULL, attempts = 0, next_attempt_at = ? WHERE dead_at IS NOT NULL",
+                (time.time(),),
+            )
+        return cursor.rowcount
+
+    async def counts(self) -> dict:
+        """Число ожидающих и «мёртвых» операций."""
+        return await asyncio.to_thread(self._counts)
+
+    def _counts(self) -> dict:
+        with self._lock:
+            pending, dead = self._connection.execute(
+                """
+                SELECT COUNT(*) - COUNT(dead_at), COUNT(dead_at) FROM order_outbox WHERE done_at IS NULL
+                """
+            ).fetchone()
+        return {"pending": pending, "dead": dead}
+
+    async def purge_done(self, older_than: float = OUTBOX_RETENTION) -> int:
+        """Удаляет выполненные операции старше older_than секунд; «мёртвые» операции остаются."""
+        return await asyncio.to_thread(self._purge_done, older_than)
+
+    def _purge_done(self, older_than: float) -> int:
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM order_outbox WHERE done_at IS NOT NULL AND done_at < ?", (time.time() - older_than,)
+            )
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_order_outbox: OrderOutbox | None = None
+_dispatcher_task: asyncio.Task | None = None
+_wakeup: asyncio.Event | None = None
+
+
+def get_order_outbox() -> OrderOutbox:
+    """Возвращает журнал заявок, открывая базу при первом обращении."""
+    global _order_outbox
+    if _order_outbox is None:
+        _order_outbox = OrderOutbox()
+    return _order_outbox
+
+
+def wake_order_dispatcher():
+    """Будит диспетчер, чтобы новая заявка ушла без ожидания OUTBOX_POLL_INTERVAL."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def _alert_dead_order(bot: Bot, entry: dict, error: str):
+    """Сообщает менеджеру о заявке, которую не удалось записать в таблицу."""
+    payload = entry["payload"]
+    logger.error(f"Заявка {entry['order_key']} не записана в '{payload['sheet']}' после {OUTBOX_MAX_ATTEMPTS} попыток: {error}")
+    if not MANAGER_ID:
+        return
+    text = (
+        f"⚠ Заявка {entry['order_key']} не записана в таблицу '{payload['sheet']}' "
+        f"после {OUTBOX_MAX_ATTEMPTS} попыток.\n"
+        f"Ошибка: {error[:500]}\n"
+        f"Данные: {' | '.join(str(value) for value in payload['row'])}"
+    )
+    try:
+        await bot.send_message(MANAGER_ID, text)
+    except Exception as e:
+        logger.error(f"Не удалось предупредить менеджера о заявке {entry['order_key']}: {e}")
+
+
+async def _fail(outbox: OrderOutbox, bot: Bot, entry: dict, error: str):
+    if not await outbox.mark_failed(entry["id"], entry["attempts"] + 1, error):
+        return
+    if entry["kind"] == SHEET_ROW:
+        await _alert_dead_order(bot, entry, error)
+    else:
+        logger.error(f"Уведомление о заявке {entry['order_key']} не отправлено после {OUTBOX_MAX_ATTEMPTS} попыток: {error}")
+
+
+async def _deliver_rows(outbox: OrderOutbox, bot: Bot, sheet_name: str, entries: list[dict]) -> int:
+    """Записывает строки одного листа по порядку. Возвращает количество строк, дошедших до таблицы."""
+    index = get_sheet_index(sheet_name)
+    if any(entry["attempts"] for entry in entries):
+        # Прошлая попытка могла дойти до таблицы: сверяем индекс с листом перед повтором
+        await index.ensure_loaded()
+        await index.sync()
+
+    pending = []
+    delivered = 0
+    for entry in entries:
+        payload = entry["payload"]
+        if entry["attempts"] and await index.find_order(payload["client_id"], payload["date"]) is not None:
+            logger.info(f"Заявка {entry['order_key']} уже есть в листе '{sheet_name}', повторно не записывается.")
+            await outbox.mark_done(entry["id"])
+            delivered += 1
+            continue
+        pending.append(entry)
+    if not pending:
+        return delivered
+
+    await outbox.mark_attempt([entry["id"] for entry in pending])
+    writer = get_sheet_writer(sheet_name)
+    # Писатель листа сохраняет порядок постановки в очередь и объединяет строки в один запрос
+    results = await asyncio.gather(*(writer.append(entry["payload"]["row"]) for entry in pending), return_exceptions=True)
+
+    for entry, result in zip(pending, results):
+        if isinstance(result, Exception):
+            logger.error(f"Заявка {entry['order_key']} не записана в '{sheet_name}' (попытка {entry['attempts'] + 1}): {result}")
+            await _fail(outbox, bot, entry, str(result))
+        else:
+            await outbox.mark_done(entry["id"])
+            delivered += 1
+    return delivered
+
+
+async def _deliver_message(outbox: OrderOutbox, bot: Bot, entry: dict) -> bool:
+    payload = entry["payload"]
+    await outbox.mark_attempt([entry["id"]])
+    try:
+        reply_markup = payload.get("reply_markup")
+        await bot.send_message(
+            payload["chat_id"],
+            payload["text"],
+            reply_markup=InlineKeyboardMarkup.model_validate(reply_markup) if reply_markup else None,
+            parse_mode=payload.get("parse_mode"),
+        )
+    except Exception as e:
+        logger.error(f"Уведомление о заявке {entry['order_key']} не отправлено (попытка {entry['attempts'] + 1}): {e}")
+        await _fail(outbox, bot, entry, str(e))
+        return False
+    await outbox.mark_done(entry["id"])
+    return True
+
+
+async def dispatch_pending(bot: Bot) -> int:
+    """
+    Выполняет один проход по журналу заявок.
+
+    Returns:
+        int: Количество выполненных операций; 0 — проход не продвинул журнал.
+    """
+    outbox = get_order_outbox()
+    entries = await outbox.due()
+    if not entries:
+        return 0
+
+    completed = 0
+    rows_by_sheet: dict[str, list[dict]] = {}
+    for entry in entries:
+        if entry["kind"] == SHEET_ROW:
+            rows_by_sheet.setdefault(entry["payload"]["sheet"], []).append(entry)
+    for sheet_name, sheet_entries in rows_by_sheet.items():
+        try:
+            completed += await _deliver_rows(outbox, bot, sheet_name, sheet_entries)
+        except Exception as e:
+            logger.error(f"Ошибка записи заявок в '{sheet_name}': {e}", exc_info=True)
+            for entry in sheet_entries:
+                if not await outbox.is_done(entry["order_key"], SHEET_ROW):
+                    await _fail(outbox, bot, entry, str(e))
+
+    for entry in entries:
+        if entry["kind"] == MANAGER_MESSAGE and await _deliver_message(outbox, bot, entry):
+            completed += 1
+    return completed
+
+
+async def _dispatch_loop(bot: Bot):
+    outbox = get_order_outbox()
+    counts = await outbox.counts()
+    logger.info(f"Диспетчер заявок запущен, в журнале ожидают операций: {counts['pending']}, «мёртвых»: {counts['dead']}.")
+    while True:
+        try:
+            if await dispatch_pending(bot):
+                continue  # Проход продвинул журнал: возможно, в нём ещё есть готовые операции
+            await outbox.purge_done()
+        except Exception as e:
+            logger.error(f"Ошибка диспетчера заявок: {e}", exc_info=True)
+        try:
+            await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+
+def start_order_dispatcher(bot: Bot):
+    """Запускает фоновую отправку заявок из журнала."""
+    global _dispatcher_task, _wakeup
+    if _dispatcher_task is None:
+        _wakeup = asyncio.Event()
+        _dispatcher_task = asyncio.create_task(_dispatch_loop(bot))
+
+
+async def stop_order_dispatcher():
+    """Останавливает диспетчер; невыполненные операции остаются в журнале до следующего запуска."""
+    global _dispatcher_task, _wakeup, _order_outbox
+    if _dispatcher_task is not None:
+        _dispatcher_task.cancel()
+        try:
+            await _dispatcher_task
+        except asyncio.CancelledError:
+            pass
+        _dispatcher_task = None
+        _wakeup = None
+    if _order_outbox is not None:
+        _order_outbox.close()
+        _order_outbox = None
@@ -0,0 +1,189 @@
+# core/sheet_index.py
+"""
+core/sheet_index.py
+
+Индекс строк листа по ID клиента.
+- При первом обращении загружается из локальной копии (SheetMirror), а если
+  её нет — одним полным чтением листа.
+- Поддерживается в актуальном состоянии записями писателя листа.
+- Фоновая сверка (sync) читает лист и применяет только изменившиеся строки,
+  включая правки, сделанные в таблице вручную. Лист читается целиком, только
+  если изменилась метка таблицы (время изменения) с прошлой сверки.
+"""
+
+import asyncio
+from typing import Awaitable, Callable
+from core.sheet_mirror import SheetMirror
+from core.sheet_schema import SheetSchema, parse_cell
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class SheetIndex:
+    """Кэш строк листа и индекс {ID клиента: номера строк}."""
+
+    def __init__(
+        self,
+        schema: SheetSchema,
+        open_worksheet: Callable[[], Awaitable],
+        mirror: SheetMirror | None = None,
+    ):
+        self.schema = schema
+        self._open_worksheet = open_worksheet
+        self._mirror = mirror
+        self._rows: dict[int, list[str]] = {}
+        self._by_client: dict[str, list[int]] = {}
+        self._loaded = False
+        self._generation = 0  # Увеличивается при каждой записи бота
+        self._synced_marker = None  # Метка таблицы, с которой выполнена последняя сверка
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _client_key(self, row: list) -> str:
+        return str(self.schema.value(row, "ID")).strip()
+
+    def _add_row(self, row_number: int, row: list):
+        self._rows[row_number] = row
+        key = self._client_key(row)
+        if key:
+            row_numbers = self._by_client.setdefault(key, [])
+            row_numbers.append(row_number)
+            row_numbers.sort()
+
+    def _remove_row(self, row_number: int):
+        row = self._rows.pop(row_number, None)
+        if row is None:
+            return
+        row_numbers = self._by_client.get(self._client_key(row), [])
+        if row_number in row_numbers:
+            row_numbers.remove(row_number)
+
+    def _persist(self, changed: dict, removed=(), synced: bool = False):
+        if self._mirror is None:
+            return
+        client_ids = {row_number: self._client_key(row) for row_number, row in changed.items()}
+        self._mirror.apply(self.schema.name, changed, removed, client_ids, synced=synced)
+
+    async def load(self, all_values: list[list[str]]) -> int:
+        """
+        Применяет полное содержимое листа (включая заголовки).
+
+        Returns:
+            int: Количество изменённых, добавленных и удалённых строк.
+        """
+        fresh = {row_number: list(row) for row_number, row in enumerate(all_values[1:], start=2)}
+        changed = {row_number: row for row_number, row in fresh.items() if self._rows.get(row_number) != row}
+        removed = [row_number for row_number in self._rows if row_number not in fresh]
+
+        for row_number in removed:
+            self._remove_row(row_number)
+        for row_number, row in changed.items():
+            self._remove_row(row_number)
+            self._add_row(row_number, row)
+
+        self._loaded = True
+        await asyncio.to_thread(self._persist, changed, removed, True)
+        return len(changed) + len(removed)
+
+    def apply_writes(self, appended: list, updated: dict):
+        """Учитывает записи писателя листа: добавленные строки и обновлённые ячейки."""
+        self._generation += 1
+        if not self._loaded:
+            return
+
+        changed = {}
+        for row_number, row in appended:
+            self._remove_row(row_number)
+            changed[row_number] = ["" if value is None else str(value) for value in row]
+            self._add_row(row_number, changed[row_number])
+
+        for cell, value in updated.items():
+            column_number, row_number = parse_cell(cell)
+            row = self._rows.get(row_number)
+            if row is None:
+                continue
+            self._remove_row(row_number)
+            row = row + [""] * (column_number - len(row))
+            row[column_number - 1] = str(value)
+            changed[row_number] = row
+            self._add_row(row_number, row)
+
+        if changed:
+            self._persist(changed)
+
+    async def ensure_loaded(self):
+        """Загружает индекс из локальной копии или, если её нет, одним чтением листа."""
+        if self._loaded:
+            return
+
+        async with self._lock:
+            if self._loaded:
+                return
+
+            if self._mirror is not None and self._mirror.synced_at(self.schema.name) is not None:
+                rows = await asyncio.to_thread(self._mirror.load_rows, self.schema.name)
+                for row_number, row in rows.items():
+                    self._add_row(row_number, row)
+                self._loaded = True
+                logger.info(f"Индекс листа '{self.schema.name}' загружен из локальной копии: {len(self._rows)} строк.")
+                return
+
+            worksheet = await self._open_worksheet()
+            await self.load(await worksheet.get_all_values())
+            logger.info(f"Индекс листа '{self.schema.name}' построен: {len(self._rows)} строк.")
+
+    async def sync(self, marker=None) -> int:
+        """
+        Сверяет индекс с листом одним чтением и применяет изменённые строки.
+
+        Если во время чтения бот записывал в лист, снимок мог устареть —
+        тогда он отбрасывается до следующей сверки.
+
+        Args:
+            marker: Метка изменения таблицы, прочитанная до сверки. Если она
+                совпадает с меткой прошлой сверки, лист не читается; None — читать всегда.
+
+        Returns:
+            int: Количество применённых изменений.
+        """
+        async with self._lock:
+            if marker is not None and marker == self._synced_marker:
+                return 0
+
+            generation = self._generation
+            worksheet = await self._open_worksheet()
+            all_values = await worksheet.get_all_values()
+            if generation != self._generation:
+                logger.info(f"Лист '{self.schema.name}' изменился во время сверки, сверка отложена.")
+                return 0
+
+            changes = await self.load(all_values)
+            self._synced_marker = marker
+            if changes:
+                logger.info(f"Сверка листа '{self.schema.name}': применено изменений {changes}.")
+            return changes
+
+    async def find(self, client_id) -> tuple[int, list[str]] | None:
+        """Возвращает (номер строки, строка) первой заявки клиента или None."""
+        await self.ensure_loaded()
+        row_numbers = self._by_client.get(str(client_id).strip())
+        if not row_numbers:
+            return None
+        row_number = row_numbers[0]
+        return row_number, self._rows[row_number]
+
+    async def find_order(self, client_id, date: str) -> int | None:
+        """Возвращает номер строки заявки клиента с указанной датой или None."""
+        await self.ensure_loaded()
+        for row_number in self._by_client.get(str(client_id).strip(), []):
+            if self.schema.value(self._rows[row_number], "Дата").strip() == date:
+                return row_number
+        return None
+
+    async def items(self) -> list[tuple[int, list[str]]]:
+        """Возвращает все строки листа (без заголовков) в порядке номеров."""
+        await self.ensure_loaded()
+        return sorted(self._rows.items())
@@ -0,0 +1,95 @@
+# core/sheet_mirror.py
+"""
+core/sheet_mirror.py
+
+Локальная копия листов с заявками в SQLite.
+- Хранит строки листов, чтобы после перезапуска не читать лист целиком.
+- Обновляется синхронно при записях бота и фоновой сверкой с листом.
+"""
+
+import json
+import threading
+import time
+from core.utils.db_utils import DEFAULT_DB_PATH, open_database, transaction
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class SheetMirror:
+    """Строки листов Google Sheets в локальной базе SQLite."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self._lock = threading.Lock()
+        self._connection = open_database(db_path)
+        with self._lock:
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS sheet_rows (
+                    sheet TEXT NOT NULL,
+                    row_number INTEGER NOT NULL,
+                    client_id TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (sheet, row_number)
+                );
+                CREATE INDEX IF NOT EXISTS sheet_rows_client ON sheet_rows (sheet, client_id);
+                CREATE TABLE IF NOT EXISTS sheet_sync (
+                    sheet TEXT PRIMARY KEY,
+                    synced_at REAL NOT NULL
+                );
+                """
+            )
+
+    def load_rows(self, sheet: str) -> dict[int, list[str]]:
+        """Возвращает сохранённые строки листа {номер строки: строка}."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT row_number, data FROM sheet_rows WHERE sheet = ?", (sheet,)
+            ).fetchall()
+        return {row_number: json.loads(data) for row_number, data in rows}
+
+    def synced_at(self, sheet: str) -> float | None:
+        """Время последней полной сверки листа или None, если копии ещё нет."""
+        with self._lock:
+            row = self._connection.execute("SELECT synced_at FROM sheet_sync WHERE sheet = ?", (sheet,)).fetchone()
+        return row[0] if row else None
+
+    def apply(self, sheet: str, changed: dict, removed=(), client_ids: dict = None, synced: bool = False):
+        """
+        Записывает изменения листа одной транзакцией.
+
+        Args:
+            sheet (str): Имя листа.
+            changed (dict): Изменённые строки {номер строки: строка}.
+            removed (Iterable[int]): Номера удалённых строк.
+            client_ids (dict): ID клиента для изменённых строк {номер строки: ID}.
+            synced (bool): Отметить полную сверку с листом.
+        """
+        client_ids = client_ids or {}
+        with self._lock, transaction(self._connection) as db:
+            db.executemany(
+                "DELETE FROM sheet_rows WHERE sheet = ? AND row_number = ?",
+                [(sheet, row_number) for row_number in removed],
+            )
+            db.executemany(
+                """
+                INSERT INTO sheet_rows (sheet, row_number, client_id, data) VALUES (?, ?, ?, ?)
+                ON CONFLICT(sheet, row_number) DO UPDATE SET client_id = excluded.client_id, data = excluded.data
+                """,
+                [
+                    (sheet, row_number, client_ids.get(row_number, ""), json.dumps(row, ensure_ascii=False))
+                    for row_number, row in changed.items()
+                ],
+            )
+            if synced:
+                db.execute(
+                    """
+                    INSERT INTO sheet_sync (sheet, synced_at) VALUES (?, ?)
+                    ON CONFLICT(sheet) DO UPDATE SET synced_at = excluded.synced_at
+                    """,
+                    (sheet, time.time()),
+                )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
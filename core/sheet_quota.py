@@ -0,0 +1,171 @@
+# core/sheet_quota.py
+"""
+core/sheet_quota.py
+
+Планировщик запросов к Google Sheets API с учётом квоты.
+- Квоты на чтение и запись (запросов в минуту на сервисный аккаунт)
+  отслеживаются скользящим окном; запрос сверх квоты ждёт освобождения окна.
+- Ожидающие запросы получают квоту по приоритету: запись заявок клиентов,
+  затем чтение для менеджеров, затем фоновая сверка.
+- Одинаковые чтения, выполняющиеся одновременно, объединяются в один запрос.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Hashable
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+SHEETS_READ_QUOTA = int(os.getenv("SHEETS_READ_QUOTA", "60"))  # Чтений в минуту
+SHEETS_WRITE_QUOTA = int(os.getenv("SHEETS_WRITE_QUOTA", "60"))  # Записей в минуту
+SHEETS_QUOTA_PERIOD = 60.0  # Окно квоты, секунды
+
+PRIORITY_WRITE = 0  # Запись заявок клиентов
+PRIORITY_READ = 1  # Чтение по запросу менеджера
+PRIORITY_SYNC = 2  # Фоновая сверка
+
+READ = "read"
+WRITE = "write"
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("sheets_priority", default=PRIORITY_READ)
+
+
+@contextlib.contextmanager
+def sheets_priority(priority: int):
+    """Задаёт приоритет запросов к Sheets, выполняемых внутри блока."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class SlidingWindow:
+    """Не больше limit запросов за последние period секунд."""
+
+    def __init__(self, limit: int, period: float = SHEETS_QUOTA_PERIOD):
+        self.limit = limit
+        self.period = period
+        self._calls: deque[float] = deque()
+
+    def delay(self, cost: int = 1) -> float:
+        """Сколько секунд ждать, пока в окне освободится место для cost запросов."""
+        now = time.monotonic()
+        while self._calls and self._calls[0] <= now - self.period:
+            self._calls.popleft()
+        cost = min(cost, self.limit)
+        free = self.limit - len(self._calls)
+        if free >= cost:
+            return 0.0
+        return self._calls[cost - free - 1] + self.period - now
+
+    def take(self, cost: int = 1):
+        now = time.monotonic()
+        self._calls.extend([now] * min(cost, self.limit))
+
+
+class QuotaScheduler:
+    """Выдаёт квоту Sheets API запросам в порядке приоритета и объединяет одинаковые чтения."""
+
+    def __init__(self, read_quota: int = SHEETS_READ_QUOTA, write_quota: int = SHEETS_WRITE_QUOTA):
+        self._windows = {READ: SlidingWindow(read_quota), WRITE: SlidingWindow(write_quota)}
+        self._waiters: dict[str, list] = {READ: [], WRITE: []}  # Кучи (приоритет, номер, стоимость, future)
+        self._drain_tasks: dict[str, asyncio.Task] = {}
+        self._counter = itertools.count()
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.calls = {READ: 0, WRITE: 0}
+        self.throttled = 0  # Запросов, ждавших квоту
+        self.coalesced = 0  # Чтений, получивших результат чужого запроса
+
+    async def acquire(self, kind: str, cost: int = 1, priority: int | None = None):
+        """Дожидается квоты на cost запросов вида kind (READ или WRITE)."""
+        if priority is None:
+            priority = _priority.get()
+        window, waiters = self._windows[kind], self._waiters[kind]
+        self.calls[kind] += cost
+        if not waiters and window.delay(cost) == 0:
+            window.take(cost)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(waiters, (priority, next(self._counter), cost, future))
+        self.throttled += 1
+        task = self._drain_tasks.get(kind)
+        if task is None or task.done():
+            self._drain_tasks[kind] = asyncio.create_task(self._drain(kind))
+        await future
+
+    async def _drain(self, kind: str):
+        window, waiters = self._windows[kind], self._waiters[kind]
+        while waiters:
+            priority, _, cost, future = waiters[0]
+            if future.done():  # Запрос отменён
+                heapq.heappop(waiters)
+                continue
+            wait = window.delay(cost)
+            if wait > 0:
+                logger.info(f"Квота Sheets ({kind}) исчерпана, ожидающих запросов: {len(waiters)}, ждём {wait:.1f} с.")
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(waiters)
+            window.take(cost)
+            future.set_result(None)
+
+    async def run(self, kind: str, call: Callable[[], Awaitable], key: Hashable | None = None, cost: int = 1):
+        """
+        Выполняет запрос после получения квоты.
+
+        Args:
+            kind (str): READ или WRITE.
+            call (Callable[[], Awaitable]): Сам запрос.
+            key (Hashable | None): Ключ чтения; одновременные чтения с одинаковым
+                ключом выполняются одним запросом.
+            cost (int): Сколько запросов квоты расходует вызов.
+        """
+        if kind != READ or key is None:
+            await self.acquire(kind, cost)
+            return await call()
+
+        while (leader := self._inflight.get(key)) is not None:
+            try:
+                result = await asyncio.shield(leader)
+            except asyncio.CancelledError:
+                if not leader.cancelled():
+                    raise
+                continue  # Отменён запрос-ведущий, а не этот: выполняем чтение заново
+            self.coalesced += 1
+            return result
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            await self.acquire(kind, cost)
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Ошибку получат ожидающие; без них она уже передана вызывающему
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "reads": self.calls[READ],
+            "writes": self.calls[WRITE],
+            "throttled": self.throttled,
+            "coalesced": self.coalesced,
+            "waiting": sum(len(waiters) for waiters in self._waiters.values()),
+        }
@@ -0,0 +1,124 @@
+# core/sheet_schema.py
+"""
+core/sheet_schema.py
+
+Реестр структуры листов с заявками.
+- Имена столбцов и их порядок для каждого листа.
+- Перевод имени столбца в индекс и букву A1 (A … Z, AA, AB, …) и обратно.
+- Сборка строки для записи и разбор прочитанной строки.
+"""
+
+import re
+
+WHOLESALE_SHEET = "Оптовые клиенты"
+RETAIL_SHEET = "Розничные клиенты"
+
+_CELL_RE = re.compile(r"^([A-Z]+)(\d+)$")
+
+
+def column_letter(number: int) -> str:
+    """
+    Возвращает букву столбца в нотации A1.
+
+    Args:
+        number (int): Номер столбца, начиная с 1.
+
+    Returns:
+        str: Буква столбца (1 → A, 26 → Z, 27 → AA).
+    """
+    if number < 1:
+        raise ValueError(f"Номер столбца должен быть положительным: {number}")
+
+    letters = ""
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def parse_cell(cell: str) -> tuple[int, int]:
+    """
+    Разбирает адрес ячейки в нотации A1.
+
+    Args:
+        cell (str): Адрес ячейки, например 'AB12'.
+
+    Returns:
+        tuple[int, int]: Номер столбца и номер строки (оба с 1).
+    """
+    match = _CELL_RE.match(cell)
+    if not match:
+        raise ValueError(f"Некорректный адрес ячейки: {cell}")
+
+    letters, row_number = match.groups()
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - 64
+    return number, int(row_number)
+
+
+class SheetSchema:
+    """Описание столбцов листа Google Sheets."""
+
+    def __init__(self, name: str, headers: list[str]):
+        self.name = name
+        self.headers = tuple(headers)
+        self._indexes = {header: i for i, header in enumerate(self.headers)}
+
+    def __repr__(self):
+        return f"SheetSchema({self.name!r}, {list(self.headers)!r})"
+
+    def index(self, column: str) -> int:
+        """Индекс столбца в строке (с 0)."""
+        try:
+            return self._indexes[column]
+        except KeyError:
+            raise KeyError(f"Столбец '{column}' не найден в листе '{self.name}'.")
+
+    def letter(self, column: str) -> str:
+        """Буква столбца в нотации A1."""
+        return column_letter(self.index(column) + 1)
+
+    def cell(self, column: str, row_number: int) -> str:
+        """Адрес ячейки в нотации A1, например 'J5'."""
+        return f"{self.letter(column)}{row_number}"
+
+    @property
+    def header_range(self) -> str:
+        """Диапазон строки заголовков, например 'A1:J1'."""
+        return f"A1:{column_letter(len(self.headers))}1"
+
+    def build_row(self, values: dict) -> list:
+        """Собирает строку для записи в порядке столбцов листа."""
+        unknown = set(values) - set(self.headers)
+        if unknown:
+            raise KeyError(f"Неизвестные столбцы для листа '{self.name}': {sorted(unknown)}")
+        return [values.get(header, "") for header in self.headers]
+
+    def value(self, row: list, column: str, default: str = "") -> str:
+        """Возвращает значение столбца из прочитанной строки (короткие строки допустимы)."""
+        index = self.index(column)
+        return row[index] if index < len(row) else default
+
+    def row_to_dict(self, row: list) -> dict:
+        """Преобразует прочитанную строку в словарь {столбец: значение}."""
+        return {header: self.value(row, header) for header in self.headers}
+
+
+WHOLESALE_SCHEMA = SheetSchema(
+    WHOLESALE_SHEET,
+    ["Имя клиента", "ID", "Проект", "Файлы", "Комментарий", "Контакты", "Дата", "Кол-во", "Статус"],
+)
+RETAIL_SCHEMA = SheetSchema(
+    RETAIL_SHEET,
+    ["Имя клиента", "ID", "Проект", "Кладбище", "Файлы", "Комментарий", "Контакты", "Дата", "Кол-во", "Статус"],
+)
+
+SHEET_SCHEMAS = {schema.name: schema for schema in (WHOLESALE_SCHEMA, RETAIL_SCHEMA)}
+
+def get_schema(sheet_name: str) -> SheetSchema:
+    """Возвращает схему листа по его имени."""
+    try:
+        return SHEET_SCHEMAS[sheet_name]
+    except KeyError:
+        raise KeyError(f"Схема для листа '{sheet_name}' не зарегистрирована.")
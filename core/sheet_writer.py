@@ -0,0 +1,188 @@
+# core/sheet_writer.py
+"""
+core/sheet_writer.py
+
+Единственный писатель для каждого листа Google Sheets.
+- Добавления строк и обновления ячеек ставятся в очередь.
+- Очередь сбрасывается пачкой: не позже SHEET_WRITE_WINDOW секунд или при
+  накоплении SHEET_WRITE_BATCH_SIZE операций — один append_rows и один
+  batch_update на пачку.
+- Все записи листа идут последовательно, поэтому номера строк не «гоняются».
+"""
+
+import asyncio
+import os
+import re
+from typing import Awaitable, Callable
+from core.sheet_quota import PRIORITY_WRITE, sheets_priority
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+SHEET_WRITE_WINDOW = float(os.getenv("SHEET_WRITE_WINDOW", "0.5"))  # Окно накопления, секунды
+SHEET_WRITE_BATCH_SIZE = int(os.getenv("SHEET_WRITE_BATCH_SIZE", "50"))
+
+# Из ответа append: "'Розничные клиенты'!A5:J7" → 5
+_UPDATED_RANGE_ROW = re.compile(r"![A-Z]+(\d+)")
+
+APPEND = "append"
+UPDATE = "update"
+_STOP = object()  # Сигнал остановки писателя
+
+
+def parse_first_row(updated_range: str) -> int:
+    """Возвращает номер первой строки из диапазона A1, возвращённого Sheets API."""
+    match = _UPDATED_RANGE_ROW.search(updated_range)
+    if not match:
+        raise ValueError(f"Не удалось определить строку из диапазона: {updated_range}")
+    return int(match.group(1))
+
+
+class SheetWriter:
+    """
+    Очередь записи одного листа.
+
+    append() и update() сразу ставят операцию в очередь и возвращают future:
+    append — с номером добавленной строки, update — None после записи.
+    """
+
+    def __init__(
+        self,
+        sheet_name: str,
+        open_worksheet: Callable[[], Awaitable],
+        window: float = SHEET_WRITE_WINDOW,
+        batch_size: int = SHEET_WRITE_BATCH_SIZE,
+    ):
+        self.sheet_name = sheet_name
+        self.window = window
+        self.batch_size = batch_size
+        self._open_worksheet = open_worksheet
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._listeners: list[Callable] = []
+
+    def add_listener(self, listener: Callable):
+        """
+        Регистрирует обработчик успешно записанных операций.
+
+        Вызывается как listener(appended, updated), где appended — список
+        (номер строки, строка), а updated — словарь {ячейка A1: значение}.
+        """
+        self._listeners.append(listener)
+
+    def _enqueue(self, kind: str, payload) -> asyncio.Future:
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((kind, payload, future))
+        return future
+
+    def append(self, row: list) -> asyncio.Future:
+        """Ставит строку в очередь на добавление; future вернёт номер строки."""
+        return self._enqueue(APPEND, row)
+
+    def update(self, cell: str, value) -> asyncio.Future:
+        """Ставит обновление ячейки в очередь; обновления одной ячейки объединяются."""
+        return self._enqueue(UPDATE, (cell, value))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = loop.time() + self.window
+            stopping = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: list):
+        with sheets_priority(PRIORITY_WRITE):  # Запись заявок получает квоту раньше чтений
+            await self._flush_batch(batch)
+
+    async def _flush_batch(self, batch: list):
+        appends = [(row, future) for kind, row, future in batch if kind == APPEND]
+        updates = [(payload, future) for kind, payload, future in batch if kind == UPDATE]
+
+        try:
+            worksheet = await self._open_worksheet()
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        appended = await self._flush_appends(worksheet, appends)
+        updated = await self._flush_updates(worksheet, updates)
+
+        for listener in self._listeners:
+            try:
+                listener(appended, updated)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика записи листа '{self.sheet_name}': {e}", exc_info=True)
+
+    async def _flush_appends(self, worksheet, appends: list) -> list:
+        if not appends:
+            return []
+        rows = [row for row, _ in appends]
+        try:
+            response = await worksheet.append_rows(rows)
+            first_row = parse_first_row(response["updates"]["updatedRange"])
+        except Exception as e:
+            logger.error(f"Ошибка добавления {len(rows)} строк в '{self.sheet_name}': {e}", exc_info=True)
+            for _, future in appends:
+                if not future.done():
+                    future.set_exception(e)
+            return []
+
+        appended = []
+        for offset, (row, future) in enumerate(appends):
+            row_number = first_row + offset
+            appended.append((row_number, row))
+            if not future.done():
+                future.set_result(row_number)
+        logger.info(f"Добавлено строк в '{self.sheet_name}': {len(rows)} (с {first_row}).")
+        return appended
+
+    async def _flush_updates(self, worksheet, updates: list) -> dict:
+        if not updates:
+            return {}
+        # Более поздние обновления ячейки перекрывают ранние
+        values = {cell: value for (cell, value), _ in updates}
+        try:
+            await worksheet.batch_update([{"range": cell, "values": [[value]]} for cell, value in values.items()])
+        except Exception as e:
+            logger.error(f"Ошибка обновления {len(values)} ячеек в '{self.sheet_name}': {e}", exc_info=True)
+            for _, future in updates:
+                if not future.done():
+                    future.set_exception(e)
+            return {}
+
+        for _, future in updates:
+            if not future.done():
+                future.set_result(None)
+        logger.info(f"Обновлено ячеек в '{self.sheet_name}': {len(values)}.")
+        return values
+
+    async def stop(self):
+        """Дожидается записи всех операций из очереди и останавливает писателя."""
+        if self._task is None:
+            return
+        self._queue.put_nowait(_STOP)
+        await self._task
+        self._task = None
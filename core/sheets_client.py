@@ -0,0 +1,183 @@
+# core/sheets_client.py
+"""
+core/sheets_client.py
+
+Асинхронный клиент Google Sheets API v4 поверх aiogoogle (aiohttp).
+- Запросы идут напрямую через aiohttp, без пула потоков и синхронного gspread.
+- Клиент aiogoogle с общим пулом соединений и кэшем токена передаётся
+  извне (core.http_pool.get_google_client).
+- Таблица и листы повторяют методы gspread, которыми пользуется бот:
+  worksheet, add_worksheet, row_values, get_all_values, append_row(s),
+  update, batch_update.
+- Каждый запрос передаётся функции call(вид, запрос, ключ, идемпотентность),
+  через которую вызывающий код подключает квоту, повторы и объединение чтений.
+  Добавление строк и создание листа неидемпотентны: после таймаута их нельзя
+  повторять вслепую.
+"""
+
+from typing import Awaitable, Callable
+from urllib.parse import quote, urlencode
+from aiogoogle import Aiogoogle
+from aiogoogle.models import Request
+from core.sheet_quota import READ, WRITE
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"  # Время изменения таблицы есть только в Drive API
+VALUE_INPUT_OPTION = "RAW"  # Как у gspread: значения записываются без разбора формул и дат
+
+
+class WorksheetNotFound(Exception):
+    """В таблице нет листа с таким названием."""
+
+
+def absolute_range(title: str, cell_range: str | None = None) -> str:
+    """Диапазон A1 с названием листа: 'Лист 1'!A1:B2."""
+    quoted = "'{}'".format(title.replace("'", "''"))
+    return f"{quoted}!{cell_range}" if cell_range else quoted
+
+
+def _fill_gaps(rows: list[list]) -> list[list]:
+    """Дополняет строки пустыми значениями до одинаковой длины, как gspread."""
+    width = max((len(row) for row in rows), default=0)
+    return [row + [""] * (width - len(row)) for row in rows]
+
+
+async def _call_directly(kind: str, send: Callable[[], Awaitable], key=None, idempotent: bool = True):
+    return await send()
+
+
+class SheetsClient:
+    """Клиент Sheets API v4 от имени сервисного аккаунта."""
+
+    def __init__(self, aiogoogle: Aiogoogle, call: Callable[..., Awaitable] = _call_directly):
+        self.aiogoogle = aiogoogle
+        self._call = call
+
+    async def request(
+        self,
+        kind: str,
+        method: str,
+        path: str,
+        params: dict | None = None,
+        body: dict | None = None,
+        idempotent: bool = True,
+        base_url: str = SHEETS_API_URL,
+    ):
+        """
+        Выполняет запрос к Sheets API и возвращает JSON ответа.
+
+        Args:
+            kind (str): READ или WRITE — какую квоту расходует запрос.
+            method (str): HTTP-метод.
+            path (str): Путь относительно base_url.
+            params (dict | None): Параметры строки запроса.
+            body (dict | None): Тело запроса.
+            idempotent (bool): Повторный запрос не меняет результат (чтение, запись значений в диапазон).
+            base_url (str): Адрес API; по умолчанию SHEETS_API_URL.
+        """
+        url = f"{base_url}/{path}"
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        # Запрос создаётся заново при каждой попытке: aiogoogle дописывает в него токен
+        send = lambda: self.aiogoogle.as_service_account(Request(method=method, url=url, json=body))
+        key = (method, url) if kind == READ else None
+        return await self._call(kind, send, key, idempotent)
+
+    async def open_by_key(self, spreadsheet_id: str) -> "Spreadsheet":
+        """Открывает таблицу и загружает список её листов."""
+        spreadsheet = Spreadsheet(self, spreadsheet_id)
+        await spreadsheet.fetch_sheet_metadata()
+        return spreadsheet
+
+
+class Spreadsheet:
+    """Таблица Google Sheets."""
+
+    def __init__(self, client: SheetsClient, spreadsheet_id: str):
+        self.client = client
+        self.id = spreadsheet_id
+        self._sheets: dict[str, dict] = {}  # Свойства листов по названию
+
+    async def fetch_sheet_metadata(self):
+        response = await self.client.request(READ, "GET", quote(self.id), {"fields": "sheets.properties"})
+        self._sheets = {sheet["properties"]["title"]: sheet["properties"] for sheet in response.get("sheets", [])}
+
+    async def modified_time(self) -> str:
+        """Время последнего изменения таблицы (files.get Drive API): дешёвая проверка перед полным чтением листов."""
+        response = await self.client.request(
+            READ, "GET", quote(self.id), {"fields": "modifiedTime", "supportsAllDrives": "true"},
+            base_url=DRIVE_FILES_URL,
+        )
+        return response["modifiedTime"]
+
+    async def worksheet(self, title: str) -> "Worksheet":
+        """Возвращает лист по названию; список листов перечитывается, если лист не найден."""
+        if title not in self._sheets:
+            await self.fetch_sheet_metadata()
+        properties = self._sheets.get(title)
+        if properties is None:
+            raise WorksheetNotFound(title)
+        return Worksheet(self, properties)
+
+    async def add_worksheet(self, title: str, rows: int, cols: int) -> "Worksheet":
+        body = {
+            "requests": [
+                {"addSheet": {"properties": {"title": title, "gridProperties": {"rowCount": rows, "columnCount": cols}}}}
+            ]
+        }
+        response = await self.client.request(
+            WRITE, "POST", f"{quote(self.id)}:batchUpdate", body=body, idempotent=False
+        )
+        properties = response["replies"][0]["addSheet"]["properties"]
+        self._sheets[title] = properties
+        return Worksheet(self, properties)
+
+
+class Worksheet:
+    """Лист таблицы Google Sheets."""
+
+    def __init__(self, spreadsheet: Spreadsheet, properties: dict):
+        self.spreadsheet = spreadsheet
+        self.spreadsheet_id = spreadsheet.id
+        self.id = properties.get("sheetId")
+        self.title = properties["title"]
+
+    def _values_path(self, cell_range: str | None = None, suffix: str = "") -> str:
+        return f"{quote(self.spreadsheet_id)}/values/{quote(absolute_range(self.title, cell_range), safe='')}{suffix}"
+
+    async def get_all_values(self) -> list[list[str]]:
+        response = await self.spreadsheet.client.request(READ, "GET", self._values_path())
+        return _fill_gaps(response.get("values", []))
+
+    async def row_values(self, row: int) -> list[str]:
+        response = await self.spreadsheet.client.request(READ, "GET", self._values_path(f"{row}:{row}"))
+        values = response.get("values", [])
+        return values[0] if values else []
+
+    async def append_rows(self, rows: list[list]) -> dict:
+        """Добавляет строки после последней заполненной; ответ содержит updates.updatedRange."""
+        return await self.spreadsheet.client.request(
+            WRITE, "POST", self._values_path(suffix=":append"),
+            {"valueInputOption": VALUE_INPUT_OPTION}, {"values": rows}, idempotent=False,
+        )
+
+    async def append_row(self, row: list) -> dict:
+        return await self.append_rows([row])
+
+    async def update(self, cell_range: str, values: list[list]) -> dict:
+        return await self.spreadsheet.client.request(
+            WRITE, "PUT", self._values_path(cell_range), {"valueInputOption": VALUE_INPUT_OPTION}, {"values": values}
+        )
+
+    async def batch_update(self, data: list[dict]) -> dict:
+        """Записывает несколько диапазонов одним запросом: [{"range": "C2", "values": [[...]]}]."""
+        body = {
+            "valueInputOption": VALUE_INPUT_OPTION,
+            "data": [{"range": absolute_range(self.title, item["range"]), "values": item["values"]} for item in data],
+        }
+        return await self.spreadsheet.client.request(
+            WRITE, "POST", f"{quote(self.spreadsheet_id)}/values:batchUpdate", body=body
+        )
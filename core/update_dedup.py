@@ -0,0 +1,126 @@
+# core/update_dedup.py
+"""
+core/update_dedup.py
+
+Отсев повторно доставленных обновлений Telegram.
+- Telegram повторяет доставку, если вебхук ответил не сразу; повтор не должен
+  снова записывать заявку в таблицу и уведомлять менеджера.
+- Хранится скользящее окно последних UPDATE_DEDUP_WINDOW значений update_id
+  (кольцевой буфер + множество для проверки за O(1)).
+- Окно дублируется в SQLite, чтобы повторы после перезапуска тоже отсеивались.
+  Принятые update_id записываются в базу не в обработчике вебхука, а пачкой
+  раз в UPDATE_DEDUP_FLUSH_INTERVAL в отдельном потоке.
+"""
+
+import os
+import threading
+from collections import deque
+from core.utils.db_utils import DEFAULT_DB_PATH, WriteBehindBuffer, open_database, transaction
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", "10000"))
+UPDATE_DEDUP_PERSIST = os.getenv("UPDATE_DEDUP_PERSIST", "1") == "1"
+UPDATE_DEDUP_FLUSH_INTERVAL = float(os.getenv("UPDATE_DEDUP_FLUSH_INTERVAL", "1.0"))  # Секунды между записями в базу
+
+
+class UpdateDeduplicator:
+    """
+    Скользящее окно недавно принятых update_id.
+
+    remember только ставит update_id в очередь на запись; после start() очередь
+    сбрасывается в фоне, до start() — сразу при вызове.
+    """
+
+    def __init__(
+        self,
+        window: int = UPDATE_DEDUP_WINDOW,
+        db_path: str | None = None,
+        flush_interval: float = UPDATE_DEDUP_FLUSH_INTERVAL,
+    ):
+        self.window = window
+        self.duplicates = 0  # Сколько повторов отсеяно с момента запуска
+        self._order: deque[int] = deque()
+        self._seen: set[int] = set()
+        self._lock = threading.Lock()
+        self._connection = None
+        self._inserted = 0
+        # Принятые update_id {update_id: начало окна на момент приёма}
+        self._writes = WriteBehindBuffer(self._write, flush_interval, "принятые обновления")
+        if db_path:
+            self._open(db_path)
+
+    def _open(self, db_path: str):
+        self._connection = open_database(db_path)
+        with self._lock:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY)")
+            rows = self._connection.execute(
+                "SELECT update_id FROM seen_updates ORDER BY update_id DESC LIMIT ?", (self.window,)
+            ).fetchall()
+        for (update_id,) in reversed(rows):
+            self._append(update_id)
+        logger.info(f"Загружено принятых обновлений: {len(rows)}.")
+
+    def _append(self, update_id: int):
+        self._order.append(update_id)
+        self._seen.add(update_id)
+        if len(self._order) > self.window:
+            self._seen.discard(self._order.popleft())
+
+    def is_duplicate(self, update_id) -> bool:
+        """Проверяет, принималось ли обновление раньше (в пределах окна)."""
+        if update_id is None or update_id not in self._seen:
+            return False
+        self.duplicates += 1
+        logger.info(f"Повторная доставка обновления {update_id} отброшена.")
+        return True
+
+    def remember(self, update_id):
+        """Отмечает обновление как принятое; в базу оно попадёт со следующей пачкой."""
+        if update_id is None or update_id in self._seen:
+            return
+        self._append(update_id)
+        if self._connection is None:
+            return
+        self._writes.put(update_id, self._order[0])
+
+    def _write(self, update_ids: dict[int, int]):
+        with self._lock, transaction(self._connection) as db:
+            db.executemany("INSERT OR IGNORE INTO seen_updates (update_id) VALUES (?)", [(i,) for i in update_ids])
+            self._inserted += len(update_ids)
+            if self._inserted >= self.window:
+                # Таблица не растёт дальше окна: удаляем вытесненные из него записи
+                self._inserted = 0
+                db.execute("DELETE FROM seen_updates WHERE update_id < ?", (max(update_ids.values()),))
+
+    def flush_pending(self):
+        """Синхронно записывает накопленные update_id."""
+        self._writes.flush_pending()
+
+    async def flush(self):
+        """Записывает накопленные update_id в отдельном потоке."""
+        await self._writes.flush()
+
+    async def start(self):
+        """Запускает фоновую запись принятых update_id."""
+        if self._connection is not None:
+            self._writes.start()
+
+    async def stop(self):
+        """Останавливает фоновую запись, сбрасывает очередь и закрывает базу."""
+        if self._connection is not None:
+            await self._writes.stop()
+        self.close()
+
+    def close(self):
+        if self._connection is None:
+            return
+        with self._lock:
+            self._connection.close()
+        self._connection = None
+
+
+def create_update_deduplicator() -> UpdateDeduplicator:
+    """Создаёт фильтр повторов; окно сохраняется в базу при UPDATE_DEDUP_PERSIST=1."""
+    return UpdateDeduplicator(db_path=DEFAULT_DB_PATH if UPDATE_DEDUP_PERSIST else None)
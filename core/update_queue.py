@@ -0,0 +1,126 @@
+# core/update_queue.py
+"""
+core/update_queue.py
+
+Фоновая обработка обновлений Telegram.
+- Вебхук сразу отвечает Telegram, а обновление ставится в очередь.
+- Обновления одного чата обрабатываются строго по порядку, разные чаты —
+  параллельно, не более WEBHOOK_WORKERS одновременно.
+- Очередь ограничена WEBHOOK_QUEUE_SIZE обновлениями.
+"""
+
+import asyncio
+import os
+from collections import deque
+from typing import Awaitable, Callable
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WORKERS_STOP_TIMEOUT = 30  # Секунды на обработку очереди при остановке
+
+
+def get_update_chat_key(update: dict):
+    """
+    Определяет чат, к которому относится обновление.
+
+    Args:
+        update (dict): Обновление Telegram в виде JSON.
+
+    Returns:
+        Ключ чата (ID чата или пользователя) или update_id, если чат не найден.
+    """
+    for payload in update.values():
+        if not isinstance(payload, dict):
+            continue
+        if isinstance(payload.get("chat"), dict):
+            return payload["chat"]["id"]
+        message = payload.get("message")
+        if isinstance(message, dict) and isinstance(message.get("chat"), dict):
+            return message["chat"]["id"]
+        if isinstance(payload.get("from"), dict):
+            return payload["from"]["id"]
+    return ("update", update.get("update_id"))
+
+
+class UpdateWorkerPool:
+    """Ограниченный пул обработчиков с сохранением порядка внутри чата."""
+
+    def __init__(
+        self,
+        handler: Callable[[dict], Awaitable],
+        workers: int = WEBHOOK_WORKERS,
+        max_queued: int = WEBHOOK_QUEUE_SIZE,
+    ):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._handler = handler
+        self._pending: dict = {}  # Ключ чата → очередь его обновлений
+        self._ready: asyncio.Queue | None = None  # Чаты, ожидающие свободного обработчика
+        self._tasks: list[asyncio.Task] = []
+        self._queued = 0
+
+    @property
+    def queued(self) -> int:
+        """Количество обновлений, ожидающих обработки."""
+        return self._queued
+
+    def start(self):
+        """Запускает обработчики."""
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Запущено обработчиков обновлений: {self.workers}.")
+
+    def submit(self, update: dict) -> bool:
+        """
+        Ставит обновление в очередь.
+
+        Returns:
+            bool: False, если очередь переполнена и обновление не принято.
+        """
+        if self._queued >= self.max_queued:
+            logger.warning(f"Очередь обновлений переполнена ({self._queued}), обновление отклонено.")
+            return False
+
+        key = get_update_chat_key(update)
+        self._queued += 1
+        updates = self._pending.get(key)
+        if updates is not None:
+            updates.append(update)  # Чат уже в работе или ожидает обработчика
+        else:
+            self._pending[key] = deque([update])
+            self._ready.put_nowait(key)
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            updates = self._pending[key]
+            while updates:
+                update = updates.popleft()
+                self._queued -= 1
+                try:
+                    await self._handler(update)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}", exc_info=True)
+            del self._pending[key]
+
+    async def stop(self, timeout: float = WORKERS_STOP_TIMEOUT):
+        """Дожидается обработки очереди (не дольше timeout) и останавливает обработчики."""
+        if not self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._pending and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        if self._pending:
+            logger.warning(f"Остановка с необработанными обновлениями: {self._queued}.")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,138 @@
+# core/utils/db_utils.py
+import asyncio
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Callable
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+DATA_DIR = os.getenv("DATA_DIR", "data")
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, "bot.sqlite3")
+
+def open_database(db_path: str = DEFAULT_DB_PATH) -> sqlite3.Connection:
+    """
+    Открывает локальную базу SQLite в режиме WAL.
+
+    WAL позволяет читать базу параллельно с записью (в том числе из нескольких
+    процессов), а synchronous=NORMAL сохраняет устойчивость к падению процесса
+    без fsync на каждую транзакцию.
+
+    Args:
+        db_path (str): Путь к файлу базы данных.
+
+    Returns:
+        sqlite3.Connection: Открытое соединение.
+    """
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA busy_timeout=30000")
+    logger.info(f"Открыта база данных {db_path}.")
+    return connection
+
+@contextmanager
+def transaction(connection: sqlite3.Connection):
+    """Выполняет блок в одной транзакции: всё или ничего."""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    else:
+        connection.execute("COMMIT")
+
+
+class WriteBehindBuffer:
+    """
+    Отложенная запись в базу.
+
+    Изменения копятся в словаре {ключ: значение} (повторные записи одного ключа
+    объединяются) и передаются функции write одной пачкой. До start() пачка
+    записывается сразу при добавлении; после — фоновой задачей в отдельном
+    потоке, не чаще раза в flush_interval. stop() останавливает задачу и
+    дописывает остаток. При ошибке записи изменения возвращаются в буфер.
+    """
+
+    def __init__(self, write: Callable[[dict], None], flush_interval: float, name: str):
+        self.flush_interval = flush_interval
+        self.name = name  # Для сообщений об ошибках
+        self.pending: dict = {}
+        self._write = write
+        self._wakeup: asyncio.Event | None = None
+        self._flush_task: asyncio.Task | None = None
+
+    def put(self, key, value=None):
+        """Ставит изменение в очередь на запись."""
+        self.pending[key] = value
+        if self._flush_task is None:
+            self.flush_pending()
+        else:
+            self._wakeup.set()
+
+    def _take(self) -> dict:
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def _restore(self, pending: dict):
+        # Более свежие изменения, поступившие во время записи, не затираются
+        self.pending = {**pending, **self.pending}
+
+    def flush_pending(self):
+        """Синхронно записывает накопленные изменения."""
+        if not self.pending:
+            return
+        pending = self._take()
+        try:
+            self._write(pending)
+        except Exception:
+            self._restore(pending)
+            raise
+
+    async def flush(self):
+        """Записывает накопленные изменения в отдельном потоке."""
+        if not self.pending:
+            return
+        pending = self._take()
+        try:
+            await asyncio.to_thread(self._write, pending)
+        except Exception:
+            self._restore(pending)
+            raise
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.flush_interval)  # Окно для объединения записей
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи ({self.name}): {e}", exc_info=True)
+                self._wakeup.set()
+
+    def start(self):
+        """Запускает фоновую запись."""
+        if self._flush_task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        if self.pending:
+            self._wakeup.set()
+
+    async def stop(self):
+        """Останавливает фоновую запись и дописывает остаток."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
@@ -1,47 +1,265 @@
 # core/utils/file_utils.py
+import asyncio
+import json
 import os
+import re
+import time
+import uuid
 from aiogram import Bot, types
 from datetime import datetime
 from core.utils.logging_utils import setup_logger
+from core.utils.telegram_file_cache import get_telegram_file_cache
 
 logger = setup_logger(__name__)
 
-async def save_file(message: types.Message, bot: Bot, upload_dir: str = "uploads") -> str:
+UPLOAD_DIR = "uploads"
+BLOBS_DIR = "blobs"  # Содержимое файлов по file_unique_id
+ORDERS_DIR = "orders"  # Манифесты заявок: какие файлы и под какими именами в них входят
+_EXTENSION_RE = re.compile(r"^\.[a-z0-9]{1,10}$")
+
+DOWNLOAD_WAIT_TIMEOUT = float(os.getenv("DOWNLOAD_WAIT_TIMEOUT", "30"))  # Секунды ожидания загрузок при оформлении заявки
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "4"))  # Одновременных загрузок из Telegram
+FILE_PIPELINE = os.getenv("FILE_PIPELINE", "local")  # local — на диск; drive — напрямую в Google Drive
+DOWNLOAD_RESULT_TTL = float(os.getenv("DOWNLOAD_RESULT_TTL", "3600"))  # Секунды хранения итогов загрузок без заявки
+
+_download_semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+# Незавершённые загрузки пользователей: {user_id: {ключ: задача}}
+_pending_downloads: dict[int, dict[str, asyncio.Task]] = {}
+# Итоги завершённых загрузок, которые ещё не забрала заявка: неудачные (None) и сохранённые
+# не под своим ключом (Drive). {user_id: {ключ: (расположение, время завершения)}}
+_download_results: dict[int, dict[str, tuple[str | None, float]]] = {}
+# Загрузки, которые отменяются, если заявка оформлена без них (передача в Drive)
+_cancel_on_timeout: set[asyncio.Task] = set()
+# Загрузки в хранилище, выполняющиеся сейчас: {путь: задача}; общие для всех пользователей
+_blob_downloads: dict[str, asyncio.Task] = {}
+
+
+def get_file_destination(message: types.Message, upload_dir: str = UPLOAD_DIR):
     """
-    Сохраняет фотографию или документ, отправленный пользователем, в локальной директории.
+    Определяет файл сообщения, путь его содержимого в хранилище и исходное имя.
+
+    Содержимое хранится по file_unique_id Telegram: повторно отправленный или
+    пересланный файл указывает на уже сохранённый объект.
 
     Args:
         message (types.Message): Telegram message object.
-        bot (Bot): Экземпляр aiogram.Bot.
         upload_dir (str): Базовая директория для сохранения загруженных файлов.
 
     Returns:
-        str: Путь к сохранённому файлу.
+        tuple: Объект файла Telegram (PhotoSize или Document), путь к файлу в хранилище
+            и имя файла для показа пользователю.
     """
     user_id = message.from_user.id
-    user_folder = os.path.join(upload_dir, str(user_id))
-    os.makedirs(user_folder, exist_ok=True)
-    logger.info(f"Создана директория для пользователя {user_id} в {user_folder}.")
 
     if message.photo:
         # Save the highest-quality photo
         file = message.photo[-1]
-        file_name = f"photo_{file.file_id}.jpg"
-        file_path = os.path.join(user_folder, file_name)
+        file_name = f"photo_{file.file_unique_id}.jpg"
     elif message.document:
         # Save the document
         file = message.document
-        file_name = file.file_name or f"document_{file.file_id}"
-        file_path = os.path.join(user_folder, file_name)
+        file_name = file.file_name or f"document_{file.file_unique_id}"
     else:
         logger.warning(f"Сообщение от пользователя {user_id} не содержит поддерживаемых медиа.")
         raise ValueError("Сообщение не содержит поддерживаемых медиафайлов.")
 
+    extension = os.path.splitext(file_name)[1].lower()
+    if not _EXTENSION_RE.match(extension):
+        extension = ""
+    return file, os.path.join(upload_dir, BLOBS_DIR, f"{file.file_unique_id}{extension}"), file_name
+
+
+async def _download(bot: Bot, file_id: str, blob_path: str) -> str:
+    if os.path.exists(blob_path):
+        logger.info(f"Файл {blob_path} уже сохранён, загрузка не требуется.")
+        return blob_path
+
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    temp_path = f"{blob_path}.{uuid.uuid4().hex}.part"
     try:
-        file_info = await bot.get_file(file.file_id)
-        await bot.download_file(file_info.file_path, destination=file_path)
-        logger.info(f"Файл {file_name} успешно сохранён в {file_path}.")
-        return file_path
+        async with _download_semaphore:
+            file_info = await bot.get_file(file_id)
+            # download_file пишет поток по частям; в хранилище файл попадает только целиком
+            await bot.download_file(file_info.file_path, destination=temp_path)
+        os.replace(temp_path, blob_path)
+        logger.info(f"Файл успешно сохранён в {blob_path}.")
+        return blob_path
     except Exception as e:
-        logger.error(f"Ошибка сохранения файла {file_name}: {e}", exc_info=True)
+        logger.error(f"Ошибка сохранения файла {blob_path}: {e}", exc_info=True)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
         raise
+
+
+def _expire_download_results(now: float):
+    """Забывает итоги загрузок пользователей, не оформивших заявку за DOWNLOAD_RESULT_TTL."""
+    for user_id in list(_download_results):
+        results = _download_results[user_id]
+        for key in [key for key, (_, finished_at) in results.items() if now - finished_at > DOWNLOAD_RESULT_TTL]:
+            del results[key]
+        if not results:
+            del _download_results[user_id]
+
+
+def _on_download_done(user_id: int, key: str, task: asyncio.Task):
+    # Ошибка забирается всегда, даже если заявка уже оформлена без этой загрузки
+    error = None if task.cancelled() else task.exception()
+    downloads = _pending_downloads.get(user_id)
+    if downloads is None or downloads.get(key) is not task:
+        return
+    del downloads[key]
+    if not downloads:
+        del _pending_downloads[user_id]
+
+    if task.cancelled() or error is not None:
+        logger.warning(f"Файл {key} пользователя {user_id} не сохранён: {error or 'загрузка отменена'}")
+        location = None
+    else:
+        location = task.result()
+        if location == key:
+            return  # Файл сохранён под своим ключом: итог хранить не нужно
+
+    now = time.monotonic()
+    _expire_download_results(now)
+    _download_results.setdefault(user_id, {})[key] = (location, now)
+
+
+def track_download(user_id: int, key: str, task: asyncio.Task, cancel_on_timeout: bool = False):
+    """
+    Регистрирует фоновое сохранение файла за пользователем.
+
+    Args:
+        user_id (int): ID пользователя Telegram.
+        key (str): Ключ файла в данных FSM.
+        task (asyncio.Task): Задача сохранения; её результат — итоговое расположение файла.
+        cancel_on_timeout (bool): Отменить задачу, если wait_for_downloads её не дождался.
+            Общие загрузки в хранилище не отменяются: их может ждать другой пользователь.
+    """
+    _pending_downloads.setdefault(user_id, {})[key] = task
+    task.add_done_callback(lambda done: _on_download_done(user_id, key, done))
+    if cancel_on_timeout:
+        _cancel_on_timeout.add(task)
+        task.add_done_callback(_cancel_on_timeout.discard)
+
+
+def start_file_download(message: types.Message, bot: Bot, upload_dir: str = UPLOAD_DIR) -> tuple[str, str, asyncio.Task]:
+    """
+    Запускает загрузку файла из сообщения в фоне и регистрирует её за пользователем.
+
+    Уже сохранённые файлы повторно не скачиваются; одновременные загрузки
+    одного файла объединяются.
+
+    Args:
+        message (types.Message): Telegram message object.
+        bot (Bot): Экземпляр aiogram.Bot.
+        upload_dir (str): Базовая директория для сохранения загруженных файлов.
+
+    Returns:
+        tuple[str, str, asyncio.Task]: Путь к файлу в хранилище, исходное имя файла и задача загрузки.
+    """
+    file, blob_path, file_name = get_file_destination(message, upload_dir)
+    user_id = message.from_user.id
+
+    task = _blob_downloads.get(blob_path)
+    if task is None:
+        task = asyncio.create_task(_download(bot, file.file_id, blob_path))
+        _blob_downloads[blob_path] = task
+        task.add_done_callback(lambda done: _blob_downloads.pop(blob_path, None))
+
+    track_download(user_id, blob_path, task)
+    # Полученный file_id позволит переслать файл менеджеру без повторной загрузки
+    get_telegram_file_cache().remember(blob_path, file.file_id, "photo" if message.photo else "document")
+    return blob_path, file_name, task
+
+
+async def save_file(message: types.Message, bot: Bot, upload_dir: str = UPLOAD_DIR) -> str:
+    """
+    Сохраняет фотографию или документ, отправленный пользователем, в хранилище файлов.
+
+    Args:
+        message (types.Message): Telegram message object.
+        bot (Bot): Экземпляр aiogram.Bot.
+        upload_dir (str): Базовая директория для сохранения загруженных файлов.
+
+    Returns:
+        str: Путь к сохранённому файлу.
+    """
+    blob_path, _, task = start_file_download(message, bot, upload_dir)
+    await task
+    return blob_path
+
+
+async def wait_for_downloads(user_id: int, timeout: float = DOWNLOAD_WAIT_TIMEOUT) -> dict[str, str | None]:
+    """
+    Дожидается незавершённых загрузок пользователя.
+
+    Args:
+        user_id (int): ID пользователя Telegram.
+        timeout (float): Максимальное время ожидания в секундах.
+
+    Returns:
+        dict[str, str | None]: Итоговое расположение отслеживаемых файлов {ключ: расположение};
+            None — файл не удалось сохранить (ошибка или таймаут).
+    """
+    downloads = _pending_downloads.pop(user_id, {})
+    results = {key: location for key, (location, _) in _download_results.pop(user_id, {}).items()}
+    if not downloads:
+        return results
+
+    done, pending = await asyncio.wait(downloads.values(), timeout=timeout)
+    results.update({
+        key: None if task in pending or task.cancelled() or task.exception() is not None else task.result()
+        for key, task in downloads.items()
+    })
+    if pending:
+        logger.warning(f"Не дождались загрузки {len(pending)} файлов пользователя {user_id} за {timeout} с.")
+        for task in pending:
+            if task in _cancel_on_timeout:
+                task.cancel()
+    failed = sorted(key for key, location in results.items() if location is None)
+    if failed:
+        logger.warning(f"Файлы пользователя {user_id} не сохранены: {failed}")
+    return results
+
+
+def get_order_manifest_path(user_id, timestamp: str, upload_dir: str = UPLOAD_DIR) -> str:
+    """Путь к манифесту заявки пользователя с указанной датой ('2024-01-31 12:00:00')."""
+    stamp = re.sub(r"\D", "", timestamp)
+    return os.path.join(upload_dir, ORDERS_DIR, str(user_id), f"{stamp}.json")
+
+
+def write_order_manifest(user_id, timestamp: str, files: list[dict], upload_dir: str = UPLOAD_DIR) -> str:
+    """
+    Записывает манифест заявки: файлы хранилища и их исходные имена.
+
+    Args:
+        user_id: ID пользователя Telegram.
+        timestamp (str): Дата заявки, как в столбце «Дата».
+        files (list[dict]): Файлы заявки [{"path": путь в хранилище, "name": имя файла}].
+        upload_dir (str): Базовая директория загруженных файлов.
+
+    Returns:
+        str: Путь к манифесту.
+    """
+    manifest_path = get_order_manifest_path(user_id, timestamp, upload_dir)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    temp_path = f"{manifest_path}.{uuid.uuid4().hex}.part"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"user_id": str(user_id), "date": timestamp, "files": files}, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
+    return manifest_path
+
+
+def read_order_file_names(user_id, timestamp: str, upload_dir: str = UPLOAD_DIR) -> dict[str, str]:
+    """Возвращает исходные имена файлов заявки {путь в хранилище: имя} или {}, если манифеста нет."""
+    manifest_path = get_order_manifest_path(user_id, timestamp, upload_dir)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"Ошибка чтения манифеста {manifest_path}: {e}")
+        return {}
+    return {entry["path"]: entry["name"] for entry in manifest.get("files", [])}
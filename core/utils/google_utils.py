@@ -1,51 +1,286 @@
 # core/utils/google_utils.py
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import time
+from typing import Callable
+import aiohttp
+from aiogoogle.excs import HTTPError
+from core.sheets_client import WorksheetNotFound
 from core.utils.logging_utils import setup_logger
-from oauth2client.service_account import ServiceAccountCredentials
-from gspread import authorize
-from gspread.exceptions import APIError, WorksheetNotFound
-from core.config import CREDENTIALS_FILE, GOOGLE_API_SCOPE
 
 # Настройка логгера
 logger = setup_logger(__name__)
 
-def get_google_client():
-    """Создаёт и возвращает клиента Google API.
+GOOGLE_RETRY_ATTEMPTS = int(os.getenv("GOOGLE_RETRY_ATTEMPTS", "4"))  # Повторов временных сбоев
+GOOGLE_RETRY_BASE_DELAY = float(os.getenv("GOOGLE_RETRY_BASE_DELAY", "1"))  # Секунды, удваиваются с каждым повтором
+GOOGLE_RETRY_MAX_DELAY = float(os.getenv("GOOGLE_RETRY_MAX_DELAY", "32"))
+GOOGLE_CIRCUIT_THRESHOLD = int(os.getenv("GOOGLE_CIRCUIT_THRESHOLD", "5"))  # Сбоев подряд до размыкания цепи
+GOOGLE_CIRCUIT_RESET = float(os.getenv("GOOGLE_CIRCUIT_RESET", "30"))  # Секунды до пробного вызова
 
-    Returns:
-        gspread.Client: Авторизованный клиент Google API.
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+class GoogleApiUnavailable(RuntimeError):
+    """Google API считается недоступным (цепь разомкнута), запрос не выполнялся."""
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты для одного API Google и счётчики его вызовов.
+
+    После GOOGLE_CIRCUIT_THRESHOLD временных сбоев подряд цепь размыкается:
+    вызовы сразу завершаются GoogleApiUnavailable. Через GOOGLE_CIRCUIT_RESET
+    секунд пропускается один пробный вызов; при успехе цепь замыкается.
+    """
+
+    def __init__(self, api: str, threshold: int = GOOGLE_CIRCUIT_THRESHOLD, reset_timeout: float = GOOGLE_CIRCUIT_RESET):
+        self.api = api
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0  # Временных сбоев подряд
+        self.opened_at: float | None = None
+        self.probing = False
+        # Счётчики для мониторинга
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.opened = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """Пропускает вызов или отклоняет его, пока цепь разомкнута. True — вызов пробный."""
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half-open" and not self.probing:
+            self.probing = True  # Пробный вызов; остальные отклоняются до его результата
+            return True
+        self.rejected += 1
+        raise GoogleApiUnavailable(f"Google API ({self.api}) временно недоступен, запрос отклонён.")
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        if self.opened_at is not None:
+            logger.info(f"Google API ({self.api}) снова доступен, цепь замкнута.")
+            self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        was_probing, self.probing = self.probing, False
+        if was_probing or (self.opened_at is None and self.failures >= self.threshold):
+            self.opened_at = time.monotonic()
+            self.opened += 1
+            logger.error(f"Google API ({self.api}): {self.failures} сбоев подряд, цепь разомкнута на {self.reset_timeout} с.")
+
+    def record_latency(self, seconds: float):
+        self.calls += 1
+        self.latency_total += seconds
+        self.latency_max = max(self.latency_max, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "opened": self.opened,
+            "latency_avg": self.latency_total / self.calls if self.calls else 0.0,
+            "latency_max": self.latency_max,
+        }
+
+
+_circuits: dict[str, CircuitBreaker] = {}
+# Задача, внутри которой уже выполняется защищённый вызов: вложенные вызовы не повторяются отдельно
+_guarded_task: contextvars.ContextVar = contextvars.ContextVar("google_api_guarded_task", default=None)
+
+
+def get_circuit(api: str) -> CircuitBreaker:
+    """Возвращает автомат защиты API ('sheets', 'drive'), создавая его при первом обращении."""
+    circuit = _circuits.get(api)
+    if circuit is None:
+        circuit = _circuits[api] = CircuitBreaker(api)
+    return circuit
+
+
+def get_google_api_stats() -> dict[str, dict]:
+    """Счётчики вызовов, повторов и задержек по каждому API Google."""
+    return {api: circuit.stats() for api, circuit in _circuits.items()}
+
+
+def _find_api_error(error: BaseException) -> BaseException | None:
+    """Ищет исходную ошибку API (aiogoogle) в цепочке исключений."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, HTTPError):
+            return error
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def _error_response(error: BaseException):
+    return getattr(error, "res", None)
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Проверяет, что сбой временный: квота, ошибка сервера Google или сети."""
+    if isinstance(error, GoogleApiUnavailable):
+        return False
+    api_error = _find_api_error(error)
+    if api_error is None:
+        seen = set()
+        while error is not None and id(error) not in seen:
+            seen.add(id(error))
+            if isinstance(error, (OSError, asyncio.TimeoutError, aiohttp.ClientError)):
+                return True
+            error = error.__cause__ or error.__context__
+        return False
+
+    response = _error_response(api_error)
+    status = getattr(response, "status_code", None)
+    if status in RETRYABLE_STATUSES:
+        return True
+    # Drive сообщает о превышении квоты кодом 403 с причиной rateLimitExceeded
+    return status == 403 and any(reason in str(api_error) for reason in RATE_LIMIT_REASONS)
+
+
+def is_unapplied_error(error: BaseException) -> bool:
+    """
+    Проверяет, что Google точно не выполнил запрос: превышение квоты (429,
+    403 rateLimitExceeded) или соединение не было установлено.
+
+    Такой сбой можно повторить даже для неидемпотентного запроса.
     """
+    if isinstance(error, GoogleApiUnavailable):
+        return False
+    api_error = _find_api_error(error)
+    if api_error is None:
+        seen = set()
+        while error is not None and id(error) not in seen:
+            seen.add(id(error))
+            if isinstance(error, aiohttp.ClientConnectorError):
+                return True
+            error = error.__cause__ or error.__context__
+        return False
+
+    status = getattr(_error_response(api_error), "status_code", None)
+    return status == 429 or status == 403 and any(reason in str(api_error) for reason in RATE_LIMIT_REASONS)
+
+
+def get_retry_after(error: BaseException) -> float | None:
+    """Значение заголовка Retry-After ответа Google в секундах, если оно есть."""
+    api_error = _find_api_error(error)
+    headers = getattr(_error_response(api_error), "headers", None) if api_error else None
+    value = headers.get("Retry-After") if headers else None
     try:
-        credentials = ServiceAccountCredentials.from_json_keyfile_name(
-            CREDENTIALS_FILE, GOOGLE_API_SCOPE
-        )
-        client = authorize(credentials)
-        logger.info("Google API клиент успешно авторизован.")
-        return client
-    except Exception as e:
-        logger.error(f"Ошибка авторизации Google API: {e}", exc_info=True)
-        raise
+        return float(value) if value is not None else None
+    except ValueError:
+        return None  # Дата HTTP вместо числа секунд — используем обычную задержку
 
-def handle_google_api_error(func):
+
+def get_retry_delay(attempt: int, error: BaseException) -> float:
+    """Задержка перед повтором: экспонента со случайным разбросом, не меньше Retry-After."""
+    delay = random.uniform(0, min(GOOGLE_RETRY_MAX_DELAY, GOOGLE_RETRY_BASE_DELAY * 2 ** attempt))
+    retry_after = get_retry_after(error)
+    return max(delay, retry_after) if retry_after is not None else delay
+
+
+def handle_google_api_error(func=None, *, api: str = "sheets", idempotent: bool | Callable[..., bool] = True):
     """Декоратор для обработки ошибок Google API.
 
+    Временные сбои (429, 5xx, ошибки сети) повторяются до GOOGLE_RETRY_ATTEMPTS
+    раз с экспоненциальной задержкой; автомат защиты API отклоняет вызовы, пока
+    Google недоступен. Вложенные защищённые вызовы в той же задаче выполняются
+    один раз — повторяет только внешний.
+
+    Неидемпотентные вызовы (добавление строк, создание листа, папки, файла)
+    после таймаута или 5xx не повторяются: Google мог их уже выполнить, и
+    повтор создал бы дубликат. Для них повторяются только сбои, при которых
+    запрос точно не выполнен (is_unapplied_error).
+
     Args:
         func (callable): Функция, для которой требуется обработка ошибок.
+        api (str): API, к которому относится вызов ('sheets', 'drive').
+        idempotent (bool | callable): Можно ли безопасно повторить вызов; функция
+            получает аргументы вызова и возвращает bool.
 
     Returns:
         callable: Обёрнутая функция.
     """
+    if func is None:
+        return lambda f: handle_google_api_error(f, api=api, idempotent=idempotent)
+
+    @functools.wraps(func)
     async def wrapper(*args, **kwargs):
-        try:
+        task = asyncio.current_task()
+        if task is not None and _guarded_task.get() is task:
             return await func(*args, **kwargs)
-        except APIError as e:
-            logger.error(f"Ошибка Google API: {e}", exc_info=True)
+
+        circuit = get_circuit(api)
+        repeatable = idempotent(*args, **kwargs) if callable(idempotent) else idempotent
+        token = _guarded_task.set(task)
+        started = time.monotonic()
+        probe = False
+        try:
+            for attempt in range(GOOGLE_RETRY_ATTEMPTS + 1):
+                probe = circuit.before_call()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    if not is_retryable_error(e):
+                        if _find_api_error(e) is not None:
+                            circuit.record_success()  # Google ответил: ошибка в самом запросе
+                        raise
+                    circuit.record_failure()
+                    if attempt == GOOGLE_RETRY_ATTEMPTS or circuit.state == "open":
+                        raise
+                    if not repeatable and not is_unapplied_error(e):
+                        raise  # Запрос мог быть выполнен: повтор создал бы дубликат
+                    delay = get_retry_delay(attempt, e)
+                    circuit.retries += 1
+                    logger.warning(
+                        f"Временный сбой Google API ({api}) в {func.__name__}: {e}. "
+                        f"Повтор {attempt + 1} из {GOOGLE_RETRY_ATTEMPTS} через {delay:.1f} с."
+                    )
+                    await asyncio.sleep(delay)
+                else:
+                    circuit.record_success()
+                    return result
+        except GoogleApiUnavailable as e:
+            logger.warning(str(e))
             raise
         except WorksheetNotFound as e:
+            circuit.errors += 1
             logger.warning(f"Лист не найден: {e}", exc_info=True)
             raise
+        except HTTPError as e:
+            circuit.errors += 1
+            logger.error(f"Ошибка Google API: {e}", exc_info=True)
+            raise
         except Exception as e:
+            circuit.errors += 1
             logger.error(f"Неизвестная ошибка Google API: {e}", exc_info=True)
             raise
+        finally:
+            if probe and circuit.probing:
+                circuit.probing = False  # Пробный вызов прерван, не дав результата
+            circuit.record_latency(time.monotonic() - started)
+            _guarded_task.reset(token)
     return wrapper
 
 def format_data_for_sheets(data):
@@ -1,28 +1,227 @@
 # core/utils/locales.py
 import json
 import os
+from collections import OrderedDict
+from string import Formatter
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
+from core.utils.logging_utils import setup_logger
+from core.utils.user_store import get_user_store
 
 LOCALIZATION_FILE = "locales.json"
-USER_LANG_FILE = "user_languages.json"
+DEFAULT_LANGUAGE = "ru"
+USER_LANG_CACHE_SIZE = int(os.getenv("USER_LANG_CACHE_SIZE", "50000"))
+
+# Порядок поиска перевода, если ключ отсутствует в языке пользователя
+FALLBACK_CHAIN = {
+    "ru": ("en",),
+    "uk": ("ru", "en"),
+    "pl": ("en", "ru"),
+    "en": ("ru",),
+}
+
+# Inline-клавиатуры: (ключ текста кнопки, callback_data) по строкам
+KEYBOARD_LAYOUTS = {
+    "client_type": (("wholesale", "Оптовый"), ("retail", "Розничный")),
+    "wholesale_project": (("stone_processing", "Камнеобработчик"), ("related_industry", "Смежная сфера")),
+    "retail_interest": (("monuments", "Памятники"), ("other_products", "Другие изделия")),
+}
+
+logger = setup_logger(__name__)
 
 # Загружаем локализации
 with open(LOCALIZATION_FILE, "r", encoding="utf-8") as file:
     LOCALIZATION = json.load(file)
 
+
+class LocaleCatalog:
+    """
+    Скомпилированный каталог переводов.
+
+    Строится один раз при импорте: отсутствующие ключи разрешаются по
+    FALLBACK_CHAIN, шаблоны форматирования разбираются заранее, а клавиатуры
+    создаются по одному экземпляру на язык.
+    """
+
+    def __init__(self, localization: dict, fallback_chain: dict, default_language: str = DEFAULT_LANGUAGE):
+        self.default_language = default_language
+        self.languages = tuple(localization)
+        self.keys = frozenset(key for texts in localization.values() for key in texts)
+        self.missing: dict[str, list[str]] = {}
+        self._texts: dict[str, dict[str, str]] = {}
+        self._fields: dict[str, dict[str, frozenset]] = {}
+        self._keyboards: dict[tuple[str, str], InlineKeyboardMarkup | ReplyKeyboardMarkup] = {}
+
+        for lang in self.languages:
+            chain = (lang, *fallback_chain.get(lang, ()), default_language)
+            texts = {}
+            for key in self.keys:
+                source = next((code for code in chain if key in localization.get(code, {})), None)
+                if source is not None:
+                    texts[key] = localization[source][key]
+            self._texts[lang] = texts
+            self._fields[lang] = {key: self._parse_fields(lang, key, text) for key, text in texts.items()}
+            self.missing[lang] = sorted(self.keys - set(localization[lang]))
+
+        self._check_fields()
+        for lang in self.languages:
+            self._build_keyboards(lang)
+
+    @staticmethod
+    def _parse_fields(lang: str, key: str, text: str) -> frozenset:
+        """Возвращает имена подстановок шаблона; ошибка в шаблоне обнаруживается при старте."""
+        try:
+            return frozenset(field for _, field, _, _ in Formatter().parse(text) if field)
+        except ValueError as e:
+            raise ValueError(f"Некорректный шаблон '{key}' ({lang}): {e}")
+
+    def _check_fields(self):
+        for key in self.keys:
+            variants = {self._fields[lang].get(key, frozenset()) for lang in self.languages}
+            if len(variants) > 1:
+                logger.warning(f"Подстановки ключа '{key}' различаются между языками: {variants}")
+
+    def _build_keyboards(self, lang: str):
+        required = {text_key for layout in KEYBOARD_LAYOUTS.values() for text_key, _ in layout}
+        required.add("send_phone_button")
+        missing = sorted(required - set(self._texts[lang]))
+        if missing:
+            raise ValueError(f"Нет переводов для кнопок ({lang}): {missing}")
+
+        for keyboard_id, layout in KEYBOARD_LAYOUTS.items():
+            self._keyboards[lang, keyboard_id] = InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [InlineKeyboardButton(text=self.text(lang, text_key), callback_data=callback_data)]
+                    for text_key, callback_data in layout
+                ]
+            )
+        self._keyboards[lang, "send_phone"] = ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text=self.text(lang, "send_phone_button"), request_contact=True)]],
+            resize_keyboard=True
+        )
+
+    def _resolve_language(self, lang: str) -> str:
+        return lang if lang in self._texts else self.default_language
+
+    def text(self, lang: str, key: str) -> str:
+        """Возвращает перевод с учётом цепочки запасных языков или сам ключ."""
+        return self._texts[self._resolve_language(lang)].get(key, key)
+
+    def format(self, lang: str, key: str, **kwargs) -> str:
+        """Возвращает перевод с подстановками; строки без подстановок не форматируются."""
+        lang = self._resolve_language(lang)
+        text = self._texts[lang].get(key, key)
+        if not self._fields[lang].get(key):
+            return text
+        return text.format_map(kwargs)
+
+    def keyboard(self, lang: str, keyboard_id: str):
+        """
+        Возвращает заранее созданную клавиатуру.
+
+        Объект общий для всех вызовов и не заморожен (модели aiogram изменяемы):
+        изменять его нельзя; для изменённой клавиатуры нужна копия (model_copy(deep=True)).
+        """
+        return self._keyboards[self._resolve_language(lang), keyboard_id]
+
+
+LOCALE_CATALOG = LocaleCatalog(LOCALIZATION, FALLBACK_CHAIN)
+SUPPORTED_LANGUAGES = LOCALE_CATALOG.languages
+
+for _lang, _missing in LOCALE_CATALOG.missing.items():
+    if _missing:
+        logger.warning(f"В языке '{_lang}' нет {len(_missing)} ключей, используются запасные переводы: {_missing}")
+
 def get_text(user_lang, key):
-    """Получает текст из локализации, если ключ найден, иначе возвращает сам ключ."""
-    return LOCALIZATION.get(user_lang, {}).get(key, key)
+    """Получает текст из локализации с учётом запасных языков, иначе возвращает сам ключ."""
+    return LOCALE_CATALOG.text(user_lang, key)
+
+def format_text(user_lang, key, **kwargs):
+    """Получает текст из локализации и подставляет значения в шаблон."""
+    return LOCALE_CATALOG.format(user_lang, key, **kwargs)
+
+def get_keyboard(user_lang, keyboard_id):
+    """Возвращает готовую клавиатуру для языка пользователя (общий объект, не изменять)."""
+    return LOCALE_CATALOG.keyboard(user_lang, keyboard_id)
+
+
+class UserLanguageCache:
+    """
+    Ограниченный LRU-кэш языков пользователей.
+
+    Заполняется один раз при старте и обновляется при каждой записи, поэтому
+    обработчики получают язык за O(1) без обращения к хранилищу. Пока ни одна запись
+    не была вытеснена, кэш содержит всех известных пользователей и промах
+    означает, что язык пользователя не сохранён.
+    """
+
+    def __init__(self, maxsize: int = USER_LANG_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.loaded = False
+        self.complete = True
+        self._data: OrderedDict[str, str] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, user_id) -> bool:
+        return str(user_id) in self._data
+
+    def get(self, user_id):
+        """Возвращает язык пользователя или None, отмечая запись как недавно использованную."""
+        key = str(user_id)
+        lang = self._data.get(key)
+        if lang is not None:
+            self._data.move_to_end(key)
+        return lang
+
+    def set(self, user_id, lang: str):
+        """Сохраняет язык пользователя, вытесняя самые старые записи при переполнении."""
+        key = str(user_id)
+        self._data[key] = lang
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.complete = False
+
+    def load(self, languages: dict):
+        """Заполняет кэш из словаря {user_id: lang}."""
+        self._data.clear()
+        self.complete = True
+        for user_id, lang in languages.items():
+            self.set(user_id, lang)
+        self.loaded = True
+
+
+# Общий для процесса кэш языков пользователей
+user_language_cache = UserLanguageCache()
 
 def load_user_languages():
     """Загружает сохраненные языковые настройки пользователей."""
-    if not os.path.exists(USER_LANG_FILE):
-        return {}
-    with open(USER_LANG_FILE, "r", encoding="utf-8") as file:
-        return json.load(file)
+    return get_user_store().load_languages()
+
+def warm_user_languages():
+    """Заполняет кэш языков из хранилища профилей. Вызывается один раз при старте бота."""
+    user_language_cache.load(load_user_languages())
+    return len(user_language_cache)
+
+def get_user_language(user_id, default=DEFAULT_LANGUAGE):
+    """Возвращает язык пользователя из кэша, не обращаясь к хранилищу на горячем пути."""
+    if not user_language_cache.loaded:
+        warm_user_languages()
+
+    lang = user_language_cache.get(user_id)
+    if lang is not None:
+        return lang
+    if user_language_cache.complete:
+        return default
+
+    # Пользователь был вытеснен из кэша — точечное чтение из хранилища
+    lang = get_user_store().get_language(user_id)
+    if lang:
+        user_language_cache.set(user_id, lang)
+    return lang or default
 
 def save_user_language(user_id, lang):
-    """Сохраняет язык пользователя в JSON-файл."""
-    data = load_user_languages()
-    data[str(user_id)] = lang
-    with open(USER_LANG_FILE, "w", encoding="utf-8") as file:
-        json.dump(data, file, ensure_ascii=False, indent=4)
+    """Сохраняет язык пользователя в кэш и ставит запись в очередь хранилища профилей."""
+    user_language_cache.set(user_id, lang)
+    get_user_store().set_language(user_id, lang)
@@ -1,6 +1,214 @@
 # utils/logging_utils.py
+"""
+Логирование проекта через очередь.
+- Обработчик очереди один — на корневом логгере; логгеры проекта передают
+  ему записи обычным образом (propagate), поэтому каждая запись попадает
+  в очередь один раз, а обработчики pytest (caplog) продолжают их видеть.
+- Логгеры только кладут записи в ограниченную очередь (без блокировки);
+  форматирование и запись в консоль или файл выполняет отдельный поток,
+  поэтому логирование не задерживает цикл событий.
+- Если очередь переполнена, запись отбрасывается и учитывается в счётчике.
+- LOG_FORMAT=json включает структурированный вывод (одна запись JSON на строку).
+- LOG_SAMPLING задаёт выборку INFO для шумных логгеров: "core.sheet_quota=10"
+  оставляет каждую десятую запись INFO этого логгера и его потомков.
+"""
+
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text или json
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Записей в очереди до начала отбрасывания
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")  # "логгер=N,логгер=N": оставлять каждую N-ю запись INFO
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s [%(filename)s:%(lineno)d]'
+
+
+def parse_sampling(spec: str) -> dict[str, int]:
+    """Разбирает LOG_SAMPLING в словарь {имя логгера: N}."""
+    sampling = {}
+    for item in spec.split(","):
+        name, _, every = item.strip().partition("=")
+        if name and every.strip().isdigit() and int(every) > 1:
+            sampling[name.strip()] = int(every)
+    return sampling
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "location": f"{record.filename}:{record.lineno}",
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает каждую N-ю запись INFO (и ниже) указанных логгеров; WARNING и выше — всегда."""
+
+    def __init__(self, sampling: dict[str, int]):
+        super().__init__()
+        self.sampling = sampling
+        self.sampled_out = 0
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _every(self, name: str) -> int | None:
+        while name:
+            if name in self.sampling:
+                return self.sampling[name]
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        every = self._every(record.name)
+        if every is None:
+            return True
+        with self._lock:
+            count = self._counters.get(record.name, 0)
+            self._counters[record.name] = count + 1
+            if count % every == 0:
+                return True
+            self.sampled_out += 1
+        return False
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Кладёт записи в ограниченную очередь без ожидания; при переполнении запись отбрасывается."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # В отличие от QueueHandler, запись не форматируется здесь: это работа потока логирования.
+        # Сообщение подставляется сразу, пока аргументы не изменились.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _OutputHandler(logging.Handler):
+    """Обработчик в потоке логирования: консоль и файлы, заданные для отдельных логгеров."""
+
+    def __init__(self, formatter: logging.Formatter, source: BoundedQueueHandler):
+        super().__init__()
+        self.formatter = formatter
+        self.console = logging.StreamHandler()
+        self.console.setFormatter(formatter)
+        self.files: dict[str, logging.Handler] = {}  # Имя логгера → файловый обработчик
+        self._source = source
+        self._reported_drops = 0
+
+    def add_file(self, name: str, log_file: str):
+        if name in self.files:
+            return
+        directory = os.path.dirname(log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(self.formatter)
+        self.files[name] = file_handler
+
+    def _report_drops(self):
+        dropped = self._source.dropped
+        if dropped > self._reported_drops:
+            record = logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                f"Очередь логов переполнена, отброшено записей: {dropped - self._reported_drops}", None, None,
+            )
+            self._reported_drops = dropped
+            self.console.handle(record)
+
+    def emit(self, record: logging.LogRecord):
+        self._report_drops()
+        self.console.handle(record)
+        name = record.name
+        while name:  # Файл логгера получает и записи его потомков
+            file_handler = self.files.get(name)
+            if file_handler is not None:
+                file_handler.handle(record)
+                break
+            name = name.rpartition(".")[0]
+
+    def close(self):
+        self._report_drops()
+        for file_handler in self.files.values():
+            file_handler.close()
+        super().close()
+
+
+_lock = threading.Lock()
+_queue_handler: BoundedQueueHandler | None = None
+_output: _OutputHandler | None = None
+_listener: logging.handlers.QueueListener | None = None
+_sampling: SamplingFilter | None = None
+
+
+def _ensure_pipeline():
+    """Создаёт очередь и запускает поток логирования при первом обращении."""
+    global _queue_handler, _output, _listener, _sampling
+    with _lock:
+        if _queue_handler is None:
+            _queue_handler = BoundedQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+            _sampling = SamplingFilter(parse_sampling(LOG_SAMPLING))
+            _queue_handler.addFilter(_sampling)
+            formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+            _output = _OutputHandler(formatter, _queue_handler)
+            logging.getLogger().addHandler(_queue_handler)
+        if _listener is None:
+            _listener = logging.handlers.QueueListener(_queue_handler.queue, _output)
+            _listener.start()
+
+
+def stop_logging():
+    """Дописывает записи из очереди и останавливает поток логирования. Вызывается при завершении."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            _output.flush()
+
+
+atexit.register(stop_logging)
+
+
+def get_logging_stats() -> dict:
+    """Счётчики очереди логов: ожидающие, отброшенные при переполнении и отсеянные выборкой записи."""
+    if _queue_handler is None:
+        return {"queued": 0, "dropped": 0, "sampled_out": 0}
+    return {
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "sampled_out": _sampling.sampled_out,
+    }
+
 
 def setup_logger(name: str, log_file: str = None, level: int = logging.INFO) -> logging.Logger:
     """
@@ -14,29 +222,17 @@ def setup_logger(name: str, log_file: str = None, level: int = logging.INFO) ->
     Returns:
         logging.Logger: Настроенный логгер.
     """
+    _ensure_pipeline()
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
-    # Убедимся, что логгер не дублирует обработчики
-    if logger.hasHandlers():
-        logger.handlers.clear()
-
-    # Формат логов с дополнительной информацией
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s [%(filename)s:%(lineno)d]'
-    )
-
-    # Консольный обработчик
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    # Записи доходят до очереди через корневой логгер; собственные обработчики
+    # дублировали бы их, поэтому логгер их не держит
+    logger.handlers.clear()
 
     # Файловый обработчик (опционально)
     if log_file:
-        os.makedirs(os.path.dirname(log_file), exist_ok=True)
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        _output.add_file(name, log_file)
 
     return logger
 
@@ -0,0 +1,106 @@
+# core/utils/telegram_file_cache.py
+"""
+Кэш file_id Telegram для сохранённых файлов.
+
+- Файл хранилища (путь) сопоставляется с file_id, под которым он уже есть
+  на серверах Telegram, и типом вложения (photo или document).
+- file_id запоминается при получении файла от пользователя и после первой
+  отправки файла менеджеру; повторные отправки не загружают файл заново.
+- Запись отложенная: обработчик сообщения не ждёт диска, изменения
+  сбрасываются в базу фоновой задачей одной транзакцией.
+"""
+
+import os
+import threading
+from core.utils.db_utils import DEFAULT_DB_PATH, WriteBehindBuffer, open_database, transaction
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+TELEGRAM_FILE_CACHE_FLUSH_INTERVAL = float(os.getenv("TELEGRAM_FILE_CACHE_FLUSH_INTERVAL", "1.0"))
+
+
+class TelegramFileCache:
+    """
+    Сопоставление {путь к файлу: (file_id, тип вложения)} в SQLite.
+
+    remember и forget только ставят изменение в очередь; после start() очередь
+    сбрасывается в фоне, до start() — сразу при вызове.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, flush_interval: float = TELEGRAM_FILE_CACHE_FLUSH_INTERVAL):
+        # Изменения {путь: (file_id, тип)}; None — удалить запись
+        self._writes = WriteBehindBuffer(self._write, flush_interval, "кэш file_id Telegram")
+        self._lock = threading.Lock()
+        self._connection = open_database(db_path)
+        with self._lock:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS telegram_files (
+                    path TEXT PRIMARY KEY,
+                    file_id TEXT NOT NULL,
+                    kind TEXT NOT NULL
+                )
+                """
+            )
+
+    def get_many(self, paths: list[str]) -> dict[str, tuple[str, str]]:
+        """Возвращает известные file_id {путь: (file_id, тип)} для указанных файлов."""
+        if not paths:
+            return {}
+        stored = [path for path in paths if path not in self._writes.pending]
+        rows = []
+        if stored:
+            placeholders = ", ".join("?" * len(stored))
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT path, file_id, kind FROM telegram_files WHERE path IN ({placeholders})", stored
+                ).fetchall()
+        found = {path: (file_id, kind) for path, file_id, kind in rows}
+        for path in paths:
+            if self._writes.pending.get(path) is not None:
+                found[path] = self._writes.pending[path]
+        return found
+
+    def remember(self, path: str, file_id: str, kind: str):
+        """Запоминает file_id файла; более ранняя запись того же файла заменяется."""
+        self._writes.put(path, (file_id, kind))
+
+    def forget(self, path: str):
+        """Удаляет file_id, который Telegram больше не принимает."""
+        self._writes.put(path, None)
+
+    def _write(self, changes: dict):
+        with self._lock, transaction(self._connection) as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO telegram_files (path, file_id, kind) VALUES (?, ?, ?)",
+                [(path, *entry) for path, entry in changes.items() if entry is not None],
+            )
+            db.executemany(
+                "DELETE FROM telegram_files WHERE path = ?",
+                [(path,) for path, entry in changes.items() if entry is None],
+            )
+
+    async def start(self):
+        """Запускает фоновую запись изменений."""
+        self._writes.start()
+
+    async def stop(self):
+        """Останавливает фоновую запись, сбрасывает очередь и закрывает базу."""
+        await self._writes.stop()
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_telegram_file_cache: TelegramFileCache | None = None
+
+
+def get_telegram_file_cache() -> TelegramFileCache:
+    """Возвращает кэш file_id, открывая базу при первом обращении."""
+    global _telegram_file_cache
+    if _telegram_file_cache is None:
+        _telegram_file_cache = TelegramFileCache()
+    return _telegram_file_cache
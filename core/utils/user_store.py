@@ -0,0 +1,179 @@
+# core/utils/user_store.py
+"""
+Хранилище профилей пользователей (язык интерфейса).
+
+- Базовый интерфейс UserProfileStore и реализация на SQLite (WAL).
+- Отложенная запись: изменения одного пользователя объединяются и
+  сбрасываются в базу фоновой задачей одной транзакцией.
+- Однократная миграция из user_languages.json.
+"""
+
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import os
+import threading
+import time
+from core.utils.db_utils import DEFAULT_DB_PATH, WriteBehindBuffer, open_database, transaction
+from core.utils.logging_utils import setup_logger
+
+logger = setup_logger(__name__)
+
+USER_LANG_FILE = "user_languages.json"
+USER_STORE_BACKEND = os.getenv("USER_STORE_BACKEND", "sqlite")
+USER_STORE_FLUSH_INTERVAL = float(os.getenv("USER_STORE_FLUSH_INTERVAL", "1.0"))
+
+
+class UserProfileStore(ABC):
+    """
+    Базовый интерфейс хранилища профилей.
+
+    set_language только ставит запись в очередь; после start() очередь
+    сбрасывается в фоне, до start() — сразу при вызове.
+    """
+
+    def __init__(self, flush_interval: float = USER_STORE_FLUSH_INTERVAL):
+        # Изменения {user_id: lang}; _write_languages берётся при каждой записи, а не один раз
+        self._writes = WriteBehindBuffer(
+            lambda languages: self._write_languages(languages), flush_interval, "профили пользователей"
+        )
+
+    @property
+    def _pending(self) -> dict[str, str]:
+        return self._writes.pending
+
+    @abstractmethod
+    def load_languages(self) -> dict:
+        """Возвращает все сохранённые языки {user_id: lang}."""
+
+    @abstractmethod
+    def _read_language(self, user_id: str):
+        """Читает язык пользователя из хранилища или возвращает None."""
+
+    @abstractmethod
+    def _write_languages(self, languages: dict):
+        """Записывает языки пользователей {user_id: lang} одной операцией."""
+
+    def close(self):
+        pass
+
+    def get_language(self, user_id):
+        """Возвращает язык пользователя с учётом ещё не сброшенных изменений."""
+        key = str(user_id)
+        if key in self._pending:
+            return self._pending[key]
+        return self._read_language(key)
+
+    def set_language(self, user_id, lang: str):
+        """Ставит язык пользователя в очередь на запись; повторные записи объединяются."""
+        self._writes.put(str(user_id), lang)
+
+    def flush_pending(self):
+        """Синхронно записывает накопленные изменения."""
+        self._writes.flush_pending()
+
+    async def flush(self):
+        """Записывает накопленные изменения в отдельном потоке."""
+        await self._writes.flush()
+
+    async def start(self):
+        """Запускает фоновую запись изменений."""
+        self._writes.start()
+
+    async def stop(self):
+        """Останавливает фоновую запись, сбрасывает очередь и закрывает хранилище."""
+        await self._writes.stop()
+        self.close()
+
+
+class SQLiteUserProfileStore(UserProfileStore):
+    """Хранилище профилей в SQLite: точечные чтения и upsert без перезаписи файла."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, legacy_file: str = USER_LANG_FILE, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._connection = open_database(db_path)
+        with self._lock:
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS user_profiles (
+                    user_id TEXT PRIMARY KEY,
+                    language TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS store_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                """
+            )
+        self._migrate_from_json(legacy_file)
+
+    def _migrate_from_json(self, legacy_file: str):
+        """Однократно переносит языки из user_languages.json."""
+        with self._lock, transaction(self._connection) as db:
+            migrated = db.execute("SELECT 1 FROM store_meta WHERE key = 'json_migrated'").fetchone()
+            if migrated:
+                return
+
+            languages = {}
+            if legacy_file and os.path.exists(legacy_file):
+                with open(legacy_file, "r", encoding="utf-8") as file:
+                    languages = json.load(file)
+
+            now = time.time()
+            db.executemany(
+                "INSERT OR IGNORE INTO user_profiles (user_id, language, updated_at) VALUES (?, ?, ?)",
+                [(str(user_id), lang, now) for user_id, lang in languages.items()],
+            )
+            db.execute("INSERT INTO store_meta (key, value) VALUES ('json_migrated', ?)", (str(now),))
+        logger.info(f"Миграция из {legacy_file}: перенесено {len(languages)} профилей.")
+
+    def load_languages(self) -> dict:
+        with self._lock:
+            rows = self._connection.execute("SELECT user_id, language FROM user_profiles").fetchall()
+        languages = dict(rows)
+        languages.update(self._pending)
+        return languages
+
+    def _read_language(self, user_id: str):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT language FROM user_profiles WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _write_languages(self, languages: dict):
+        now = time.time()
+        with self._lock, transaction(self._connection) as db:
+            db.executemany(
+                """
+                INSERT INTO user_profiles (user_id, language, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET language = excluded.language, updated_at = excluded.updated_at
+                """,
+                [(user_id, lang, now) for user_id, lang in languages.items()],
+            )
+        logger.debug(f"Сохранено профилей пользователей: {len(languages)}.")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+# Доступные реализации хранилища (USER_STORE_BACKEND)
+USER_STORE_BACKENDS = {
+    "sqlite": SQLiteUserProfileStore,
+}
+
+_user_store: UserProfileStore | None = None
+
+def get_user_store() -> UserProfileStore:
+    """Возвращает общее для процесса хранилище профилей, создавая его при первом обращении."""
+    global _user_store
+    if _user_store is None:
+        try:
+            backend = USER_STORE_BACKENDS[USER_STORE_BACKEND]
+        except KeyError:
+            raise ValueError(f"Неизвестное хранилище профилей: {USER_STORE_BACKEND}")
+        _user_store = backend()
+    return _user_store
@@ -2,10 +2,9 @@
 from aiogram import Router, Bot, types
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import StateFilter
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from core.states import Form
 from core.utils.logging_utils import setup_logger
-from core.utils.locales import get_text, load_user_languages  # Добавлен импорт мультиязычности
+from core.utils.locales import get_text, format_text, get_keyboard, get_user_language  # Добавлен импорт мультиязычности
 
 # Настройка логгера
 logger = setup_logger(__name__)
@@ -23,21 +22,14 @@ async def get_client_type(message: types.Message, state: FSMContext):
 
         # Получаем язык пользователя
         data = await state.get_data()
-        lang = data.get("language", load_user_languages().get(str(user_id), "ru"))
+        lang = data.get("language") or get_user_language(user_id)
 
         logger.info(f"Получено имя клиента: {name}")
 
         # Клавиатура выбора типа клиента
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [InlineKeyboardButton(text=get_text(lang, "wholesale"), callback_data="Оптовый")],
-                [InlineKeyboardButton(text=get_text(lang, "retail"), callback_data="Розничный")]
-            ]
-        )
-
         await message.answer(
-            get_text(lang, "client_greeting").format(name=name),
-            reply_markup=keyboard
+            format_text(lang, "client_greeting", name=name),
+            reply_markup=get_keyboard(lang, "client_type")
         )
     except Exception as e:
         logger.error(f"Ошибка в обработке имени клиента: {e}", exc_info=True)
@@ -53,36 +45,22 @@ async def process_client_type(callback_query: types.CallbackQuery, state: FSMCon
 
         # Получаем язык пользователя
         data = await state.get_data()
-        lang = data.get("language", load_user_languages().get(str(user_id), "ru"))
+        lang = data.get("language") or get_user_language(user_id)
 
         logger.info(f"Тип клиента выбран: {client_type}")
 
         if client_type == "Оптовый":
             # Клавиатура для оптовых клиентов
-            keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text=get_text(lang, "stone_processing"), callback_data="Камнеобработчик")],
-                    [InlineKeyboardButton(text=get_text(lang, "related_industry"), callback_data="Смежная сфера")]
-                ]
-            )
-
             await callback_query.message.answer(
                 get_text(lang, "wholesale_question"),
-                reply_markup=keyboard
+                reply_markup=get_keyboard(lang, "wholesale_project")
             )
             await state.set_state(Form.opt_project)  # Переход к следующему состоянию
         else:
             # Клавиатура для розничных клиентов
-            keyboard = InlineKeyboardMarkup(
-                inline_keyboard=[
-                    [InlineKeyboardButton(text=get_text(lang, "monuments"), callback_data="Памятники")],
-                    [InlineKeyboardButton(text=get_text(lang, "other_products"), callback_data="Другие изделия")]
-                ]
-            )
-
             await callback_query.message.answer(
                 get_text(lang, "retail_question"),
-                reply_markup=keyboard
+                reply_markup=get_keyboard(lang, "retail_interest")
             )
             await state.set_state(Form.item_interest)  # Переход к следующему состоянию
     except Exception as e:
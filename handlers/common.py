@@ -1,15 +1,24 @@
 # handlers/common.py
+import asyncio
+import os
 from aiogram import types
 from aiogram.fsm.context import FSMContext
-from core.utils.file_utils import save_file
+from core.google_drive import start_drive_stream
+from core.utils.file_utils import FILE_PIPELINE, start_file_download
 from core.utils.logging_utils import setup_logger
 from aiogram import Bot
 from core.states import Form
-from core.utils.locales import get_text, load_user_languages  # Добавлен импорт локализации
+from core.utils.locales import get_text, get_user_language  # Добавлен импорт локализации
 
 # Настройка логгера
 logger = setup_logger(__name__)
 
+ALBUM_WINDOW = float(os.getenv("ALBUM_WINDOW", "0.5"))  # Секунды ожидания остальных сообщений альбома
+
+# Собираемые альбомы: {(user_id, media_group_id): сообщения} и задачи их обработки
+_albums: dict[tuple[int, str], list[types.Message]] = {}
+_album_tasks: dict[tuple[int, str], asyncio.Task] = {}
+
 def update_comment(existing_comment: str, new_text: str) -> str:
     """
     Обновляет комментарий, объединяя старый текст с новым.
@@ -23,6 +32,89 @@ def update_comment(existing_comment: str, new_text: str) -> str:
     """
     return f"{existing_comment}\n{new_text}".strip() if existing_comment else new_text
 
+async def store_files(messages: list[types.Message], state: FSMContext, bot: Bot, data: dict, lang: str):
+    """
+    Сохраняет файлы из сообщений одним обновлением FSM и отвечает пользователю один раз.
+
+    Args:
+        messages (list[types.Message]): Сообщения с файлами (одно или весь альбом).
+        state (FSMContext): Текущее состояние FSM.
+        bot (Bot): Экземпляр Telegram Bot.
+        data (dict): Данные FSM, прочитанные перед обработкой.
+        lang (str): Язык пользователя.
+    """
+    combined_comment = data.get("combined_comment", "")
+    file_list = data.get("file_list", [])
+    if not isinstance(file_list, list):
+        file_list = [file_list]
+
+    file_names = dict(data.get("file_names", {}))
+
+    # Загрузки идут в фоне; заявка дождётся их при получении контакта
+    captions = []
+    for message in messages:
+        if FILE_PIPELINE == "drive":
+            file_path, file_name, _ = start_drive_stream(message, bot)
+        else:
+            file_path, file_name, _ = start_file_download(message, bot)
+        file_list.append(file_path)
+        file_names[file_path] = file_name
+        if message.caption:
+            captions.append(message.caption)
+    await state.update_data(file_list=file_list, file_names=file_names)
+
+    if captions:
+        for caption in captions:
+            combined_comment = update_comment(combined_comment, caption)
+        await state.update_data(combined_comment=combined_comment)
+        await messages[0].answer(get_text(lang, "send_contact"))
+        await state.set_state(Form.contacts)
+        return
+
+    await messages[0].answer(get_text(lang, "comment_to_files"))
+
+def collect_album_message(message: types.Message, state: FSMContext, bot: Bot):
+    """
+    Добавляет сообщение в собираемый альбом (media_group_id).
+
+    Альбом обрабатывается целиком, когда в течение ALBUM_WINDOW секунд
+    не пришло новых сообщений из него.
+    """
+    key = (message.from_user.id, message.media_group_id)
+    _albums.setdefault(key, []).append(message)
+
+    task = _album_tasks.get(key)
+    if task is not None:
+        task.cancel()
+    _album_tasks[key] = asyncio.create_task(_process_album(key, state, bot))
+
+async def _process_album(key: tuple[int, str], state: FSMContext, bot: Bot):
+    await asyncio.sleep(ALBUM_WINDOW)
+    # Снимаем альбом с учёта до первого await: новые сообщения начнут новый альбом
+    del _album_tasks[key]
+    messages = _albums.pop(key)
+
+    user_id = key[0]
+    lang = get_user_language(user_id)
+    try:
+        data = await state.get_data()
+        lang = data.get("language") or lang
+        await store_files(messages, state, bot, data, lang)
+        logger.info(f"Альбом {key[1]} пользователя {user_id}: принято файлов {len(messages)}.")
+    except Exception as e:
+        logger.error(f"Ошибка при обработке альбома пользователя {user_id}: {e}", exc_info=True)
+        await messages[0].answer(get_text(lang, "error_occurred"))
+
+async def wait_for_albums(user_id: int):
+    """
+    Дожидается обработки альбомов пользователя, которые ещё собираются.
+
+    Вызывается перед чтением данных FSM: сообщение, пришедшее во время сбора
+    альбома, обрабатывается после альбома, а не поверх устаревших данных.
+    """
+    while tasks := [task for key, task in _album_tasks.items() if key[0] == user_id and not task.done()]:
+        await asyncio.wait(tasks)  # Задача могла быть заменена новой, если альбом ещё пополнялся
+
 async def process_input(message: types.Message, state: FSMContext, bot: Bot):
     """
     Универсальная функция для обработки текстовых сообщений и файлов.
@@ -32,35 +124,26 @@ async def process_input(message: types.Message, state: FSMContext, bot: Bot):
         state (FSMContext): Текущее состояние FSM.
         bot (Bot): Экземпляр Telegram Bot.
     """
+    # Сообщения альбома обрабатываются вместе, без чтения FSM на каждое
+    if message.content_type in ["photo", "document"] and message.media_group_id:
+        collect_album_message(message, state, bot)
+        return
+
     try:
         user_id = message.from_user.id
+        await wait_for_albums(user_id)
         data = await state.get_data()
 
         # Получаем язык пользователя (из FSM или из сохраненных данных)
-        lang = data.get("language", load_user_languages().get(str(user_id), "ru"))
+        lang = data.get("language") or get_user_language(user_id)
         
         # Извлекаем текущие данные FSM
         combined_comment = data.get("combined_comment", "")
-        file_list = data.get("file_list", [])
         comment_count = data.get("comment_count", 0)
 
-        if not isinstance(file_list, list):
-            file_list = [file_list]
-
         # Обработка файлов (фото, документы)
         if message.content_type in ["photo", "document"]:
-            file_path = await save_file(message, bot)
-            file_list.append(file_path)
-            await state.update_data(file_list=file_list)
-
-            if message.caption:
-                combined_comment = update_comment(combined_comment, message.caption)
-                await state.update_data(combined_comment=combined_comment)
-                await message.answer(get_text(lang, "send_contact"))
-                await state.set_state(Form.contacts)
-                return
-
-            await message.answer(get_text(lang, "comment_to_files"))
+            await store_files([message], state, bot, data, lang)
             return
 
         # Обработка текстовых сообщений
@@ -3,15 +3,17 @@
 from aiogram import Router, types, Bot
 from aiogram.fsm.context import FSMContext
 from aiogram import F
-from core.google_sheets import initialize_google_sheet, get_google_sheet
+from core.order_outbox import get_order_outbox, wake_order_dispatcher
+from core.sheet_schema import WHOLESALE_SCHEMA, RETAIL_SCHEMA
 from core.utils.logging_utils import setup_logger
 from core.states import Form
 from datetime import datetime
 import os
-import asyncio
 from dotenv import load_dotenv
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
-from core.utils.locales import get_text, load_user_languages
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from core.utils.locales import get_text, get_keyboard, get_user_language
+from core.utils.file_utils import wait_for_downloads, write_order_manifest
+from handlers.common import wait_for_albums
 
 import re  # ДОБАВЛЕНО: для проверки корректного номера
 
@@ -23,18 +25,6 @@ logger = setup_logger(__name__)
 router = Router()
 
 
-def get_actual_files(user_id: int) -> list[str]:
-    """Возвращает список всех файлов в папке пользователя."""
-    user_folder = os.path.join("uploads", str(user_id))
-    if not os.path.exists(user_folder):
-        return []
-
-    return sorted([
-        os.path.join(user_folder, f) for f in os.listdir(user_folder)
-        if os.path.isfile(os.path.join(user_folder, f))
-    ])
-
-
 # НОВОЕ: функция проверки вручную введенного номера
 def is_valid_phone(text: str) -> bool:
     cleaned = re.sub(r"[^\d+]", "", text)  # убираем лишние символы
@@ -48,8 +38,9 @@ async def get_contacts(message: types.Message, state: FSMContext, bot: Bot):
     """Получение и сохранение контакта."""
 
     user_id = message.from_user.id
+    await wait_for_albums(user_id)  # Файлы альбома, пришедшего перед контактом, входят в заявку
     data = await state.get_data()
-    lang = data.get("language", load_user_languages().get(str(user_id), "ru"))
+    lang = data.get("language") or get_user_language(user_id)
 
     # ------------------- ЛОГИКА 1: Контакт через кнопку -------------------
     if message.contact:  # НОВОЕ: приоритет контакту
@@ -68,14 +59,9 @@ async def get_contacts(message: types.Message, state: FSMContext, bot: Bot):
             # ------------------- НЕВЕРНЫЙ ВВОД → предлагаем кнопку -------------------
             logger.warning(f"Некорректный ввод номера: {user_input}")
 
-            keyboard = ReplyKeyboardMarkup(
-                keyboard=[[KeyboardButton(text=get_text(lang, "send_phone_button"), request_contact=True)]],
-                resize_keyboard=True
-            )
-
             await message.answer(
                 get_text(lang, "invalid_phone"),
-                reply_markup=keyboard
+                reply_markup=get_keyboard(lang, "send_phone")
             )
             return  # ВАЖНО: НЕ продолжаем, пока не будет нормального ввода
 
@@ -83,9 +69,8 @@ async def get_contacts(message: types.Message, state: FSMContext, bot: Bot):
     # ------------------- ЕСЛИ МЫ ЗДЕСЬ — номер валиден -------------------
     await state.update_data(contacts=contacts)
 
-    # ЗАГРУЗКА ФАЙЛОВ, ОБРАБОТКА СТАРОГО КОДА (Без изменений)
-    await asyncio.sleep(2)
-    actual_files = get_actual_files(user_id)
+    # Дожидаемся загрузок, начатых в process_input; в заявку попадают только её файлы
+    stored_files = await wait_for_downloads(user_id)  # {ключ файла: итоговое расположение}
 
     file_list = data.get("file_list", "")
     if isinstance(file_list, str) and file_list:
@@ -93,53 +78,71 @@ async def get_contacts(message: types.Message, state: FSMContext, bot: Bot):
     elif not isinstance(file_list, list):
         file_list = []
 
-    file_list.extend(actual_files)
-    file_list = sorted(set(file_list))
+    file_names = data.get("file_names", {})
+    order_files = {}  # Итоговое расположение → исходное имя
+    for key in file_list:
+        location = stored_files.get(key, key)
+        if location:
+            order_files[location] = file_names.get(key, os.path.basename(location))
+    file_list = sorted(order_files)
 
     await state.update_data(file_list=",".join(file_list))
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    client_type = data.get("client_type", "").lower()
-    sheet_name = "Оптовые клиенты" if client_type == "оптовый" else "Розничные клиенты"
-
-    if client_type == "оптовый":
-        headers = ["Имя клиента", "ID", "Проект", "Файлы", "Комментарий", "Контакты", "Дата", "Кол-во", "Статус"]
-        row = [
-            data.get("name", ""), user_id, data.get("opt_project", ""),
-            ", ".join(file_list), data.get("combined_comment", "").strip(),
-            contacts, timestamp, len(file_list), "Новый"
-        ]
-    else:
-        headers = ["Имя клиента", "ID", "Проект", "Кладбище", "Файлы", "Комментарий", "Контакты", "Дата", "Кол-во", "Статус"]
-        row = [
-            data.get("name", ""), user_id, data.get("item_interest", ""), data.get("cemetery", ""),
-            ", ".join(file_list), data.get("combined_comment", "").strip(),
-            contacts, timestamp, len(file_list), "Новый"
-        ]
+    # Манифест связывает заявку с файлами хранилища и их исходными именами
+    write_order_manifest(user_id, timestamp, [{"path": path, "name": order_files[path]} for path in file_list])
 
-    try:
-        worksheet = await get_google_sheet(sheet_name)
-        await initialize_google_sheet(worksheet, headers)
-        await worksheet.append_row(row)
-
-        await message.answer(get_text(lang, "thank_you"))
-
-        if MANAGER_ID:
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="📋 Подробнее", callback_data=f"details_{user_id}")]
-            ])
-            notification = (
+    client_type = data.get("client_type", "").lower()
+    schema = WHOLESALE_SCHEMA if client_type == "оптовый" else RETAIL_SCHEMA
+
+    values = {
+        "Имя клиента": data.get("name", ""),
+        "ID": user_id,
+        "Проект": data.get("opt_project", "") if schema is WHOLESALE_SCHEMA else data.get("item_interest", ""),
+        "Файлы": ", ".join(file_list),
+        "Комментарий": data.get("combined_comment", "").strip(),
+        "Контакты": contacts,
+        "Дата": timestamp,
+        "Кол-во": len(file_list),
+        "Статус": "Новый",
+    }
+    if schema is RETAIL_SCHEMA:
+        values["Кладбище"] = data.get("cemetery", "")
+    row = schema.build_row(values)
+
+    notification = None
+    if MANAGER_ID:
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="📋 Подробнее", callback_data=f"details_{user_id}")]
+        ])
+        notification = {
+            "chat_id": MANAGER_ID,
+            "text": (
                 f"📝 *{get_text(lang, 'new_order')}*\n"
                 f"📅 *{get_text(lang, 'date')}:* {timestamp}\n\n"
                 f"👤 *{get_text(lang, 'client')}:* {data.get('name', 'Unknown')}\n"
                 f"📌 *{get_text(lang, 'category')}:* {client_type.capitalize()}\n"
                 f"🗒 *{get_text(lang, 'comment')}:* {data.get('combined_comment', '').strip()}\n"
                 f"📂 *{get_text(lang, 'files')}:* {len(file_list)}"
-            )
-            await bot.send_message(MANAGER_ID, notification, reply_markup=keyboard, parse_mode="Markdown")
+            ),
+            "reply_markup": keyboard.model_dump(exclude_none=True),
+            "parse_mode": "Markdown",
+        }
+
+    try:
+        # Строка и уведомление сохраняются в журнал одной транзакцией; в таблицу и
+        # менеджеру их доставит диспетчер заявок, поэтому клиент получает ответ сразу
+        row_payload = {"sheet": schema.name, "row": row, "client_id": str(user_id), "date": timestamp}
+        order_key = f"{user_id}:{timestamp}"
+        if await get_order_outbox().add_order(order_key, row_payload, notification):
+            wake_order_dispatcher()
+            await message.answer(get_text(lang, "thank_you"))
+        else:
+            logger.warning(f"Заявка {order_key} уже сохранена, повтор не принят.")
+            await message.answer(get_text(lang, "order_already_received"))
 
     except Exception as e:
-        logger.error(f"Ошибка записи в Google Sheets: {e}")
+        logger.error(f"Ошибка сохранения заявки: {e}")
         await message.answer(get_text(lang, "error_saving_data"))
 
     finally:
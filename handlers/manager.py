@@ -1,14 +1,17 @@
 # handlers/manager.py
-import asyncio
 import os
 from aiogram.filters import Command
 from aiogram import Bot, Router, types
-from aiogram.types import CallbackQuery, InputMediaDocument, FSInputFile
+from aiogram.types import CallbackQuery, InputMediaDocument, InputMediaPhoto, FSInputFile
 from core.utils.logging_utils import setup_logger
-from core.google_sheets import get_google_sheet, update_client_status
+from core.google_drive import DRIVE_FILE_PREFIX, get_drive_file_url
+from core.google_sheets import get_client_row, update_client_status
+from core.sheet_schema import WHOLESALE_SHEET, RETAIL_SHEET, get_schema
 from html import escape
 from dotenv import load_dotenv
-from core.utils.locales import get_text, load_user_languages  # Добавлен импорт мультиязычности
+from core.utils.file_utils import read_order_file_names
+from core.utils.telegram_file_cache import get_telegram_file_cache
+from core.utils.locales import get_text  # Добавлен импорт мультиязычности
 
 router = Router()
 logger = setup_logger(__name__)
@@ -18,24 +21,81 @@ GOOGLE_SHEET_URL = os.getenv("GOOGLE_SHEET_URL")
 
 def determine_sheet_name(message_text: str) -> str:
     """Определяет, в какой лист записывать данные"""
-    return "Оптовые клиенты" if "опт" in message_text.lower() else "Розничные клиенты"
+    return WHOLESALE_SHEET if "опт" in message_text.lower() else RETAIL_SHEET
 
 async def get_client_data(sheet_name: str, client_id: str):
-    """Получает данные клиента из Google Sheets"""
-    worksheet = await get_google_sheet(sheet_name)
-    all_data = await worksheet.get_all_values()
-    return next((row for row in all_data if str(row[1]).strip() == str(client_id).strip()), None)
+    """Получает данные клиента из локальной копии Google Sheets"""
+    return await get_client_row(sheet_name, client_id)
 
-async def get_valid_files(file_list: str):
-    """Проверяет наличие файлов и разделяет их на найденные и отсутствующие"""
+async def get_valid_files(file_list: str, file_names: dict = None):
+    """
+    Проверяет наличие файлов и разделяет их на найденные и отсутствующие.
+
+    Для файлов, уже известных Telegram, вместо содержимого берётся сохранённый file_id.
+
+    Returns:
+        tuple: Найденные файлы [(путь, file_id или FSInputFile, тип вложения)] и отсутствующие пути.
+    """
     if not file_list:
         return [], []
 
-    files = [file.strip().replace("\\", "/") for file in file_list.split(",") if file.strip()]
-    valid_files = [FSInputFile(f) for f in files if os.path.exists(f)]
-    missing_files = [f for f in files if not os.path.exists(f)]
+    file_names = file_names or {}
+    files = [
+        file.strip().replace("\\", "/") for file in file_list.split(",")
+        if file.strip() and not file.strip().startswith(DRIVE_FILE_PREFIX)  # Файлы в Drive отправляются ссылками
+    ]
+    cached = get_telegram_file_cache().get_many(files)
+    valid_files = []
+    missing_files = []
+    for f in files:
+        if f in cached:
+            file_id, kind = cached[f]
+            valid_files.append((f, file_id, kind))
+        elif os.path.exists(f):
+            valid_files.append((f, FSInputFile(f, filename=file_names.get(f)), "document"))
+        else:
+            missing_files.append(f)
     return valid_files, missing_files
 
+async def send_file_batch(bot: Bot, chat_id: int, kind: str, batch: list[tuple]):
+    """
+    Отправляет до 10 файлов одного типа и запоминает file_id загруженных файлов.
+
+    Args:
+        bot (Bot): Экземпляр Telegram Bot.
+        chat_id (int): Чат менеджера.
+        kind (str): Тип вложения: photo или document.
+        batch (list[tuple]): Файлы [(путь, file_id или FSInputFile)].
+    """
+    media_type = InputMediaPhoto if kind == "photo" else InputMediaDocument
+    if len(batch) == 1:
+        send = bot.send_photo if kind == "photo" else bot.send_document
+        messages = [await send(chat_id, batch[0][1])]
+    else:
+        messages = await bot.send_media_group(chat_id, [media_type(media=media) for _, media in batch])
+
+    cache = get_telegram_file_cache()
+    for (path, media), sent in zip(batch, messages):
+        if isinstance(media, FSInputFile) and sent.document:
+            cache.remember(path, sent.document.file_id, "document")
+
+async def send_files_with_fallback(bot: Bot, chat_id: int, kind: str, batch: list[tuple], file_names: dict):
+    """Отправляет пачку файлов; если сохранённые file_id устарели, отправляет файлы с диска."""
+    try:
+        await send_file_batch(bot, chat_id, kind, batch)
+    except Exception as e:
+        stale = [path for path, media in batch if not isinstance(media, FSInputFile)]
+        if not stale:
+            raise
+        logger.warning(f"Отправка по file_id не удалась ({e}), отправляем файлы с диска.")
+        cache = get_telegram_file_cache()
+        for path in stale:
+            cache.forget(path)
+        batch = [(path, FSInputFile(path, filename=file_names.get(path))) for path, _ in batch if os.path.exists(path)]
+        if not batch:
+            raise
+        await send_file_batch(bot, chat_id, "document", batch)
+
 @router.callback_query(lambda c: c.data.startswith("details_"))
 async def send_details(callback: CallbackQuery, bot: Bot):
     """Отправляет менеджеру всю информацию о клиенте + файлы и скрывает кнопки."""
@@ -49,40 +109,50 @@ async def send_details(callback: CallbackQuery, bot: Bot):
         return
 
     status_updated = await update_client_status(sheet_name, client_id, "Просмотрено")
-    files_column_index = 3 if sheet_name == "Оптовые клиенты" else 4
+    schema = get_schema(sheet_name)
+    client = schema.row_to_dict(client_data)
 
     details_msg = (
         f"📋 <b>{get_text('ru', 'order_details')}:</b>\n"
-        f"👤 <b>{get_text('ru', 'client')}:</b> {escape(client_data[0])}\n"
-        f"📌 <b>{get_text('ru', 'category')}:</b> {escape(client_data[2])}\n"
-        f"📂 <b>{get_text('ru', 'files')}:</b> {escape(client_data[files_column_index])}\n"
-        f"🗒 <b>{get_text('ru', 'comment')}:</b> {escape(client_data[files_column_index + 1])}\n"
-        f"📲 <b>{get_text('ru', 'contacts')}:</b> {escape(client_data[files_column_index + 2])}\n"
-        f"📅 <b>{get_text('ru', 'date')}:</b> {escape(client_data[files_column_index + 3])}\n"
-        f"📁 <b>{get_text('ru', 'file_count')}:</b> {escape(client_data[files_column_index + 4])}\n"
+        f"👤 <b>{get_text('ru', 'client')}:</b> {escape(client['Имя клиента'])}\n"
+        f"📌 <b>{get_text('ru', 'category')}:</b> {escape(client['Проект'])}\n"
+        f"📂 <b>{get_text('ru', 'files')}:</b> {escape(client['Файлы'])}\n"
+        f"🗒 <b>{get_text('ru', 'comment')}:</b> {escape(client['Комментарий'])}\n"
+        f"📲 <b>{get_text('ru', 'contacts')}:</b> {escape(client['Контакты'])}\n"
+        f"📅 <b>{get_text('ru', 'date')}:</b> {escape(client['Дата'])}\n"
+        f"📁 <b>{get_text('ru', 'file_count')}:</b> {escape(client['Кол-во'])}\n"
         f"📝 <b>{get_text('ru', 'status')}:</b> {'✅ ' + get_text('ru', 'updated') if status_updated else '⚠ ' + get_text('ru', 'error')}"
     )
 
     await callback.message.edit_text(details_msg, parse_mode="HTML")
 
     # Обрабатываем файлы
-    valid_files, missing_files = await get_valid_files(client_data[files_column_index])
+    file_names = read_order_file_names(client_id, client['Дата'])  # Исходные имена из манифеста заявки
+    valid_files, missing_files = await get_valid_files(client['Файлы'], file_names)
+
+    drive_files = [file.strip() for file in client['Файлы'].split(",") if file.strip().startswith(DRIVE_FILE_PREFIX)]
+    if drive_files:
+        links = [
+            f'<a href="{get_drive_file_url(file)}">{escape(file_names.get(file, file))}</a>' for file in drive_files
+        ]
+        await callback.message.answer(f"📂 {get_text('ru', 'files')}:\n" + "\n".join(links), parse_mode="HTML")
 
     if missing_files:
         logger.warning(f"⚠ {get_text('ru', 'missing_files')}: {missing_files}")
         await callback.message.answer(f"⚠ {get_text('ru', 'missing_files')}:\n" + "\n".join(missing_files))
 
-    # Отправляем файлы по 10 за раз
-    for i in range(0, len(valid_files), 10):
-        batch = valid_files[i:i + 10]
-        media_group = [InputMediaDocument(media=file) for file in batch]
-
-        try:
-            await bot.send_media_group(callback.message.chat.id, media_group)
-            await asyncio.sleep(1)
-        except Exception as e:
-            logger.error(f"{get_text('ru', 'error_sending_files')}: {e}")
-            await callback.message.answer(get_text('ru', "error_sending_files"))
+    # Отправляем файлы по 10 за раз: фото и документы — отдельными альбомами
+    chat_id = callback.message.chat.id
+    for kind in ("photo", "document"):
+        files = [(path, media) for path, media, file_kind in valid_files if file_kind == kind]
+        for i in range(0, len(files), 10):
+            batch = files[i:i + 10]
+
+            try:
+                await send_files_with_fallback(bot, chat_id, kind, batch, file_names)  # Темп задаёт BotRateLimiter
+            except Exception as e:
+                logger.error(f"{get_text('ru', 'error_sending_files')}: {e}")
+                await callback.message.answer(get_text('ru', "error_sending_files"))
 
     await callback.answer(get_text("ru", "info_sent_to_manager"))
 
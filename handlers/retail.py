@@ -6,7 +6,7 @@ from aiogram.types import ContentType
 from handlers.common import process_input
 from core.states import Form
 from core.utils.logging_utils import setup_logger
-from core.utils.locales import get_text, load_user_languages  # Добавлен импорт мультиязычности
+from core.utils.locales import get_text, get_user_language  # Добавлен импорт мультиязычности
 
 logger = setup_logger(__name__)
 
@@ -22,7 +22,7 @@ async def get_item_interest(callback_query: types.CallbackQuery, state: FSMConte
 
         # Определение языка пользователя
         data = await state.get_data()
-        lang = data.get("language", load_user_languages().get(str(user_id), "ru"))
+        lang = data.get("language") or get_user_language(user_id)
 
         logger.info(f"Выбран интерес: {item_interest} (пользователь {user_id}).")
 
@@ -46,7 +46,7 @@ async def get_cemetery(message: types.Message, state: FSMContext):
 
         # Определение языка пользователя
         data = await state.get_data()
-        lang = data.get("language", load_user_languages().get(str(user_id), "ru"))
+        lang = data.get("language") or get_user_language(user_id)
 
         logger.info(f"Введено кладбище: {cemetery} (пользователь {user_id}).")
 
@@ -64,7 +64,7 @@ async def get_monument_details(message: types.Message, state: FSMContext, bot: B
 
         # Определение языка пользователя
         data = await state.get_data()
-        lang = data.get("language", load_user_languages().get(str(user_id), "ru"))
+        lang = data.get("language") or get_user_language(user_id)
 
         logger.info(f"Получены данные о памятнике от пользователя {user_id}.")
         await process_input(message, state, bot=bot)
@@ -80,7 +80,7 @@ async def get_item_details(message: types.Message, state: FSMContext, bot: Bot):
 
         # Определение языка пользователя
         data = await state.get_data()
-        lang = data.get("language", load_user_languages().get(str(user_id), "ru"))
+        lang = data.get("language") or get_user_language(user_id)
 
         logger.info(f"Получены данные о предмете от пользователя {user_id}.")
         await process_input(message, state, bot=bot)
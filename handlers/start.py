@@ -5,7 +5,7 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from core.states import Form
 from core.utils.logging_utils import setup_logger
-from core.utils.locales import get_text, save_user_language  # Добавлен импорт локализации
+from core.utils.locales import SUPPORTED_LANGUAGES, get_text, save_user_language  # Добавлен импорт локализации
 
 # Настройка логгера
 logger = setup_logger(__name__)
@@ -23,8 +23,7 @@ async def start_command(message: Message, state: FSMContext):
         user_lang = getattr(message.from_user, "language_code", "en")[:2]  # Определение языка пользователя
 
         # Проверка поддерживаемых языков
-        supported_languages = ["ru", "uk", "pl", "en"]
-        if user_lang not in supported_languages:
+        if user_lang not in SUPPORTED_LANGUAGES:
             user_lang = "en"
             await message.answer("⚠ Your language is not supported. Defaulting to English. You can change it in the menu.")
 
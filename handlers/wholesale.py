@@ -12,7 +12,7 @@ from aiogram.types import ContentType
 from handlers.common import process_input
 from core.states import Form
 from core.utils.logging_utils import setup_logger
-from core.utils.locales import get_text, load_user_languages  # Добавлен импорт мультиязычности
+from core.utils.locales import get_text, get_user_language  # Добавлен импорт мультиязычности
 
 # Настройка логгера
 logger = setup_logger(__name__)
@@ -30,7 +30,7 @@ async def get_opt_project(callback_query: types.CallbackQuery, state: FSMContext
 
         # Определение языка пользователя
         data = await state.get_data()
-        lang = data.get("language", load_user_languages().get(str(user_id), "ru"))
+        lang = data.get("language") or get_user_language(user_id)
 
         logger.info(f"Выбран тип проекта: {opt_project} (пользователь {user_id}).")
 
@@ -48,7 +48,7 @@ async def get_wholesale_details(message: types.Message, state: FSMContext, bot:
 
         # Определение языка пользователя
         data = await state.get_data()
-        lang = data.get("language", load_user_languages().get(str(user_id), "ru"))
+        lang = data.get("language") or get_user_language(user_id)
 
         logger.info(f"Получены детали от пользователя {user_id}.")
         await process_input(message, state, bot=bot)
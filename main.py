@@ -1,18 +1,30 @@
 # main.py
 import os
 import asyncio
-import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import BotCommand
 from aiohttp import web
 from core.config import BOT_TOKEN, WEBHOOK_URL
+from core.bot_rate_limit import BotRateLimiter
+from core.http_pool import BotSession, close_http_pool
+from core.fsm_storage import create_fsm_storage
+from core.update_queue import UpdateWorkerPool
+from core.update_dedup import create_update_deduplicator
 from handlers import register_all_handlers
-from core.utils.locales import get_text, load_user_languages  # Импорт мультиязычности
+from core.utils.locales import get_text, warm_user_languages  # Импорт мультиязычности
+from core.utils.user_store import get_user_store
+from core.utils.telegram_file_cache import get_telegram_file_cache
+from core.google_drive import start_drive_sync, stop_drive_sync
+from core.google_sheets import (
+    warm_up_sheets, start_token_refresh, stop_token_refresh, stop_sheet_writers, start_sheet_sync, stop_sheet_sync
+)
+from core.order_outbox import start_order_dispatcher, stop_order_dispatcher
+from core.utils.logging_utils import setup_logger
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Настройка логирования: записи aiogram и aiohttp идут через ту же очередь, что и логи бота
+logger = setup_logger(__name__)
+for library in ("aiogram", "aiohttp"):
+    setup_logger(library)
 
 # Проверка токена
 if not BOT_TOKEN:
@@ -20,8 +32,16 @@ if not BOT_TOKEN:
     exit("Ошибка: BOT_TOKEN обязателен для запуска бота.")
 
 # Инициализация бота и диспетчера
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+bot = Bot(token=BOT_TOKEN, session=BotSession())  # Общий пул соединений с Google-клиентами
+bot.session.middleware(BotRateLimiter())  # Лимиты Telegram на исходящие сообщения
+dp = Dispatcher(storage=create_fsm_storage())  # Состояния диалогов переживают перезапуск
+
+async def process_update(update: dict):
+    """Передаёт обновление диспетчеру (выполняется в пуле обработчиков)."""
+    await dp.feed_webhook_update(bot, update)
+
+update_pool = UpdateWorkerPool(process_update)
+update_dedup = create_update_deduplicator()  # Отсев повторных доставок Telegram
 
 async def set_commands(bot: Bot):
     """Установка команд бота."""
@@ -32,15 +52,49 @@ async def set_commands(bot: Bot):
 
 async def on_startup(app: web.Application):
     """Функция запуска при старте сервера."""
+    await get_user_store().start()  # Фоновая запись профилей пользователей
+    await update_dedup.start()  # Фоновая запись принятых update_id
+    await get_telegram_file_cache().start()  # Фоновая запись file_id полученных файлов
+    users_count = warm_user_languages()  # Заполняем кэш языков один раз
+    logger.info(f"Загружены языки {users_count} пользователей.")
+    try:
+        await warm_up_sheets()  # Открываем листы заранее
+    except Exception as e:
+        logger.warning(f"Не удалось заранее открыть листы Google Sheets: {e}")
+    start_token_refresh()
+    start_sheet_sync()  # Локальная копия листов с заявками
+    start_order_dispatcher(bot)  # Доставка заявок из журнала в таблицу и менеджеру
+    start_drive_sync()  # Периодическая выгрузка файлов заявок в Google Drive
+    update_pool.start()
     register_all_handlers(dp)
     await set_commands(bot)
     await bot.set_webhook(WEBHOOK_URL)
     logger.info(get_text("ru", "bot_started_with_webhook"))  # Используем мультиязычность
 
+async def on_shutdown(app: web.Application):
+    """Функция остановки сервера."""
+    await update_pool.stop()  # Дорабатываем принятые обновления
+    await stop_drive_sync()
+    await stop_order_dispatcher()  # Недоставленные заявки остаются в журнале
+    await stop_sheet_writers()  # Дописываем накопленные строки и статусы
+    await stop_sheet_sync()
+    await stop_token_refresh()
+    await get_user_store().stop()  # Сбрасываем несохранённые профили
+    await dp.storage.close()
+    await update_dedup.stop()  # Записываем последние принятые update_id
+    await get_telegram_file_cache().stop()
+    await bot.session.close()
+    await close_http_pool()  # Последним: пулом пользуются бот и клиенты Google
+
 async def webhook_handler(request: web.Request):
-    """Обработчик запросов от Telegram."""
+    """Обработчик запросов от Telegram: отвечает сразу, обработка идёт в фоне."""
     update = await request.json()
-    await dp.feed_webhook_update(bot, update)
+    update_id = update.get("update_id")
+    if update_dedup.is_duplicate(update_id):
+        return web.Response()  # Уже принято: подтверждаем, но не обрабатываем повторно
+    if not update_pool.submit(update):
+        return web.Response(status=503)  # Telegram повторит доставку позже
+    update_dedup.remember(update_id)
     return web.Response()
 
 # 🔹 Добавляем маршрут для keep-alive
@@ -52,6 +106,7 @@ app = web.Application()
 app.router.add_post("/webhook", webhook_handler)
 app.router.add_get("/", healthcheck) # Добавляем маршрут для keep-alive
 app.on_startup.append(on_startup)
+app.on_shutdown.append(on_shutdown)
 
 if __name__ == "__main__":
     web.run_app(app, host="0.0.0.0", port=8080)
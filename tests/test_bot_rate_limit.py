@@ -0,0 +1,78 @@
+# tests/test_bot_rate_limit.py
+import asyncio
+import time
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendDocument, SendMediaGroup, SendMessage
+from aiogram.types import InputMediaPhoto
+from core.bot_rate_limit import BotRateLimiter
+
+
+@pytest.mark.asyncio
+async def test_bot_rate_limiter_priority_and_retry_after():
+    """
+    Ответы пользователям обгоняют отправку файлов, после 429 запрос повторяется.
+    """
+    limiter = BotRateLimiter(global_rate=20, chat_rate=100)
+    sent = []
+    failures = {"retry": 1}
+
+    async def make_request(bot, method):
+        if method.chat_id == 99 and failures["retry"]:
+            failures["retry"] -= 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)
+        sent.append(method.chat_id)
+        return True
+
+    # Исчерпываем общий запас токенов
+    await asyncio.gather(*(limiter(make_request, None, SendMessage(chat_id=i, text="x")) for i in range(1, 21)))
+    sent.clear()
+
+    bulk = [limiter(make_request, None, SendDocument(chat_id=100 + i, document="file_id")) for i in range(3)]
+    replies = [limiter(make_request, None, SendMessage(chat_id=200 + i, text="x")) for i in range(2)]
+    await asyncio.gather(*bulk, *replies)
+    assert sent[:2] == [200, 201]
+
+    await limiter(make_request, None, SendMessage(chat_id=99, text="x"))
+    assert sent[-1] == 99 and limiter.retried == 1
+
+
+@pytest.mark.asyncio
+async def test_bot_rate_limiter_charges_album_per_file():
+    """
+    Альбом расходует токены чата по числу файлов, как и общий лимит.
+    """
+    limiter = BotRateLimiter(global_rate=100, chat_rate=1)
+
+    async def make_request(bot, method):
+        return True
+
+    album = SendMediaGroup(chat_id=5, media=[InputMediaPhoto(media=f"photo_{i}") for i in range(3)])
+    await limiter(make_request, None, album)
+    assert limiter._chat_bucket(5).delay() > 2  # Следующее сообщение ждёт, пока не восполнятся 3 токена
+
+
+@pytest.mark.asyncio
+async def test_bot_rate_limiter_retry_after_pauses_all_chats():
+    """
+    После 429 сообщения в другие чаты тоже ждут retry_after, а не уходят сразу.
+    """
+    limiter = BotRateLimiter(global_rate=100, chat_rate=100)
+    sent = []
+    failures = {"retry": 1}
+
+    async def make_request(bot, method):
+        if failures["retry"]:
+            failures["retry"] -= 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0.2)
+        sent.append((method.chat_id, time.monotonic()))
+        return True
+
+    started = time.monotonic()
+    first = asyncio.create_task(limiter(make_request, None, SendMessage(chat_id=1, text="x")))
+    await asyncio.sleep(0.01)  # Первый запрос получил 429
+    await limiter(make_request, None, SendMessage(chat_id=2, text="x"))
+    await first
+
+    assert {chat_id for chat_id, _ in sent} == {1, 2}
+    assert all(sent_at - started >= 0.19 for _, sent_at in sent)
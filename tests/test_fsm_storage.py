@@ -0,0 +1,31 @@
+# tests/test_fsm_storage.py
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+from core.fsm_storage import SQLiteStorage
+from core.states import Form
+
+
+@pytest.mark.asyncio
+async def test_sqlite_fsm_storage_persists_state(tmp_path):
+    """
+    Состояние и данные FSM сохраняются в базе и доступны новому экземпляру хранилища.
+    """
+    db_path = str(tmp_path / "bot.sqlite3")
+    key = StorageKey(bot_id=1, chat_id=2, user_id=3)
+
+    storage = SQLiteStorage(db_path=db_path)
+    await storage.set_state(key, Form.contacts)
+    await storage.update_data(key, {"name": "Анна"})
+    assert await storage.update_data(key, {"language": "uk"}) == {"name": "Анна", "language": "uk"}
+    await storage.close()
+
+    restarted = SQLiteStorage(db_path=db_path)
+    assert await restarted.get_state(key) == Form.contacts.state
+    assert await restarted.get_data(key) == {"name": "Анна", "language": "uk"}
+
+    expired = SQLiteStorage(db_path=db_path, state_ttl=-1)
+    await expired.set_data(key, {"name": "Анна"})
+    assert await expired.get_state(key) is None
+    assert await expired.get_data(key) == {}
+    await restarted.close()
+    await expired.close()
@@ -1,7 +1,16 @@
 # tests/test_google_drive.py
 import asyncio
-from core.google_drive import get_authenticated_client
+import os
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from aiogram.types import Document, Message, User
+import core.google_drive as google_drive
+from core.drive_manifest import DriveSyncManifest
+from core.google_drive import get_authenticated_client, get_pending_files
+from core.utils.file_utils import wait_for_downloads
 from aiogoogle import Aiogoogle
+from aiogoogle.excs import HTTPError
 
 async def check_drive_access():
     """Проверяет доступ сервисного аккаунта к Google Drive"""
@@ -22,8 +31,6 @@ async def check_drive_access():
     except Exception as e:
         print(f"❌ Ошибка доступа к Google Drive: {e}")
 
-asyncio.run(check_drive_access())
-
 async def list_drive_files():
     """Проверяет доступ сервисного аккаунта и выводит список файлов"""
     try:
@@ -43,5 +50,166 @@ async def list_drive_files():
     except Exception as e:
         print(f"❌ Ошибка при запросе списка файлов: {e}")
 
+
+@pytest.mark.asyncio
+async def test_upload_resumable_sends_chunks_and_resumes():
+    """
+    Resumable upload отправляет части по DRIVE_CHUNK_SIZE и продолжает с байта, принятого Drive.
+    """
+    sent = []
+
+    class FakeClient:
+        async def as_service_account(self, request, full_res=False):
+            if request.method == "POST":
+                return SimpleNamespace(status_code=200, headers={"Location": "https://upload/session"}, json=None)
+            sent.append((request.headers["Content-Range"], len(request.data)))
+            if len(sent) == 1:
+                # Drive принял только часть первого куска
+                return SimpleNamespace(status_code=308, headers={"Range": "bytes=0-2"}, json=None)
+            last_byte = int(request.headers["Content-Range"].split("-")[1].split("/")[0])
+            if last_byte == 9:
+                return SimpleNamespace(status_code=200, headers={}, json={"id": "drive_file"})
+            return SimpleNamespace(status_code=308, headers={"Range": f"bytes=0-{last_byte}"}, json=None)
+
+    async def chunks():
+        for piece in (b"01234", b"56789"):
+            yield piece
+
+    progress = []
+    with patch.object(google_drive, "DRIVE_CHUNK_SIZE", 4):
+        file_id = await google_drive.upload_resumable(FakeClient(), {"name": "f"}, chunks(), 10, progress.append)
+
+    assert file_id == "drive_file"
+    assert sent == [("bytes 0-3/10", 4), ("bytes 3-6/10", 4), ("bytes 7-9/10", 3)]
+    assert sum(progress) == 10
+
+
+@pytest.mark.asyncio
+async def test_put_chunk_retries_through_google_error_handler():
+    """
+    Сбой отправки части повторяется общим обработчиком ошибок: повтор узнаёт у Drive, сколько байт принято.
+    """
+    requests = []
+
+    class FakeClient:
+        async def as_service_account(self, request, full_res=False):
+            requests.append(request.headers["Content-Range"])
+            if len(requests) == 1:
+                raise HTTPError("backend error", res=SimpleNamespace(status_code=503, json={}))
+            return SimpleNamespace(status_code=308, headers={"Range": "bytes=0-1"}, json=None)
+
+    with patch("core.utils.google_utils.get_retry_delay", return_value=0):
+        response = await google_drive._put_chunk(FakeClient(), "https://upload/session", 0, b"0123", 10)
+
+    assert requests == ["bytes 0-3/10", "bytes */10"]
+    assert response.headers["Range"] == "bytes=0-1"
+
+
+def test_drive_manifest_skips_uploaded_files(tmp_path):
+    """
+    Выгруженные файлы пропускаются; «тронутый» файл с прежним содержимым не выгружается повторно.
+    """
+    manifest = DriveSyncManifest(str(tmp_path / "bot.sqlite3"))
+    first, second = tmp_path / "a.jpg", tmp_path / "b.jpg"
+    first.write_bytes(b"first")
+    second.write_bytes(b"second")
+    paths = [str(first), str(second)]
+
+    pending = get_pending_files(manifest, "42", paths)
+    assert [item[0] for item in pending] == paths
+
+    manifest.set_folder("42", "folder_1")
+    path, size, mtime, sha256, drive_id = pending[0]
+    assert drive_id is None
+    manifest.record_file("42", path, size, mtime, sha256, "drive_a")
+    assert [item[0] for item in get_pending_files(manifest, "42", paths)] == [str(second)]
+
+    os.utime(first, (mtime + 10, mtime + 10))
+    assert [item[0] for item in get_pending_files(manifest, "42", paths)] == [str(second)]
+    first.write_bytes(b"changed")
+    pending = get_pending_files(manifest, "42", paths)
+    assert [item[0] for item in pending] == paths
+    assert pending[0][4] == "drive_a"  # Изменившийся файл обновляется на месте
+    assert manifest.folder_id("42") == "folder_1"
+    manifest.close()
+
+
+@pytest.mark.asyncio
+async def test_upload_file_updates_changed_file_in_place(tmp_path):
+    """
+    Изменившийся файл заменяется в Drive на месте; удалённый вручную выгружается заново.
+    """
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"changed")
+    not_found = HTTPError("not found", res=SimpleNamespace(status_code=404))
+
+    with patch.object(google_drive, "_update_multipart", AsyncMock(return_value="drive_a")) as update, \
+            patch.object(google_drive, "_upload_multipart", AsyncMock(return_value="drive_b")) as create:
+        assert await google_drive.upload_file(Aiogoogle(), str(path), "folder", sha256="abc", file_id="drive_a") == "drive_a"
+        create.assert_not_awaited()
+        assert "parents" not in update.call_args.args[2]
+
+        update.side_effect = not_found
+        assert await google_drive.upload_file(Aiogoogle(), str(path), "folder", sha256="abc", file_id="drive_a") == "drive_b"
+        assert create.call_args.args[1]["parents"] == ["folder"]
+
+
+@pytest.mark.asyncio
+async def test_drive_stream_resolves_order_entry(tmp_path):
+    """
+    В режиме FILE_PIPELINE=drive файл заявки после передачи заменяется на 'drive:<ID>'.
+    """
+    message = AsyncMock(spec=Message)
+    message.photo = None
+    message.document = Document(file_id="doc", file_unique_id="uniq", file_name="plan.pdf", file_size=3)
+    message.from_user = User(id=555, is_bot=False, first_name="TestUser")
+
+    manifest = DriveSyncManifest(str(tmp_path / "bot.sqlite3"))
+    manifest.record_file(555, "telegram:uniq", 3, 0, "", "already_uploaded")
+    with patch.object(google_drive, "_drive_manifest", manifest):
+        key, name, _ = google_drive.start_drive_stream(message, bot=AsyncMock())
+        results = await wait_for_downloads(555)
+
+    assert (key, name) == ("telegram:uniq", "plan.pdf")
+    assert results == {"telegram:uniq": "drive:already_uploaded"}
+    manifest.close()
+
+
+@pytest.mark.asyncio
+async def test_drive_stream_cancelled_on_timeout(tmp_path):
+    """
+    Передачу, которую заявка не дождалась, отменяют, а успевший появиться файл удаляют из Drive.
+    """
+    message = AsyncMock(spec=Message)
+    message.photo = None
+    message.document = Document(file_id="doc", file_unique_id="slow", file_name="plan.pdf", file_size=3)
+    message.from_user = User(id=556, is_bot=False, first_name="TestUser")
+    bot = AsyncMock()
+    bot.get_file.return_value = SimpleNamespace(file_path="path/plan.pdf", file_size=3)
+    bot.session = MagicMock()
+
+    async def hang(*args, **kwargs):
+        await asyncio.Event().wait()
+
+    manifest = DriveSyncManifest(str(tmp_path / "bot.sqlite3"))
+    delete = AsyncMock()
+    with patch.object(google_drive, "_drive_manifest", manifest), \
+            patch.object(google_drive, "get_authenticated_client", AsyncMock()), \
+            patch.object(google_drive, "get_client_folder", AsyncMock(return_value="folder")), \
+            patch.object(google_drive, "upload_resumable", hang), \
+            patch.object(google_drive, "find_streamed_file", AsyncMock(return_value="orphan")), \
+            patch.object(google_drive, "delete_drive_file", delete):
+        _, _, task = google_drive.start_drive_stream(message, bot)
+        assert await wait_for_downloads(556, timeout=0.05) == {"telegram:slow": None}
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.gather(*google_drive._stream_cleanups)
+
+    assert task.cancelled()
+    delete.assert_awaited_once()
+    assert delete.call_args.args[1] == "orphan"
+    manifest.close()
+
+
 if __name__ == "__main__":
-    asyncio.run(list_drive_files())
\ No newline at end of file
+    asyncio.run(check_drive_access())
+    asyncio.run(list_drive_files())
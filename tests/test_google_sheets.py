@@ -1,16 +1,31 @@
 # tests/test_google_sheets.py
+import asyncio
 import logging
 import pytest
 from unittest.mock import AsyncMock, patch
-from core.google_sheets import get_google_sheet, initialize_google_sheet
+from aiogoogle import Aiogoogle
+from core.google_sheets import get_google_sheet, initialize_google_sheet, invalidate_sheet_cache
+from core.sheet_index import SheetIndex
+from core.sheet_mirror import SheetMirror
+from core.sheet_quota import PRIORITY_SYNC, PRIORITY_WRITE, READ, QuotaScheduler, sheets_priority
+from core.sheet_schema import RETAIL_SCHEMA, SheetSchema, column_letter
+from core.sheet_writer import SheetWriter
+from core.sheets_client import SheetsClient, WorksheetNotFound
 from core.utils.logging_utils import setup_logger
 
 # Настройка логгера
 logger = setup_logger("core.google_sheets")
 
+@pytest.fixture(autouse=True)
+def reset_sheet_cache():
+    """Каждый тест начинает с пустым кэшем листов."""
+    invalidate_sheet_cache()
+    yield
+    invalidate_sheet_cache()
+
 @pytest.mark.asyncio
-@patch("core.google_sheets.agcm.authorize", new_callable=AsyncMock)
-async def test_get_google_sheet_existing(mock_authorize):
+@patch("core.google_sheets.get_sheets_client")
+async def test_get_google_sheet_existing(mock_get_client):
     """
     Тестирование получения существующего листа.
     """
@@ -18,7 +33,7 @@ async def test_get_google_sheet_existing(mock_authorize):
     mock_spreadsheet = AsyncMock()
     mock_worksheet = AsyncMock()
 
-    mock_authorize.return_value = mock_client
+    mock_get_client.return_value = mock_client
     mock_client.open_by_key.return_value = mock_spreadsheet
     mock_spreadsheet.worksheet.return_value = mock_worksheet
 
@@ -29,8 +44,8 @@ async def test_get_google_sheet_existing(mock_authorize):
 
 
 @pytest.mark.asyncio
-@patch("core.google_sheets.agcm.authorize", new_callable=AsyncMock)
-async def test_get_google_sheet_new(mock_authorize):
+@patch("core.google_sheets.get_sheets_client")
+async def test_get_google_sheet_new(mock_get_client):
     """
     Тестирование создания нового листа, если он не существует.
     """
@@ -38,7 +53,7 @@ async def test_get_google_sheet_new(mock_authorize):
     mock_spreadsheet = AsyncMock()
     mock_worksheet = AsyncMock()
 
-    mock_authorize.return_value = mock_client
+    mock_get_client.return_value = mock_client
     mock_client.open_by_key.return_value = mock_spreadsheet
     mock_spreadsheet.worksheet.side_effect = Exception("Sheet not found")
     mock_spreadsheet.add_worksheet.return_value = mock_worksheet
@@ -49,8 +64,32 @@ async def test_get_google_sheet_new(mock_authorize):
 
 
 @pytest.mark.asyncio
-@patch("core.google_sheets.AsyncioGspreadWorksheet.append_row", new_callable=AsyncMock)
-@patch("core.google_sheets.AsyncioGspreadWorksheet.row_values", new_callable=AsyncMock)
+@patch("core.google_sheets.get_sheets_client")
+async def test_get_google_sheet_cached(mock_get_client):
+    """
+    Повторные и параллельные обращения к листу не открывают таблицу заново.
+    """
+    mock_client = AsyncMock()
+    mock_spreadsheet = AsyncMock()
+    mock_worksheet = AsyncMock()
+
+    mock_get_client.return_value = mock_client
+    mock_client.open_by_key.return_value = mock_spreadsheet
+    mock_spreadsheet.worksheet.return_value = mock_worksheet
+
+    sheets = await asyncio.gather(*(get_google_sheet(sheet_name="TestSheet") for _ in range(5)))
+    assert all(sheet == mock_worksheet for sheet in sheets)
+    mock_get_client.assert_called_once()
+    mock_spreadsheet.worksheet.assert_called_once_with("TestSheet")
+
+    invalidate_sheet_cache("TestSheet")
+    await get_google_sheet(sheet_name="TestSheet")
+    assert mock_spreadsheet.worksheet.call_count == 2
+
+
+@pytest.mark.asyncio
+@patch("core.google_sheets.Worksheet.append_row", new_callable=AsyncMock)
+@patch("core.google_sheets.Worksheet.row_values", new_callable=AsyncMock)
 async def test_initialize_google_sheet(mock_row_values, mock_append_row):
     mock_worksheet = AsyncMock()
     mock_worksheet.append_row = mock_append_row  # Привязываем мок
@@ -65,20 +104,20 @@ async def test_initialize_google_sheet(mock_row_values, mock_append_row):
 
 
 @pytest.mark.asyncio
-@patch("core.google_sheets.agcm.authorize", new_callable=AsyncMock)
-async def test_get_google_sheet_error(mock_authorize):
+@patch("core.google_sheets.get_sheets_client")
+async def test_get_google_sheet_error(mock_get_client):
     """
     Тестирование обработки ошибки при доступе к Google Sheets.
     """
-    mock_authorize.side_effect = Exception("Authorization Error")
+    mock_get_client.side_effect = Exception("Authorization Error")
 
     with pytest.raises(RuntimeError, match="Не удалось получить доступ к Google Sheet"):
         await get_google_sheet(sheet_name="TestSheet")
 
 
 @pytest.mark.asyncio
-@patch("core.google_sheets.AsyncioGspreadWorksheet.append_row", new_callable=AsyncMock)
-@patch("core.google_sheets.AsyncioGspreadWorksheet.row_values", new_callable=AsyncMock)
+@patch("core.google_sheets.Worksheet.append_row", new_callable=AsyncMock)
+@patch("core.google_sheets.Worksheet.row_values", new_callable=AsyncMock)
 async def test_initialize_google_sheet_existing_headers(mock_row_values, mock_append_row, caplog):
     # Мок объекта Google Sheet
     mock_worksheet = AsyncMock()
@@ -98,4 +137,176 @@ async def test_initialize_google_sheet_existing_headers(mock_row_values, mock_ap
     mock_worksheet.append_row.assert_not_called()
 
     # Проверка корректности логов
-    assert "Заголовки листа 'Test Sheet' совпадают, обновление не требуется." in caplog.text
\ No newline at end of file
+    assert "Заголовки листа 'Test Sheet' совпадают, обновление не требуется." in caplog.text
+
+
+def test_sheet_schema_columns():
+    """
+    Схема листа переводит имена столбцов в индексы и буквы A1, в том числе после Z.
+    """
+    assert [column_letter(n) for n in (1, 26, 27, 28, 52, 703)] == ["A", "Z", "AA", "AB", "AZ", "AAA"]
+
+    schema = SheetSchema("Wide", [f"col{i}" for i in range(30)])
+    assert schema.cell("col27", 5) == "AB5"
+    assert schema.header_range == "A1:AD1"
+
+    row = RETAIL_SCHEMA.build_row({"ID": 1, "Статус": "Новый"})
+    assert row[RETAIL_SCHEMA.index("Статус")] == "Новый"
+    assert RETAIL_SCHEMA.value(["Имя"], "Статус") == ""
+
+
+@pytest.mark.asyncio
+async def test_initialize_google_sheet_memoized():
+    """
+    Заголовки листа проверяются один раз, повторные вызовы не обращаются к API.
+    """
+    mock_worksheet = AsyncMock()
+    mock_worksheet.title = "Memo Sheet"
+    mock_worksheet.row_values.return_value = ["Header1", "Header2"]
+
+    await initialize_google_sheet(mock_worksheet, ["Header1", "Header2"])
+    await initialize_google_sheet(mock_worksheet, ["Header1", "Header2"])
+
+    mock_worksheet.row_values.assert_called_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_sheet_writer_batches_writes():
+    """
+    Добавления и обновления из одного окна записываются одним вызовом API каждого вида.
+    """
+    mock_worksheet = AsyncMock()
+    mock_worksheet.append_rows.return_value = {"updates": {"updatedRange": "'Test'!A7:C8"}}
+    writer = SheetWriter("Test", AsyncMock(return_value=mock_worksheet), window=0.01)
+
+    first = writer.append(["a"])
+    second = writer.append(["b"])
+    status = writer.update("C2", "Старый")
+    latest = writer.update("C2", "Новый")
+
+    assert await asyncio.gather(first, second, status, latest) == [7, 8, None, None]
+    mock_worksheet.append_rows.assert_called_once_with([["a"], ["b"]])
+    mock_worksheet.batch_update.assert_called_once_with([{"range": "C2", "values": [["Новый"]]}])
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_sheet_index_lookup_and_incremental_updates(tmp_path):
+    """
+    Индекс строится одним чтением листа, обновляется записями писателя и сохраняется в локальной копии.
+    """
+    mock_worksheet = AsyncMock()
+    mock_worksheet.get_all_values.return_value = [
+        list(RETAIL_SCHEMA.headers),
+        RETAIL_SCHEMA.build_row({"Имя клиента": "Анна", "ID": "11", "Статус": "Новый"}),
+    ]
+    mirror = SheetMirror(str(tmp_path / "bot.sqlite3"))
+    index = SheetIndex(RETAIL_SCHEMA, AsyncMock(return_value=mock_worksheet), mirror=mirror)
+
+    assert (await index.find(11))[0] == 2
+    assert await index.find(22) is None
+
+    index.apply_writes(
+        [(3, RETAIL_SCHEMA.build_row({"ID": 22, "Статус": "Новый"}))],
+        {RETAIL_SCHEMA.cell("Статус", 2): "Просмотрено"},
+    )
+
+    row_number, row = await index.find(22)
+    assert row_number == 3
+    assert RETAIL_SCHEMA.value((await index.find(11))[1], "Статус") == "Просмотрено"
+    mock_worksheet.get_all_values.assert_called_once()
+
+    # После перезапуска индекс загружается из локальной копии без чтения листа
+    restarted = SheetIndex(RETAIL_SCHEMA, AsyncMock(side_effect=AssertionError), mirror=mirror)
+    assert (await restarted.find(22))[0] == 3
+    mirror.close()
+
+
+@pytest.mark.asyncio
+async def test_sheet_index_sync_skips_unchanged_spreadsheet(tmp_path):
+    """
+    Сверка читает лист целиком, только если метка изменения таблицы сменилась.
+    """
+    mock_worksheet = AsyncMock()
+    mock_worksheet.get_all_values.return_value = [
+        list(RETAIL_SCHEMA.headers),
+        RETAIL_SCHEMA.build_row({"ID": "11", "Статус": "Новый"}),
+    ]
+    mirror = SheetMirror(str(tmp_path / "bot.sqlite3"))
+    index = SheetIndex(RETAIL_SCHEMA, AsyncMock(return_value=mock_worksheet), mirror=mirror)
+    await index.ensure_loaded()
+
+    assert await index.sync("2026-01-01T00:00:00Z") == 0
+    assert await index.sync("2026-01-01T00:00:00Z") == 0
+    assert mock_worksheet.get_all_values.call_count == 2
+
+    mock_worksheet.get_all_values.return_value = [
+        list(RETAIL_SCHEMA.headers),
+        RETAIL_SCHEMA.build_row({"ID": "11", "Статус": "Выполнен"}),
+    ]
+    assert await index.sync("2026-01-01T00:05:00Z") == 1
+    assert RETAIL_SCHEMA.value((await index.find(11))[1], "Статус") == "Выполнен"
+    assert mock_worksheet.get_all_values.call_count == 3
+    mirror.close()
+
+
+@pytest.mark.asyncio
+async def test_quota_scheduler_priority_and_coalescing():
+    """
+    Одинаковые одновременные чтения выполняются одним запросом, запись получает квоту раньше сверки.
+    """
+    scheduler = QuotaScheduler(read_quota=1)
+    reads = []
+
+    async def read_values():
+        reads.append("values")
+        await asyncio.sleep(0.01)
+        return [["a"]]
+
+    results = await asyncio.gather(*(scheduler.run(READ, read_values, key="Лист!A1") for _ in range(3)))
+    assert results == [[["a"]]] * 3
+    assert reads == ["values"] and scheduler.coalesced == 2
+
+    # Квота чтения исчерпана: ожидающие запросы выстраиваются по приоритету
+    scheduler._windows[READ].period = 0.05
+    order = []
+
+    async def wait_quota(name, priority):
+        with sheets_priority(priority):
+            await scheduler.acquire(READ)
+        order.append(name)
+
+    await asyncio.gather(wait_quota("sync", PRIORITY_SYNC), wait_quota("order", PRIORITY_WRITE))
+    assert order == ["order", "sync"] and scheduler.throttled == 2
+
+
+@pytest.mark.asyncio
+async def test_sheets_client_requests():
+    """
+    Клиент Sheets API v4 строит запросы к листу и разбирает ответы.
+    """
+    client = SheetsClient(Aiogoogle())
+    responses = [
+        {"sheets": [{"properties": {"sheetId": 7, "title": "Розничные клиенты"}}]},
+        {"values": [["ID", "Имя"], ["1"]]},
+        {"updates": {"updatedRange": "'Розничные клиенты'!A3:B3"}},
+        {"sheets": [{"properties": {"sheetId": 7, "title": "Розничные клиенты"}}]},
+    ]
+    client.aiogoogle.as_service_account = AsyncMock(side_effect=responses)
+
+    spreadsheet = await client.open_by_key("sheet-id")
+    worksheet = await spreadsheet.worksheet("Розничные клиенты")
+    assert await worksheet.get_all_values() == [["ID", "Имя"], ["1", ""]]
+    await worksheet.append_rows([["2", "Анна"]])
+
+    append_request = client.aiogoogle.as_service_account.call_args_list[2].args[0]
+    assert append_request.method == "POST"
+    assert append_request.url.startswith(
+        "https://sheets.googleapis.com/v4/spreadsheets/sheet-id/values/"
+        "%27%D0%A0%D0%BE%D0%B7%D0%BD%D0%B8%D1%87%D0%BD%D1%8B%D0%B5"
+    )
+    assert ":append?valueInputOption=RAW" in append_request.url
+    assert append_request.json == {"values": [["2", "Анна"]]}
+
+    with pytest.raises(WorksheetNotFound):
+        await spreadsheet.worksheet("Нет такого листа")
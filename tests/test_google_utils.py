@@ -0,0 +1,87 @@
+# tests/test_google_utils.py
+import pytest
+from unittest.mock import AsyncMock, patch
+from aiogoogle import Aiogoogle
+from aiogoogle.excs import HTTPError
+from aiogoogle.models import Response
+from core.utils import google_utils
+from core.sheets_client import SheetsClient, Spreadsheet, Worksheet
+from core.utils.google_utils import GoogleApiUnavailable, get_circuit, handle_google_api_error
+
+
+def api_error(status, retry_after=None):
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    response = Response(status_code=status, headers=headers, json={"error": {"code": status, "message": "error"}})
+    return HTTPError(f"HTTP {status}", res=response)
+
+
+@pytest.mark.asyncio
+async def test_google_api_retry_and_circuit_breaker():
+    """
+    Временные сбои повторяются, после серии сбоев цепь размыкается и вызовы отклоняются сразу.
+    """
+    calls = {"count": 0}
+
+    @handle_google_api_error(api="test-retry")
+    async def flaky():
+        calls["count"] += 1
+        if calls["count"] < 3:
+            raise RuntimeError("Не удалось") from api_error(503, retry_after="0")
+        return "ok"
+
+    @handle_google_api_error(api="test-retry")
+    async def bad_request():
+        raise api_error(400)
+
+    with patch.object(google_utils, "GOOGLE_RETRY_BASE_DELAY", 0):
+        assert await flaky() == "ok"
+        assert calls["count"] == 3
+        with pytest.raises(HTTPError):
+            await bad_request()  # Ошибка запроса не повторяется
+        circuit = get_circuit("test-retry")
+        assert circuit.retries == 2 and circuit.calls == 2 and circuit.state == "closed"
+
+        @handle_google_api_error(api="test-down")
+        async def down():
+            raise api_error(500)
+
+        get_circuit("test-down").threshold = 2
+        with pytest.raises(HTTPError):
+            await down()
+        assert get_circuit("test-down").state == "open"
+        with pytest.raises(GoogleApiUnavailable):
+            await down()
+        assert google_utils.get_google_api_stats()["test-down"]["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_non_idempotent_calls_retry_only_unapplied_errors():
+    """
+    Неидемпотентный вызов не повторяется после 5xx (Google мог его выполнить), но повторяется после 429.
+    """
+    errors = [api_error(503)]
+    calls = []
+
+    @handle_google_api_error(api="test-append", idempotent=False)
+    async def append():
+        calls.append(1)
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    with patch.object(google_utils, "GOOGLE_RETRY_BASE_DELAY", 0):
+        with pytest.raises(HTTPError):
+            await append()
+        assert len(calls) == 1
+
+        errors.append(api_error(429, retry_after="0"))
+        assert await append() == "ok"
+        assert len(calls) == 3
+
+    # Клиент Sheets помечает добавление строк неидемпотентным, запись значений — идемпотентной
+    call = AsyncMock(return_value={})
+    client = SheetsClient(Aiogoogle(), call=call)
+    worksheet = Worksheet(Spreadsheet(client, "sheet-id"), {"sheetId": 1, "title": "Лист"})
+    await worksheet.append_rows([["a"]])
+    await worksheet.update("A1", [["b"]])
+    assert [args.args[3] for args in call.call_args_list] == [False, True]
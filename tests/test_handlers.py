@@ -1,11 +1,31 @@
 # tests/test_handlers.py
+import asyncio
 import pytest
 from unittest.mock import AsyncMock, patch
-from aiogram.types import Message, PhotoSize, Document, User
+from aiogram.types import Message, PhotoSize, Document, User, FSInputFile
 from aiogram import Bot  # Исправление: импортируем Bot из aiogram
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
 from core.utils.file_utils import save_file
+from core.utils.telegram_file_cache import TelegramFileCache
+from core.utils.user_store import SQLiteUserProfileStore
 from handlers.common import process_input
+import handlers.common as common
+import handlers.manager as manager
+
+
+@pytest.fixture(autouse=True)
+def local_databases(tmp_path):
+    """Кэш file_id и профили во временной базе: тесты не пишут в data/bot.sqlite3 рабочего дерева."""
+    cache = TelegramFileCache(str(tmp_path / "telegram_files.sqlite3"))
+    store = SQLiteUserProfileStore(db_path=str(tmp_path / "profiles.sqlite3"), legacy_file=None)
+    with patch("core.utils.file_utils.get_telegram_file_cache", return_value=cache), \
+            patch("core.utils.locales.get_user_store", return_value=store):
+        yield
+    cache.close()
+    store.close()
+
 
 @pytest.mark.asyncio
 async def test_process_input_text():
@@ -85,3 +105,105 @@ async def test_process_input_error():
             "Произошла ошибка при обработке вашего запроса. Попробуйте снова или обратитесь за поддержкой."
         )
 
+
+
+@pytest.mark.asyncio
+async def test_process_input_album_single_update():
+    """
+    Альбом обрабатывается целиком: одно обновление FSM и один ответ.
+    """
+    state = AsyncMock(spec=FSMContext)
+    state.get_data.return_value = {"file_list": []}
+
+    messages = []
+    for i in range(3):
+        message = AsyncMock(spec=Message)
+        message.content_type = "photo"
+        message.media_group_id = "album_1"
+        message.caption = "Album caption" if i == 0 else None
+        message.from_user = User(id=12345, is_bot=False, first_name="TestUser")
+        message.answer = AsyncMock()
+        messages.append(message)
+
+    started = []
+
+    def fake_download(message, bot):
+        started.append(message)
+        return f"uploads/blobs/photo_{len(started)}.jpg", f"photo_{len(started)}.jpg", None
+
+    with patch.object(common, "ALBUM_WINDOW", 0.01), patch.object(common, "start_file_download", fake_download):
+        for message in messages:
+            await process_input(message, state, bot=None)
+        await asyncio.sleep(0.05)
+
+    assert started == messages
+    state.get_data.assert_called_once()
+    assert state.update_data.call_args_list[0].kwargs == {
+        "file_list": [f"uploads/blobs/photo_{i}.jpg" for i in (1, 2, 3)],
+        "file_names": {f"uploads/blobs/photo_{i}.jpg": f"photo_{i}.jpg" for i in (1, 2, 3)},
+    }
+    messages[0].answer.assert_called_once()
+    for message in messages[1:]:
+        message.answer.assert_not_called()
+    state.set_state.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_process_input_waits_for_pending_album():
+    """
+    Текст, пришедший во время сбора альбома, обрабатывается после альбома и не затирает его файлы.
+    """
+    state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=12345, user_id=12345))
+
+    def make_message(**fields):
+        message = AsyncMock(spec=Message)
+        message.from_user = User(id=12345, is_bot=False, first_name="TestUser")
+        message.answer = AsyncMock()
+        for name, value in fields.items():
+            setattr(message, name, value)
+        return message
+
+    album = [
+        make_message(content_type="photo", media_group_id="album_2", caption="Подпись" if i == 0 else None)
+        for i in range(2)
+    ]
+    text = make_message(content_type="text", text="Уточнение", media_group_id=None)
+
+    def fake_download(message, bot):
+        return f"uploads/blobs/photo_{album.index(message)}.jpg", "photo.jpg", None
+
+    with patch.object(common, "ALBUM_WINDOW", 0.01), patch.object(common, "start_file_download", fake_download):
+        for message in album:
+            await process_input(message, state, bot=None)
+        await process_input(text, state, bot=None)
+
+    data = await state.get_data()
+    assert data["file_list"] == ["uploads/blobs/photo_0.jpg", "uploads/blobs/photo_1.jpg"]
+    assert data["combined_comment"] == "Подпись\nУточнение"
+
+
+@pytest.mark.asyncio
+async def test_send_details_reuses_telegram_file_ids(tmp_path):
+    """
+    Файл, уже загруженный в Telegram, отправляется по file_id; новый file_id запоминается после отправки.
+    """
+    cache = TelegramFileCache(str(tmp_path / "bot.sqlite3"))
+    cache.remember("uploads/blobs/photo.jpg", "photo_file_id", "photo")
+    local = tmp_path / "plan.pdf"
+    local.write_bytes(b"pdf")
+
+    with patch.object(manager, "get_telegram_file_cache", return_value=cache):
+        valid_files, missing = await manager.get_valid_files(
+            f"uploads/blobs/photo.jpg, {local}, uploads/blobs/lost.jpg", {str(local): "План.pdf"}
+        )
+        assert missing == ["uploads/blobs/lost.jpg"]
+        assert valid_files[0] == ("uploads/blobs/photo.jpg", "photo_file_id", "photo")
+        path, media, kind = valid_files[1]
+        assert isinstance(media, FSInputFile) and media.filename == "План.pdf" and kind == "document"
+
+        bot = AsyncMock()
+        bot.send_document.return_value = AsyncMock(document=Document(file_id="doc_file_id", file_unique_id="u"))
+        await manager.send_file_batch(bot, 1, "document", [(path, media)])
+
+    assert cache.get_many([str(local)]) == {str(local): ("doc_file_id", "document")}
+    cache.close()
@@ -0,0 +1,47 @@
+# tests/test_http_pool.py
+import asyncio
+import json
+import pytest
+from datetime import datetime, timedelta
+from core import http_pool
+
+
+@pytest.mark.asyncio
+async def test_http_pool_shares_connector_and_token():
+    """
+    Бот и клиенты Google используют один пул соединений; истекающий токен обновляется одним обменом.
+    """
+    bot_session = await http_pool.BotSession().create_session()
+    google_session = http_pool.get_google_session()
+    assert bot_session.connector is google_session._session.connector is http_pool.get_connector()
+
+    manager = http_pool.CachedTokenManager(http_pool.get_google_session, creds={})
+    exchanges = []
+
+    async def grant():
+        exchanges.append(1)
+        await asyncio.sleep(0.01)
+        manager._access_token = "token"
+        manager._expires_at = (datetime.utcnow() + timedelta(hours=1)).isoformat()
+
+    manager._get_oauth2_authorization_grant = grant
+    await asyncio.gather(*(manager.refresh() for _ in range(5)))
+    assert len(exchanges) == 1 and manager.refreshes == 1
+    assert not await manager.refresh()  # Токен действителен дольше запаса
+
+    await bot_session.close()
+    await http_pool.close_http_pool()
+
+
+def test_google_clients_cached_per_key_file_and_scopes(tmp_path):
+    """
+    Клиент с другим набором scopes для того же ключа не берётся из кэша: токен выдаётся на scopes.
+    """
+    key_file = tmp_path / "key.json"
+    key_file.write_text(json.dumps({"client_email": "bot@example.iam.gserviceaccount.com"}), encoding="utf-8")
+    sheets = http_pool.get_google_client(str(key_file), ["https://www.googleapis.com/auth/spreadsheets"])
+    drive = http_pool.get_google_client(str(key_file), ["https://www.googleapis.com/auth/drive"])
+
+    assert sheets is not drive
+    assert sheets is http_pool.get_google_client(str(key_file), ["https://www.googleapis.com/auth/spreadsheets"])
+    assert drive.service_account_manager.creds["scopes"] == ["https://www.googleapis.com/auth/drive"]
@@ -0,0 +1,41 @@
+# tests/test_locales.py
+from core.utils.locales import LocaleCatalog, UserLanguageCache
+
+
+def test_user_language_cache_lru_eviction():
+    """
+    Кэш языков вытесняет самые давно использованные записи.
+    """
+    cache = UserLanguageCache(maxsize=2)
+    cache.load({"1": "ru", "2": "uk"})
+    assert cache.complete
+
+    assert cache.get(1) == "ru"  # 1 становится самым свежим
+    cache.set(3, "pl")
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "ru"
+    assert cache.get(3) == "pl"
+    assert not cache.complete
+
+
+def test_locale_catalog_fallback_and_keyboards():
+    """
+    Отсутствующие ключи берутся из запасных языков, клавиатуры создаются один раз.
+    """
+    catalog = LocaleCatalog(
+        {
+            "ru": {"greeting": "Привет, {name}", "wholesale": "Опт", "retail": "Розница",
+                   "stone_processing": "Камень", "related_industry": "Смежная", "monuments": "Памятники",
+                   "other_products": "Другое", "send_phone_button": "Телефон"},
+            "en": {"greeting": "Hi, {name}"},
+        },
+        {"en": ("ru",)},
+    )
+
+    assert catalog.missing["en"] == sorted(catalog.keys - {"greeting"})
+    assert catalog.format("en", "greeting", name="Bob") == "Hi, Bob"
+    assert catalog.text("en", "retail") == "Розница"
+    assert catalog.text("de", "retail") == "Розница"
+    assert catalog.text("en", "unknown_key") == "unknown_key"
+    assert catalog.keyboard("en", "client_type") is catalog.keyboard("en", "client_type")
@@ -0,0 +1,58 @@
+# tests/test_logging_utils.py
+import json
+import logging
+import queue
+import sys
+from unittest.mock import patch
+from core.utils import logging_utils
+from core.utils.logging_utils import BoundedQueueHandler, JsonFormatter, SamplingFilter, parse_sampling, setup_logger
+
+
+def test_logging_pipeline_queue_sampling_and_json():
+    """
+    Записи уходят в ограниченную очередь без ожидания, лишние отбрасываются со счётчиком;
+    выборка INFO действует только на указанные логгеры, JSON-формат содержит исключение.
+    """
+    handler = BoundedQueueHandler(queue.Queue(2))
+    logger = logging.getLogger("test_logging_pipeline")
+    logger.handlers, logger.propagate = [handler], False
+    logger.setLevel(logging.INFO)
+    items = ["a"]
+    logger.info("Заявка %s", items)
+    items.append("b")  # Сообщение подставлено при постановке в очередь
+    logger.info("второе")
+    logger.info("третье")
+    assert handler.dropped == 1
+    assert handler.queue.get_nowait().msg == "Заявка ['a']"
+
+    sampling = SamplingFilter(parse_sampling("core.sheet_quota=3, broken, core.other=1"))
+    assert sampling.sampling == {"core.sheet_quota": 3}
+    record = lambda name, level: logging.LogRecord(name, level, __file__, 1, "msg", None, None)
+    kept = [sampling.filter(record("core.sheet_quota.child", logging.INFO)) for _ in range(6)]
+    assert kept == [True, False, False, True, False, False]
+    assert sampling.filter(record("core.sheet_quota", logging.WARNING))
+    assert sampling.filter(record("handlers.files", logging.INFO))
+    assert sampling.sampled_out == 4
+
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        error = logging.LogRecord("core.x", logging.ERROR, __file__, 7, "Сбой %s", ("записи",), sys.exc_info())
+    entry = json.loads(JsonFormatter().format(error))
+    assert entry["message"] == "Сбой записи" and entry["level"] == "ERROR"
+    assert "ValueError: boom" in entry["exception"]
+
+
+def test_setup_logger_enqueues_each_record_once(caplog):
+    """
+    Запись дочернего логгера попадает в очередь один раз и видна caplog.
+    """
+    setup_logger("test_logging_parent")
+    child = setup_logger("test_logging_parent.child")
+    enqueued = []
+    with caplog.at_level(logging.INFO), \
+            patch.object(logging_utils._queue_handler, "enqueue", side_effect=enqueued.append):
+        child.info("одна запись")
+
+    assert [record.getMessage() for record in enqueued] == ["одна запись"]
+    assert "одна запись" in caplog.text
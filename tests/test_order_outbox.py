@@ -0,0 +1,135 @@
+# tests/test_order_outbox.py
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from core import order_outbox
+
+
+@pytest.mark.asyncio
+async def test_order_outbox_delivers_once_in_order(tmp_path):
+    """
+    Заявка сохраняется в журнал один раз; уведомление уходит только после записи строки,
+    а повтор не дублирует строку, уже дошедшую до таблицы.
+    """
+    outbox = order_outbox.OrderOutbox(str(tmp_path / "bot.sqlite3"))
+    message = {"chat_id": "1", "text": "Новая заявка", "reply_markup": None, "parse_mode": "Markdown"}
+    assert await outbox.add_order("42:2024-01-01 10:00:00", {"sheet": "Розница", "row": ["a"], "client_id": "42", "date": "2024-01-01 10:00:00"}, message)
+    assert not await outbox.add_order("42:2024-01-01 10:00:00", {"sheet": "Розница", "row": ["a"], "client_id": "42", "date": "2024-01-01 10:00:00"}, message)
+    assert await outbox.add_order("43:2024-01-01 10:05:00", {"sheet": "Розница", "row": ["b"], "client_id": "43", "date": "2024-01-01 10:05:00"})
+
+    calls = []
+    sheets_down = True
+
+    async def append(row):
+        if sheets_down:
+            raise OSError("timeout")
+        calls.append(("row", row[0]))
+
+    writer = AsyncMock()
+    writer.append.side_effect = append
+    bot = AsyncMock()
+    bot.send_message.side_effect = lambda *args, **kwargs: calls.append(("message", args[0]))
+    index = AsyncMock()
+    index.find_order.return_value = None
+
+    with patch.object(order_outbox, "_order_outbox", outbox), \
+            patch.object(order_outbox, "get_sheet_writer", return_value=writer), \
+            patch.object(order_outbox, "get_sheet_index", return_value=index):
+        assert await order_outbox.dispatch_pending(bot) == 0  # Ни одна операция не выполнена
+        # Таблица недоступна: строки ждут повтора, уведомление не отправляется раньше строки
+        assert not await outbox.is_done("42:2024-01-01 10:00:00", order_outbox.SHEET_ROW)
+        assert not await outbox.is_done("42:2024-01-01 10:00:00", order_outbox.MANAGER_MESSAGE)
+        bot.send_message.assert_not_called()
+        assert await outbox.due() == []  # Строки отложены, уведомление ждёт строку своей заявки
+
+        sheets_down = False
+        outbox._connection.execute("UPDATE order_outbox SET next_attempt_at = 0")
+        # Первая строка всё-таки дошла до таблицы в прошлый раз
+        index.find_order.side_effect = lambda client_id, date: 7 if client_id == "42" else None
+        assert await order_outbox.dispatch_pending(bot) == 2  # Строки; уведомление — следующим проходом
+        assert await order_outbox.dispatch_pending(bot) == 1
+
+    assert await outbox.counts() == {"pending": 0, "dead": 0}
+    assert calls == [("row", "b"), ("message", "1")]  # Строка "a" не записана повторно
+    index.sync.assert_awaited()
+    outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_order_outbox_dead_letters_failing_row(tmp_path):
+    """
+    Строка, не записанная за OUTBOX_MAX_ATTEMPTS попыток, снимается с очереди и не блокирует следующие,
+    а менеджер получает предупреждение вместо уведомления о заявке.
+    """
+    outbox = order_outbox.OrderOutbox(str(tmp_path / "bot.sqlite3"))
+    message = {"chat_id": "1", "text": "Новая заявка", "reply_markup": None, "parse_mode": None}
+    await outbox.add_order("42:1", {"sheet": "Розница", "row": ["bad"], "client_id": "42", "date": "1"}, message)
+
+    written = []
+
+    async def append(row):
+        if row == ["bad"]:
+            raise ValueError("HTTP 400: Invalid values")
+        written.append(row[0])
+
+    writer = AsyncMock()
+    writer.append.side_effect = append
+    bot = AsyncMock()
+    index = AsyncMock()
+    index.find_order.return_value = None
+
+    with patch.object(order_outbox, "_order_outbox", outbox), \
+            patch.object(order_outbox, "OUTBOX_MAX_ATTEMPTS", 2), \
+            patch.object(order_outbox, "MANAGER_ID", "1"), \
+            patch.object(order_outbox, "get_sheet_writer", return_value=writer), \
+            patch.object(order_outbox, "get_sheet_index", return_value=index):
+        await order_outbox.dispatch_pending(bot)
+        await outbox.add_order("43:2", {"sheet": "Розница", "row": ["good"], "client_id": "43", "date": "2"})
+        await order_outbox.dispatch_pending(bot)
+        assert written == []  # Следующая строка листа ждёт повтора предыдущей
+
+        outbox._connection.execute("UPDATE order_outbox SET next_attempt_at = 0")
+        await order_outbox.dispatch_pending(bot)  # Вторая неудачная попытка: строка 42 «мертва»
+        await order_outbox.dispatch_pending(bot)
+
+    assert written == ["good"]
+    assert await outbox.counts() == {"pending": 0, "dead": 2}  # Строка и уведомление заявки 42
+    bot.send_message.assert_awaited_once()
+    assert "42:1" in bot.send_message.call_args.args[1] and "bad" in bot.send_message.call_args.args[1]
+
+    assert await outbox.retry_dead() == 2
+    assert (await outbox.counts())["pending"] == 2
+    outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_order_dispatcher_sleeps_when_sheets_are_down(tmp_path):
+    """
+    Если таблица недоступна, диспетчер не перечитывает журнал без паузы, даже когда заявок больше пачки.
+    """
+    outbox = order_outbox.OrderOutbox(str(tmp_path / "bot.sqlite3"))
+    message = {"chat_id": "1", "text": "Новая заявка", "reply_markup": None, "parse_mode": None}
+    for number in range(order_outbox.OUTBOX_BATCH_SIZE + 50):
+        payload = {"sheet": "Розница", "row": [str(number)], "client_id": str(number), "date": "1"}
+        await outbox.add_order(f"{number}:1", payload, message)
+
+    writer = AsyncMock()
+    writer.append.side_effect = OSError("timeout")
+    bot = AsyncMock()
+    due = AsyncMock(wraps=outbox.due)
+
+    with patch.object(order_outbox, "_order_outbox", outbox), \
+            patch.object(outbox, "due", due), \
+            patch.object(order_outbox, "_wakeup", asyncio.Event()), \
+            patch.object(order_outbox, "OUTBOX_POLL_INTERVAL", 60), \
+            patch.object(order_outbox, "get_sheet_writer", return_value=writer), \
+            patch.object(order_outbox, "get_sheet_index", return_value=AsyncMock()):
+        task = asyncio.create_task(order_outbox._dispatch_loop(bot))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    assert due.await_count == 1  # Один проход без продвижения, затем ожидание
+    assert writer.append.call_count == order_outbox.OUTBOX_BATCH_SIZE  # Только строки, без уведомлений
+    bot.send_message.assert_not_called()
+    outbox.close()
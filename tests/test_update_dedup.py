@@ -0,0 +1,45 @@
+# tests/test_update_dedup.py
+import pytest
+from core.update_dedup import UpdateDeduplicator
+
+
+def test_update_deduplicator_sliding_window(tmp_path):
+    """
+    Повторные update_id отсеиваются в пределах окна и после перезапуска.
+    """
+    db_path = str(tmp_path / "bot.sqlite3")
+    dedup = UpdateDeduplicator(window=3, db_path=db_path)
+    for update_id in (1, 2, 3):
+        assert not dedup.is_duplicate(update_id)
+        dedup.remember(update_id)
+    assert dedup.is_duplicate(2)
+
+    dedup.remember(4)  # Вытесняет 1 из окна
+    assert not dedup.is_duplicate(1)
+    dedup.close()
+
+    restarted = UpdateDeduplicator(window=3, db_path=db_path)
+    assert restarted.is_duplicate(4)
+    assert restarted.is_duplicate(2)
+    assert not restarted.is_duplicate(1)
+    assert restarted.duplicates == 2
+    restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_update_deduplicator_batches_writes(tmp_path):
+    """
+    После start() принятые update_id записываются в базу пачкой в фоне, а stop() дописывает остаток.
+    """
+    db_path = str(tmp_path / "bot.sqlite3")
+    dedup = UpdateDeduplicator(window=10, db_path=db_path, flush_interval=60)
+    await dedup.start()
+    for update_id in (1, 2, 3):
+        dedup.remember(update_id)
+    assert dedup.is_duplicate(3)
+    assert dedup._connection.execute("SELECT COUNT(*) FROM seen_updates").fetchone()[0] == 0
+    await dedup.stop()
+
+    restarted = UpdateDeduplicator(window=10, db_path=db_path)
+    assert all(restarted.is_duplicate(update_id) for update_id in (1, 2, 3))
+    restarted.close()
@@ -0,0 +1,29 @@
+# tests/test_update_queue.py
+import asyncio
+import pytest
+from core.update_queue import UpdateWorkerPool
+
+
+@pytest.mark.asyncio
+async def test_update_worker_pool_keeps_chat_order():
+    """
+    Обновления одного чата обрабатываются по порядку, переполненная очередь отклоняет новые.
+    """
+    processed = []
+
+    async def handler(update):
+        await asyncio.sleep(0.01 if update["update_id"] == 1 else 0)
+        processed.append(update["update_id"])
+
+    pool = UpdateWorkerPool(handler, workers=4, max_queued=3)
+    pool.start()
+
+    chat_a = {"message": {"chat": {"id": 1}}}
+    chat_b = {"message": {"chat": {"id": 2}}}
+    assert pool.submit({"update_id": 1, **chat_a})
+    assert pool.submit({"update_id": 2, **chat_a})
+    assert pool.submit({"update_id": 3, **chat_b})
+    assert not pool.submit({"update_id": 4, **chat_b})
+
+    await pool.stop()
+    assert processed == [3, 1, 2]
@@ -0,0 +1,26 @@
+# tests/test_user_store.py
+import json
+import pytest
+from unittest.mock import patch
+from core.utils.user_store import SQLiteUserProfileStore
+
+
+@pytest.mark.asyncio
+async def test_user_store_coalesces_writes(tmp_path):
+    """
+    Повторные записи одного пользователя объединяются и сбрасываются одной транзакцией.
+    """
+    legacy_file = tmp_path / "user_languages.json"
+    legacy_file.write_text(json.dumps({"1": "uk"}), encoding="utf-8")
+
+    store = SQLiteUserProfileStore(db_path=str(tmp_path / "bot.sqlite3"), legacy_file=str(legacy_file), flush_interval=0)
+    assert store.get_language(1) == "uk"  # Миграция из JSON
+
+    await store.start()
+    with patch.object(store, "_write_languages", wraps=store._write_languages) as mock_write:
+        store.set_language(2, "ru")
+        store.set_language(2, "pl")
+        assert store.get_language(2) == "pl"
+        await store.stop()
+
+    mock_write.assert_called_once_with({"2": "pl"})
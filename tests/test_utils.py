@@ -1,51 +1,95 @@
 # tests/test_utils.py
+import asyncio
 import os
+import time
 import pytest
-from unittest.mock import AsyncMock, patch
-from core.utils.file_utils import save_file
+from unittest.mock import AsyncMock
+from core.utils import file_utils
+from core.utils.file_utils import (
+    read_order_file_names, save_file, start_file_download, wait_for_downloads, write_order_manifest
+)
 from aiogram.types import Message, Document, PhotoSize, User
+from core.utils.telegram_file_cache import TelegramFileCache
+
+
+@pytest.fixture(autouse=True)
+def telegram_file_cache(tmp_path, monkeypatch):
+    """Кэш file_id во временной базе: тесты не пишут в data/bot.sqlite3 рабочего дерева."""
+    cache = TelegramFileCache(str(tmp_path / "telegram_files.sqlite3"))
+    monkeypatch.setattr(file_utils, "get_telegram_file_cache", lambda: cache)
+    yield cache
+    cache.close()
+
+
+def make_download_bot():
+    """Бот, который «скачивает» файл, записывая его путь в Telegram."""
+    bot = AsyncMock()
+    bot.get_file.side_effect = lambda file_id: AsyncMock(file_path=f"path/to/{file_id}")
+
+    async def download_file(file_path, destination):
+        with open(destination, "w") as f:
+            f.write(file_path)
+
+    bot.download_file.side_effect = download_file
+    return bot
 
 
 @pytest.mark.asyncio
-@patch("core.utils.file_utils.os.makedirs")
-@patch("core.utils.file_utils.Bot.get_file")
-@patch("core.utils.file_utils.Bot.download_file")
-async def test_save_file_document(mock_download_file, mock_get_file, mock_makedirs):
+async def test_save_file_document(tmp_path):
     message = AsyncMock(spec=Message)
     message.document = Document(file_id="doc_id", file_unique_id="unique_doc_id", file_name="test_document.txt")
     message.content_type = "document"
     message.photo = None  # Добавляем, чтобы избежать AttributeError
     message.from_user = User(id=12345, is_bot=False, first_name="TestUser")
 
-    bot = AsyncMock()
-    mock_get_file.return_value.file_path = "path/to/document.txt"
+    bot = make_download_bot()
 
-    result = await save_file(message, bot)
+    result = await save_file(message, bot, upload_dir=str(tmp_path))
 
-    expected_path = os.path.join("uploads", "12345", "test_document.txt")
+    expected_path = os.path.join(str(tmp_path), "blobs", "unique_doc_id.txt")
     assert result == expected_path
+    assert os.listdir(os.path.dirname(expected_path)) == ["unique_doc_id.txt"]  # Временный файл переименован
 
 
 @pytest.mark.asyncio
-@patch("core.utils.file_utils.os.makedirs")
-@patch("core.utils.file_utils.Bot.get_file")
-@patch("core.utils.file_utils.Bot.download_file")
-async def test_save_file_photo(mock_download_file, mock_get_file, mock_makedirs):
+async def test_save_file_photo(tmp_path):
     message = AsyncMock(spec=Message)
     message.photo = [PhotoSize(file_id="photo_id", file_unique_id="unique_photo_id", width=800, height=600)]
     message.content_type = "photo"
     message.from_user = User(id=12345, is_bot=False, first_name="TestUser")
 
-    bot = AsyncMock()
-    mock_get_file.return_value.file_path = "path/to/photo.jpg"
-    mock_download_file.return_value = None
+    bot = make_download_bot()
 
-    result = await save_file(message, bot)
+    result = await save_file(message, bot, upload_dir=str(tmp_path))
 
-    expected_path = os.path.join("uploads", "12345", "photo_photo_id.jpg")
+    expected_path = os.path.join(str(tmp_path), "blobs", "unique_photo_id.jpg")
     assert result == expected_path
 
 
+@pytest.mark.asyncio
+async def test_save_file_deduplicates_by_unique_id(tmp_path):
+    """
+    Повторно отправленный файл не скачивается заново, манифест хранит исходные имена.
+    """
+    def make_message(file_id, file_name):
+        message = AsyncMock(spec=Message)
+        message.photo = None
+        message.document = Document(file_id=file_id, file_unique_id="same_content", file_name=file_name)
+        message.from_user = User(id=12345, is_bot=False, first_name="TestUser")
+        return message
+
+    bot = make_download_bot()
+    first = await save_file(make_message("file_1", "plan.pdf"), bot, upload_dir=str(tmp_path))
+    second = await save_file(make_message("file_2", "plan (1).pdf"), bot, upload_dir=str(tmp_path))
+
+    assert first == second
+    bot.download_file.assert_called_once()
+
+    write_order_manifest(12345, "2024-01-31 12:00:00", [{"path": first, "name": "plan.pdf"}], upload_dir=str(tmp_path))
+    assert read_order_file_names(12345, "2024-01-31 12:00:00", upload_dir=str(tmp_path)) == {first: "plan.pdf"}
+    assert read_order_file_names(12345, "2024-02-01 00:00:00", upload_dir=str(tmp_path)) == {}
+
+
 @pytest.mark.asyncio
 async def test_save_file_unsupported():
     """
@@ -60,3 +104,81 @@ async def test_save_file_unsupported():
     with pytest.raises(ValueError, match="Unsupported content type: text"):
         await save_file(message, bot)
 
+
+@pytest.mark.asyncio
+async def test_wait_for_downloads_reports_failed_files(tmp_path):
+    """
+    Заявка дожидается фоновых загрузок и узнаёт, какие файлы не сохранились.
+    """
+    async def download_file(file_path, destination):
+        await asyncio.sleep(0.01)
+        if "bad" in file_path:
+            raise RuntimeError("download failed")
+        with open(destination, "w") as f:
+            f.write(file_path)
+
+    bot = AsyncMock()
+    bot.get_file.side_effect = lambda file_id: AsyncMock(file_path=file_id)
+    bot.download_file.side_effect = download_file
+
+    def make_message(file_id):
+        message = AsyncMock(spec=Message)
+        message.photo = None
+        message.document = Document(file_id=file_id, file_unique_id=file_id, file_name=f"{file_id}.txt")
+        message.from_user = User(id=777, is_bot=False, first_name="TestUser")
+        return message
+
+    good_path, good_name, _ = start_file_download(make_message("good"), bot, upload_dir=str(tmp_path))
+    bad_path, _, _ = start_file_download(make_message("bad"), bot, upload_dir=str(tmp_path))
+
+    results = await wait_for_downloads(777)
+    assert results == {good_path: good_path, bad_path: None}
+    assert good_path.endswith("good.txt") and good_name == "good.txt"
+    assert await wait_for_downloads(777) == {}
+
+
+@pytest.mark.asyncio
+async def test_finished_downloads_leave_tracking(tmp_path):
+    """
+    Завершённые загрузки не остаются в отслеживании; итог неудачной хранится до заявки, но не дольше TTL.
+    """
+    bot = AsyncMock()
+    bot.get_file.side_effect = lambda file_id: AsyncMock(file_path=file_id)
+    bot.download_file.side_effect = RuntimeError("download failed")
+
+    message = AsyncMock(spec=Message)
+    message.photo = None
+    message.document = Document(file_id="lost", file_unique_id="lost", file_name="lost.txt")
+    message.from_user = User(id=778, is_bot=False, first_name="TestUser")
+
+    path, _, task = start_file_download(message, bot, upload_dir=str(tmp_path))
+    await asyncio.gather(task, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert 778 not in file_utils._pending_downloads
+    assert await wait_for_downloads(778) == {path: None}
+
+    path, _, task = start_file_download(message, bot, upload_dir=str(tmp_path))
+    await asyncio.gather(task, return_exceptions=True)
+    await asyncio.sleep(0)
+    file_utils._expire_download_results(time.monotonic() + file_utils.DOWNLOAD_RESULT_TTL + 1)
+    assert await wait_for_downloads(778) == {}
+
+
+@pytest.mark.asyncio
+async def test_telegram_file_cache_writes_in_background(tmp_path):
+    """
+    После start() file_id записываются в базу в фоне, но сразу видны через get_many.
+    """
+    cache = TelegramFileCache(str(tmp_path / "bot.sqlite3"), flush_interval=60)
+    await cache.start()
+    cache.remember("uploads/blobs/a.jpg", "file_a", "photo")
+    assert cache.get_many(["uploads/blobs/a.jpg"]) == {"uploads/blobs/a.jpg": ("file_a", "photo")}
+    assert cache._connection.execute("SELECT COUNT(*) FROM telegram_files").fetchone()[0] == 0
+    cache.forget("uploads/blobs/a.jpg")
+    assert cache.get_many(["uploads/blobs/a.jpg"]) == {}
+    await cache.stop()
+
+    reopened = TelegramFileCache(str(tmp_path / "bot.sqlite3"))
+    assert reopened.get_many(["uploads/blobs/a.jpg"]) == {}
+    reopened.close()